@@ -0,0 +1,160 @@
+"""
+Scan archive (cold tier)
+Completed scans are compacted out of Redis into a compressed SQLite archive
+so reports outlive the Redis TTL. zstd is used when the zstandard package
+is installed, zlib otherwise; each row records its codec. Old scans are
+pruned by age and/or count whenever a scan is archived.
+"""
+import os
+import json
+import zlib
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional — fall back to zlib
+    zstandard = None
+
+SCAN_ARCHIVE_DB = os.getenv("SCAN_ARCHIVE_DB", "/app/archive/scans.db")
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "6"))
+# 0 disables the limit
+SCAN_ARCHIVE_RETENTION_DAYS = int(os.getenv("SCAN_ARCHIVE_RETENTION_DAYS", "90"))
+SCAN_ARCHIVE_MAX_SCANS = int(os.getenv("SCAN_ARCHIVE_MAX_SCANS", "0"))
+
+
+def compress(data: bytes, level: int = ARCHIVE_COMPRESSION_LEVEL) -> tuple:
+    """(codec, blob) using the best available codec"""
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=level).compress(data)
+    return "zlib", zlib.compress(data, level)
+
+
+def decompress(codec: str, blob: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed data but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if codec == "zlib":
+        return zlib.decompress(blob)
+    if codec == "none":
+        return blob
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+class ScanArchive:
+    """One row per scan: searchable meta columns plus a compressed JSON record.
+
+    The record holds meta, logs, findings, service states, the InsightMap
+    analysis and the raw tool results.
+    """
+
+    def __init__(self, path: str, retention_days: int = SCAN_ARCHIVE_RETENTION_DAYS,
+                 max_scans: int = SCAN_ARCHIVE_MAX_SCANS):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_scans = max_scans
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scans ("
+            " scan_id TEXT PRIMARY KEY,"
+            " user_id TEXT,"
+            " target TEXT,"
+            " category TEXT,"
+            " status TEXT,"
+            " started_at TEXT,"
+            " completed_at TEXT,"
+            " codec TEXT NOT NULL,"
+            " record BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS scans_started ON scans (started_at)")
+
+    def put(self, scan_id: str, record: Dict[str, Any]):
+        meta = record.get("meta") or {}
+        codec, blob = compress(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scans"
+                " (scan_id, user_id, target, category, status, started_at, completed_at, codec, record)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (scan_id, meta.get("user_id"), meta.get("target"), meta.get("category"),
+                 meta.get("status"), meta.get("started_at"), meta.get("completed_at"), codec, blob),
+            )
+
+    def get(self, scan_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT codec, record FROM scans WHERE scan_id = ?", (scan_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(decompress(*row))
+
+    def get_meta_many(self, scan_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Listing columns for each archived scan among `scan_ids`"""
+        scan_ids = list(scan_ids)
+        if not scan_ids:
+            return {}
+        placeholders = ",".join("?" * len(scan_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT scan_id, target, category, status, started_at FROM scans"
+                f" WHERE scan_id IN ({placeholders})", scan_ids,
+            ).fetchall()
+        return {
+            scan_id: {"target": target, "category": category, "status": status, "started_at": started_at}
+            for scan_id, target, category, status, started_at in rows
+        }
+
+    def prune(self, now: Optional[datetime] = None) -> List[str]:
+        """Drop scans older than retention_days, then all but the newest
+        max_scans; returns the removed scan ids"""
+        clauses, params = [], []
+        if self.retention_days > 0:
+            cutoff = (now or datetime.now()) - timedelta(days=self.retention_days)
+            clauses.append("started_at < ?")
+            params.append(cutoff.isoformat())
+        if self.max_scans > 0:
+            clauses.append("scan_id NOT IN (SELECT scan_id FROM scans ORDER BY started_at DESC LIMIT ?)")
+            params.append(self.max_scans)
+        if not clauses:
+            return []
+        where = " OR ".join(clauses)
+        with self._lock:
+            pruned = [row[0] for row in self._conn.execute(f"SELECT scan_id FROM scans WHERE {where}", params)]
+            if pruned:
+                self._conn.execute(f"DELETE FROM scans WHERE {where}", params)
+        return pruned
+
+    def __contains__(self, scan_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM scans WHERE scan_id = ?", (scan_id,)
+            ).fetchone() is not None
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive() -> Optional[ScanArchive]:
+    """Process-wide archive, or None if SCAN_ARCHIVE_DB can't be opened"""
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            try:
+                _archive = ScanArchive(SCAN_ARCHIVE_DB)
+            except (OSError, sqlite3.Error) as e:
+                logger.error("Scan archive unavailable at %s: %s", SCAN_ARCHIVE_DB, e)
+                return None
+        return _archive
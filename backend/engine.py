@@ -8,13 +8,20 @@ import json
 import asyncio
 import time
 import smtplib
+from collections import deque
+from contextlib import suppress
 import ssl
 import httpx
+import http_pool
+import parsers
+import archive
+import result_store
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 import logging
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 
 logger = logging.getLogger(__name__)
 
@@ -43,18 +50,84 @@ SERVICE_PORTS = {
     "sslyze":    8013,
 }
 
-# Services per scan category
+# Services per scan category, declared as a dependency graph:
+#   tool -> tools that must finish before it starts
+# Tools without dependencies start immediately.
+# The graph has no nmap -> web/TLS edges on purpose: those tools use nmap's
+# output without waiting for it, which is declared in ENDPOINT_SOURCE below.
 PROFILE_SERVICES = {
-    "white": ["nmap", "testssl", "dirsearch", "nikto", "whatweb",
-              "arjun", "dalfox", "wafw00f", "dnsrecon", "nuclei"],
-    "gray":  ["nmap", "wpscan", "zap", "sslyze"],
-    "black": ["nmap", "nikto", "nuclei"],
+    "white": {
+        "nmap":      [],
+        "testssl":   [],
+        "dirsearch": [],
+        "nikto":     [],
+        "whatweb":   [],
+        "arjun":     [],
+        "dalfox":    [],
+        "wafw00f":   [],
+        "dnsrecon":  [],
+        "nuclei":    [],
+    },
+    "gray": {
+        "nmap":   [],
+        "wpscan": [],
+        "zap":    [],
+        "sslyze": [],
+    },
+    "black": {
+        "nmap":   [],
+        "nikto":  [],
+        "nuclei": [],
+    },
 }
 
+# Start order among ready tools (lower first): long-running tools start
+# early so they don't end up on the critical path.
+SERVICE_PRIORITY = {
+    "nmap": 0, "nuclei": 1, "nikto": 2, "dalfox": 3, "zap": 4, "wpscan": 5,
+    "testssl": 6, "dirsearch": 7, "sslyze": 8, "arjun": 9, "dnsrecon": 10,
+    "whatweb": 11, "wafw00f": 12,
+}
+MAX_PARALLEL_TOOLS = max(1, int(os.getenv("MAX_PARALLEL_TOOLS", "8")))   # per scan
+
+# Network layer tools get the IP and the full resolved address set
+NETWORK_SERVICES = {"nmap"}
+# Web tools take a URL, TLS tools a host[:port]; both fan out over the
+# endpoints nmap discovers, at most ENDPOINT_CONCURRENCY at a time per tool
+WEB_SERVICES = {"nuclei", "dirsearch", "nikto", "whatweb", "arjun", "dalfox", "wafw00f", "wpscan", "zap"}
+TLS_SERVICES = {"testssl", "sslyze"}
+# tool -> the tool whose discovered endpoints it follows. Unlike a graph
+# dependency this doesn't delay the start: when both are in a scan, the tool
+# starts on the target itself and run_all_services keeps it informed of the
+# endpoints its source finds (live ports first) until the source finishes.
+ENDPOINT_SOURCE = {svc: "nmap" for svc in WEB_SERVICES | TLS_SERVICES}
+ENDPOINT_CONCURRENCY = max(1, int(os.getenv("ENDPOINT_CONCURRENCY", "2")))
+MAX_ENDPOINTS_PER_TOOL = max(1, int(os.getenv("MAX_ENDPOINTS_PER_TOOL", "8")))
+# Scheme of well-known web ports nmap reports without a service name
+WEB_PORTS = {"80": "http", "443": "https", "8000": "http", "8008": "http",
+             "8080": "http", "8443": "https", "8888": "http"}
+
 # Slow services get longer poll timeout
 SLOW_SERVICES = {"nikto", "testssl", "nuclei", "dalfox", "zap", "wpscan"}
 SERVICE_TIMEOUT = 600   # max seconds to wait per service
-POLL_INTERVAL   = 3     # seconds between status polls
+DEFAULT_SERVICE_TIMEOUT = 300
+# Tools that bound their own runtime report it from POST /scan (nmap: its
+# perf profile's budget); the engine then waits that long plus this grace
+SERVICE_TIMEOUT_GRACE = int(os.getenv("SERVICE_TIMEOUT_GRACE", "120"))
+# Wall-clock budget of a whole scan, kept under the worker's 1h job_timeout:
+# endpoint runs that couldn't finish within it are not started
+SCAN_TIME_BUDGET = int(os.getenv("SCAN_TIME_BUDGET", "3300"))
+POLL_INTERVAL   = 3     # seconds between status polls (no event channel)
+# How often the open ports of a running nmap scan are collected, so the
+# endpoints it has found so far are known before it finishes
+LIVE_PORTS_POLL_INTERVAL = int(os.getenv("LIVE_PORTS_POLL_INTERVAL", "10"))
+EVENT_FALLBACK_POLL_INTERVAL = int(os.getenv("EVENT_FALLBACK_POLL_INTERVAL", "30"))
+
+SCAN_TTL = 3600   # seconds scan keys live in Redis
+REDIS_FLUSH_INTERVAL = float(os.getenv("REDIS_FLUSH_INTERVAL", "0.5"))
+# Per-scan streams: log lines, and service/status updates for the SSE endpoint
+LOG_STREAM_MAXLEN = int(os.getenv("LOG_STREAM_MAXLEN", "10000"))
+UPDATE_STREAM_MAXLEN = 1000
 
 INSIGHTMAP_URL = os.getenv("INSIGHTMAP_URL", "").rstrip("/")
 INSIGHTMAP_API_KEY = os.getenv("INSIGHTMAP_API_KEY", "")
@@ -65,13 +138,190 @@ def log_scan(uid: str, message: str):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_entry = f"[{timestamp}] {message}"
     try:
-        redis_client.rpush(f"scan:{uid}:logs", log_entry)
-        redis_client.expire(f"scan:{uid}:logs", 3600)
+        _scan_write(uid, "xadd", f"scan:{uid}:logstream", {"line": log_entry},
+                    maxlen=LOG_STREAM_MAXLEN, approximate=True)
     except Exception as e:
         print(f"Redis Log Error: {e}")
     print(f"[{uid}] {message}")
 
 
+# Last written state per scan and service (see set_service_state)
+_service_states = {}
+# Open TCP services nmap reported per running scan: [(port, name, tunnel)]
+_discovered_services = {}
+# Scans whose nmap run is still going (see _Discovery)
+_discoveries = {}
+# time.time() by which each running scan should be done
+_scan_deadlines = {}
+
+
+class _Discovery:
+    """Lets fan-out tools wait for the endpoints of a scan's running nmap.
+
+    `release(service)` is called once a tool's own targets are done and it
+    only waits here, so the scheduler can give its slot to another tool.
+    """
+
+    def __init__(self, release=None):
+        self.pending = True
+        self.changed = asyncio.Event()
+        self.release = release or (lambda service: None)
+
+    def notify(self, finished: bool = False):
+        if finished:
+            self.pending = False
+        # Waiters hold the old event; a fresh one catches the next change
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+def set_service_state(uid: str, service: str, status: str, **fields):
+    """Record a service transition in scan:{uid}:services.
+
+    One JSON field per service holding status (pending/running/completed/
+    failed), started_at, duration, error, result_size and findings, so the
+    status endpoint reads a single hash instead of parsing log lines.
+    """
+    state = _service_states.setdefault(uid, {}).setdefault(service, {})
+    state.update(fields, status=status)
+    try:
+        _scan_write(uid, "hset", f"scan:{uid}:services", service, json.dumps(state))
+    except Exception as e:
+        print(f"Redis State Error: {e}")
+    publish_update(uid, "service", service=service, **state)
+
+
+def publish_update(uid: str, kind: str, **data):
+    """Append a service/status update to scan:{uid}:updates (read by SSE clients)"""
+    try:
+        _scan_write(uid, "xadd", f"scan:{uid}:updates", {"type": kind, "data": json.dumps(data)},
+                    maxlen=UPDATE_STREAM_MAXLEN, approximate=True)
+    except Exception as e:
+        print(f"Redis Update Error: {e}")
+
+
+class ScanWriteBuffer:
+    """Write-behind buffer for one running scan's Redis writes.
+
+    Log lines, results and status updates are queued and flushed every
+    REDIS_FLUSH_INTERVAL seconds in a single pipeline on the async client,
+    so Redis latency never blocks the event loop. A key's TTL is refreshed
+    in each flush that writes it, and every key the scan has written is
+    refreshed every TTL/4 seconds and on close, so nothing expires while a
+    long scan is still running. Safe to feed from worker threads (deque
+    appends are atomic).
+    """
+
+    def __init__(self, uid: str, ttl: int = SCAN_TTL):
+        self.uid = uid
+        self.ttl = ttl
+        self._ops = deque()
+        self._expiring = set()
+        self._refreshed_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def add(self, command: str, key: str, *args, expire: bool = True, **kwargs):
+        self._ops.append((command, key, args, kwargs, expire))
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(REDIS_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self, refresh_all: bool = False):
+        """Send everything queued so far in one round trip"""
+        async with self._lock:
+            ops = []
+            while self._ops:
+                ops.append(self._ops.popleft())
+            now = time.monotonic()
+            refresh_all = refresh_all or now - self._refreshed_at >= self.ttl / 4
+            if not ops and not (refresh_all and self._expiring):
+                return
+            # Ordered so the EXPIREs follow the writes that create the keys
+            ttl_keys = dict.fromkeys(self._expiring) if refresh_all else {}
+            pipe = _get_async_redis().pipeline(transaction=False)
+            for command, key, args, kwargs, expire in ops:
+                getattr(pipe, command)(key, *args, **kwargs)
+                if expire:
+                    ttl_keys[key] = None
+            for key in ttl_keys:
+                pipe.expire(key, self.ttl)
+            try:
+                await pipe.execute()
+                self._expiring.update(ttl_keys)
+                if refresh_all:
+                    self._refreshed_at = now
+            except Exception as e:
+                print(f"Redis Flush Error ({self.uid}, {len(ops)} ops): {e}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+        await self.flush(refresh_all=True)
+
+
+# Buffers of scans running in this process
+_scan_writers = {}
+
+
+def _scan_write(uid: str, command: str, key: str, *args, expire: bool = True, **kwargs):
+    """Queue a write on the scan's buffer, or write directly if none is active"""
+    writer = _scan_writers.get(uid)
+    if writer is not None:
+        writer.add(command, key, *args, expire=expire, **kwargs)
+        return
+    getattr(redis_client, command)(key, *args, **kwargs)
+    if expire:
+        redis_client.expire(key, SCAN_TTL)
+
+
+# Clients bound to the running event loop, shared by every scan on it.
+# The RQ path calls ``asyncio.run`` per job, so clients from a previous
+# (now closed) loop are dropped and rebuilt.
+_loop_clients = {}
+
+
+def _loop_client(name: str, factory):
+    loop = asyncio.get_running_loop()
+    if _loop_clients.get("loop") is not loop:
+        _loop_clients.clear()
+        _loop_clients["loop"] = loop
+    if name not in _loop_clients:
+        _loop_clients[name] = factory()
+    return _loop_clients[name]
+
+
+def _get_async_redis() -> AsyncRedis:
+    """Async Redis client shared by all scans on this event loop"""
+    def factory():
+        if REDIS_URL:
+            return AsyncRedis.from_url(REDIS_URL, decode_responses=True)
+        return AsyncRedis(host=REDIS_HOST, port=6379, db=0, decode_responses=True)
+    return _loop_client("redis", factory)
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Pooled HTTP client for engine -> tool service calls"""
+    return http_pool.async_client("tool-services")
+
+
+async def close_loop_clients():
+    """Close the shared clients of the running loop (end of an RQ job)"""
+    await http_pool.registry.aclose()
+    if _loop_clients.get("loop") is not asyncio.get_running_loop():
+        return
+    redis = _loop_clients.pop("redis", None)
+    if redis is not None:
+        await redis.aclose()
+
+
 def _svc_url(service: str) -> str:
     """Build base URL for a tool microservice (docker compose network)"""
     # Docker Compose services are reachable by their service name
@@ -79,215 +329,670 @@ def _svc_url(service: str) -> str:
     return f"http://{svc_name}:8000"
 
 
-import socket
 import re
+import ipaddress
+import resolver
 
 def is_ip(target: str) -> bool:
     """Check if target is an IPv4 or IPv6 address"""
     try:
-        socket.inet_aton(target)
+        ipaddress.ip_address(target.strip("[]"))
         return True
-    except socket.error:
-        return ":" in target # Basic IPv6 check
+    except ValueError:
+        return False
 
-def resolve_target(target: str) -> dict:
-    """Analyze target and resolve DNS if needed"""
+def _split_target(target: str) -> tuple:
+    """Split a target (host, host:port, URL, [v6]:port) into protocol, host, port"""
+    protocol_match = re.match(r'^(https?://)', target)
+    protocol = protocol_match.group(1) if protocol_match else "http://"
+
+    # Remove http/https and paths for analysis
+    netloc = re.sub(r'^https?://', '', target).split('/')[0]
+    host, port = netloc, None
+    bracketed = re.match(r'^\[([^\]]+)\](?::(\d+))?$', netloc)
+    if bracketed:
+        host, port = bracketed.group(1), bracketed.group(2)
+    elif netloc.count(":") == 1:
+        # host:port — bare IPv6 addresses have more than one colon
+        host, _, port = netloc.partition(":")
+    return protocol, host, port or None
+
+async def resolve_target_async(target: str, cache=None) -> dict:
+    """Analyze target and resolve DNS (A/AAAA/PTR in parallel, cached in `cache`)"""
+    protocol, host, port = _split_target(target)
     info = {
         "original": target,
         "ip": None,
+        "ips": [],
+        "ipv4": [],
+        "ipv6": [],
         "fqdn": None,
+        "port": port,
         "url": None,
         "type": "unknown"
     }
-    
-    # Detect protocol if present
-    protocol_match = re.match(r'^(https?://)', target)
-    protocol = protocol_match.group(1) if protocol_match else "http://"
-    
-    # Remove http/https and paths for analysis
-    clean_target = re.sub(r'^https?://', '', target).split('/')[0]
-    
-    if is_ip(clean_target):
-        info["ip"] = clean_target
+
+    if is_ip(host):
+        addr = ipaddress.ip_address(host)
+        info["ip"] = str(addr)
         info["type"] = "ip"
+        info["ipv4" if addr.version == 4 else "ipv6"] = [str(addr)]
         # Try reverse DNS
-        try:
-            info["fqdn"] = socket.gethostbyaddr(clean_target)[0]
-        except:
-            info["fqdn"] = clean_target
+        info["fqdn"] = await resolver.reverse_lookup(str(addr), cache) or str(addr)
     else:
-        info["fqdn"] = clean_target
+        info["fqdn"] = host
         info["type"] = "fqdn"
-        # Resolve to IP
-        try:
-            info["ip"] = socket.gethostbyname(clean_target)
-        except:
-            pass
-            
-    # Prepare URL with preserved or default protocol
-    info["url"] = f"{protocol}{info['fqdn']}"
+        addresses = await resolver.resolve_host(host, cache)
+        info["ipv4"], info["ipv6"] = addresses["ipv4"], addresses["ipv6"]
+        info["ip"] = (info["ipv4"] or info["ipv6"] or [None])[0]
+    info["ips"] = info["ipv4"] + info["ipv6"]
+
+    # Prepare URL with preserved or default protocol (and explicit port)
+    url_host = f"[{info['fqdn']}]" if ":" in info["fqdn"] else info["fqdn"]
+    info["url"] = f"{protocol}{url_host}" + (f":{port}" if port else "")
     return info
 
+def resolve_target(target: str) -> dict:
+    """Blocking variant of resolve_target_async for scripts (no cache)"""
+    return asyncio.run(resolve_target_async(target))
+
+def _web_url(scheme: str, host: str, port=None) -> str:
+    """URL of a web endpoint, without the scheme's default port"""
+    default = "443" if scheme == "https" else "80"
+    return f"{scheme}://{host}" + (f":{port}" if port and str(port) != default else "")
+
+
+def _endpoint_scheme(port: str, name: str, tunnel: str):
+    """URL scheme if nmap's service on `port` looks like a web server, else None"""
+    name = (name or "").lower()
+    if name.startswith("http"):
+        return "https" if tunnel == "ssl" or name.startswith("https") else "http"
+    if name in ("", "unknown"):
+        return WEB_PORTS.get(port)
+    return None
+
+
+def _service_targets(service: str, target_info: dict, uid: str) -> list:
+    """Targets to run `service` against, deduplicated, default target first"""
+    # Network layer tools prefer IP
+    if service in NETWORK_SERVICES:
+        return [target_info["ip"] or target_info["fqdn"]]
+    # DNS tools prefer FQDN/Host
+    if service == "dnsrecon":
+        return [target_info["fqdn"]]
+    if service not in WEB_SERVICES and service not in TLS_SERVICES:
+        return [target_info["original"]]
+
+    host = f"[{target_info['fqdn']}]" if ":" in target_info["fqdn"] else target_info["fqdn"]
+    discovered = _discovered_services.get(uid, [])
+    if service in TLS_SERVICES:
+        # SSL tools prefer FQDN/Host; other TLS ports as host:port
+        targets = [target_info["fqdn"]]
+        for port, name, tunnel in discovered:
+            if _endpoint_scheme(port, name, tunnel) == "https" or tunnel == "ssl":
+                targets.append(target_info["fqdn"] if port == "443" else f"{host}:{port}")
+    else:
+        # Web tools prefer URL
+        protocol, _, port = _split_target(target_info["url"])
+        targets = [_web_url(protocol[:-3], host, port)]
+        for port, name, tunnel in discovered:
+            scheme = _endpoint_scheme(port, name, tunnel)
+            if scheme:
+                targets.append(_web_url(scheme, host, port))
+    return list(dict.fromkeys(targets))[:MAX_ENDPOINTS_PER_TOOL]
+
+
+def _record_discovered_services(uid: str, content: str, merge: bool = False):
+    """Remember the open TCP services from nmap's /results payload.
+
+    With `merge` (live ports of a running scan) they are added to the ones
+    already known; the final result replaces them.
+    """
+    try:
+        findings = json.loads(content).get("findings") or []
+    except (ValueError, AttributeError):
+        return
+    services = {svc[0]: svc for svc in _discovered_services.get(uid, [])} if merge else {}
+    for finding in findings:
+        details = finding.get("details") or {}
+        if details.get("port") and details.get("protocol", "tcp") == "tcp":
+            port = str(details["port"])
+            # Service detection beats the live "unknown" entry for the same port
+            if port not in services or services[port][1] in ("", "unknown"):
+                services[port] = (port, details.get("service", ""), details.get("tunnel", ""))
+    _discovered_services[uid] = sorted(services.values(), key=lambda svc: int(svc[0]))
+    if uid in _discoveries:
+        _discoveries[uid].notify()
+
+
 async def call_service(service: str, target_info: dict, uid: str, category: str) -> tuple:
-    """Call a tool microservice with the appropriate target format"""
-    url = _svc_url(service)
-    timeout = SERVICE_TIMEOUT if service in SLOW_SERVICES else 300
+    """Call a tool microservice with the appropriate target format.
+
+    Web and TLS tools start on the default target right away. While the
+    scan's nmap is still running they wait for the endpoints it discovers
+    (live ports first) and add a run for each new one; once their first
+    targets are done, that wait doesn't hold a scheduler slot. At most
+    ENDPOINT_CONCURRENCY runs go at a time, and MAX_ENDPOINTS_PER_TOOL in
+    total. Their results are merged into the service's single result. The
+    service succeeds if any endpoint did.
+    """
+    targets = _service_targets(service, target_info, uid)
+    discovery = _discoveries.get(uid) if service in ENDPOINT_SOURCE else None
+    deadline = _scan_deadlines.get(uid)
     start_time = time.time()
 
-    # Determine what to send to this specific service
-    # Network layer tools prefer IP
-    if service in ["nmap"]:
-        svc_target = target_info["ip"] or target_info["fqdn"]
-    # DNS and SSL tools prefer FQDN/Host
-    elif service in ["dnsrecon", "testssl", "sslyze"]:
-        svc_target = target_info["fqdn"]
-    # Web tools prefer URL
-    elif service in ["nuclei", "dirsearch", "nikto", "whatweb", "arjun", "dalfox", "wafw00f", "wpscan", "zap"]:
-        svc_target = target_info["url"]
+    log_scan(uid, f"🚀 Starting {service} on {', '.join(targets)}...")
+    set_service_state(uid, service, "running", started_at=datetime.now().isoformat(),
+                      target=targets[0], **({"targets": targets} if len(targets) > 1 else {}))
+
+    slots = asyncio.Semaphore(ENDPOINT_CONCURRENCY)
+    runs = {}
+
+    async def run(svc_target):
+        label = service if svc_target == targets[0] else f"{service} [{svc_target}]"
+        async with slots:
+            return await _run_service_scan(service, svc_target, label, target_info, uid, category)
+
+    def launch(new_targets):
+        for svc_target in new_targets:
+            runs[svc_target] = asyncio.create_task(run(svc_target))
+
+    try:
+        launch(targets)
+        if discovery is not None:
+            asyncio.gather(*runs.values(), return_exceptions=True).add_done_callback(
+                lambda _: discovery.release(service))
+        while discovery is not None and discovery.pending:
+            await discovery.changed.wait()
+            found = [t for t in _service_targets(service, target_info, uid) if t not in runs]
+            found = found[:max(MAX_ENDPOINTS_PER_TOOL - len(runs), 0)]
+            if found and deadline is not None and time.time() + _service_timeout(service) > deadline:
+                log_scan(uid, f"⏭️ {service}: no time left for {', '.join(found)}")
+                break
+            if found:
+                log_scan(uid, f"➕ {service}: adding {', '.join(found)}")
+                launch(found)
+                set_service_state(uid, service, "running", targets=list(runs))
+        outcomes = await asyncio.gather(*runs.values())
+    finally:
+        for task in runs.values():
+            task.cancel()
+        await asyncio.gather(*runs.values(), return_exceptions=True)
+    duration = round(time.time() - start_time, 1)
+
+    fanout = len(runs) > 1
+    results = [(t, content) for t, (_, _, content) in zip(runs, outcomes) if content is not None]
+    stored = await _store_results(uid, service, results) if results else {}
+    if service == "nmap" and results:
+        _record_discovered_services(uid, results[0][1])
+
+    success = any(ok for ok, _, _ in outcomes)
+    errors = [f"{t}: {error}" if fanout else error
+              for t, (_, error, _) in zip(runs, outcomes) if error]
+    error = "; ".join(errors) or None
+    if success:
+        set_service_state(uid, service, "completed", duration=duration,
+                          **({"error": error} if error else {}), **stored)
     else:
-        svc_target = target_info["original"]
+        set_service_state(uid, service, "failed", duration=duration, error=error)
+    return (service, success, error)
+
+
+def _service_timeout(service: str) -> int:
+    """Default seconds the engine waits for one run of `service`"""
+    return SERVICE_TIMEOUT if service in SLOW_SERVICES else DEFAULT_SERVICE_TIMEOUT
+
 
-    log_scan(uid, f"🚀 Starting {service} on {svc_target}...")
+async def _run_service_scan(service: str, svc_target: str, label: str, target_info: dict,
+                            uid: str, category: str) -> tuple:
+    """One tool run against one target: (succeeded, error, /results body or None)"""
+    url = _svc_url(service)
+    timeout = _service_timeout(service)
+    live_ports = service == "nmap"
+    start_time = time.time()
+
+    # Subscribe before triggering so a fast tool can't finish unobserved
+    channel = f"scan:{uid}:events:{service}"
+    pubsub = await _subscribe_events(channel)
 
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            # 1. Trigger scan
-            options = {"category": category}
-            resp = await client.post(f"{url}/scan", json={
-                "target": svc_target,
-                "options": options,
-            })
-            if resp.status_code != 200:
-                log_scan(uid, f"❌ {service} - trigger failed: HTTP {resp.status_code}")
-                return (service, False, f"HTTP {resp.status_code}")
+        client = _get_http_client()
+        # 1. Trigger scan
+        options = {"category": category}
+        if pubsub is not None:
+            options["notify_channel"] = channel
+        if service in NETWORK_SERVICES and target_info.get("ips"):
+            # Cover every address the name resolves to, not just the first
+            options["addresses"] = target_info["ips"]
+        resp = await _trigger_scan(client, url, {
+            "target": svc_target,
+            "options": options,
+        }, label, uid, start_time + timeout)
+        if resp.status_code != 200:
+            log_scan(uid, f"❌ {label} - trigger failed: HTTP {resp.status_code}")
+            return (False, f"HTTP {resp.status_code}", None)
 
-            data = resp.json()
-            svc_scan_id = data.get("scan_id")
-            log_scan(uid, f"📡 {service} scan started (id: {svc_scan_id})")
+        data = resp.json()
+        svc_scan_id = data.get("scan_id")
+        log_scan(uid, f"📡 {label} scan started (id: {svc_scan_id})")
+        if data.get("timeout"):
+            timeout = max(timeout, data["timeout"] + SERVICE_TIMEOUT_GRACE)
 
-            # 2. Poll status
-            elapsed = 0
-            while elapsed < timeout:
+        # 2. Wait for the completion event, polling /status only as a fallback
+        elapsed = 0
+        while elapsed < timeout:
+            status_data = None
+            if pubsub is not None:
+                wait = min(EVENT_FALLBACK_POLL_INTERVAL, max(timeout - elapsed, 0.1))
+                if live_ports:
+                    wait = min(wait, LIVE_PORTS_POLL_INTERVAL)
+                status_data = await _wait_for_event(pubsub, svc_scan_id, wait)
+            else:
                 await asyncio.sleep(POLL_INTERVAL)
-                elapsed = time.time() - start_time
+            elapsed = time.time() - start_time
 
-                try:
+            try:
+                if status_data is None:
                     status_resp = await client.get(f"{url}/status/{svc_scan_id}")
                     if status_resp.status_code != 200:
                         continue
                     status_data = status_resp.json()
-                    status = status_data.get("status", "")
-
-                    if status == "completed":
-                        duration = time.time() - start_time
-                        log_scan(uid, f"✅ {service} completed in {duration:.1f}s")
-                        # Fetch results
-                        await _fetch_and_store_results(client, url, svc_scan_id, service, uid)
-                        return (service, True, None)
-                    elif status == "failed":
-                        msg = status_data.get("message", "unknown error")
-                        duration = time.time() - start_time
-                        log_scan(uid, f"❌ {service} failed after {duration:.1f}s: {msg}")
-                        return (service, False, msg)
-                except Exception:
-                    pass  # transient network error, retry
-
-            # Timeout
-            duration = time.time() - start_time
-            log_scan(uid, f"⏱️ {service} timed out after {duration:.1f}s")
+                status = status_data.get("status", "")
+
+                if status == "completed":
+                    duration = time.time() - start_time
+                    log_scan(uid, f"✅ {label} completed in {duration:.1f}s")
+                    # Fetch results
+                    return (True, None, await _fetch_results(client, url, svc_scan_id, label, uid))
+                elif status == "failed":
+                    msg = status_data.get("message") or "unknown error"
+                    duration = time.time() - start_time
+                    log_scan(uid, f"❌ {label} failed after {duration:.1f}s: {msg}")
+                    return (False, msg, None)
+                elif live_ports:
+                    await _collect_live_ports(client, url, svc_scan_id, uid)
+            except Exception:
+                pass  # transient network error, retry
+
+        # Timeout
+        duration = time.time() - start_time
+        log_scan(uid, f"⏱️ {label} timed out after {duration:.1f}s")
+        return (True, "Timeout (partial results)", await _fetch_results(client, url, svc_scan_id, label, uid))
+
+    except Exception as e:
+        duration = time.time() - start_time
+        log_scan(uid, f"💥 {label} crashed after {duration:.1f}s: {e}")
+        return (False, str(e), None)
+    finally:
+        if pubsub is not None:
             try:
-                await _fetch_and_store_results(client, url, svc_scan_id, service, uid)
+                await pubsub.unsubscribe(channel)
+                await pubsub.aclose()
             except Exception:
                 pass
-            return (service, True, "Timeout (partial results)")
 
+
+async def _trigger_scan(client, url, payload, service, uid, deadline):
+    """POST /scan, backing off while the service answers 429 (queue full)"""
+    while True:
+        resp = await client.post(f"{url}/scan", json=payload)
+        if resp.status_code != 429 or time.time() >= deadline:
+            return resp
+        try:
+            retry_after = max(1, int(resp.headers.get("Retry-After", POLL_INTERVAL)))
+        except ValueError:
+            retry_after = POLL_INTERVAL
+        retry_after = min(retry_after, max(deadline - time.time(), 1))
+        log_scan(uid, f"⏳ {service} is busy, retrying in {retry_after:.0f}s")
+        await asyncio.sleep(retry_after)
+
+
+async def _subscribe_events(channel: str):
+    """Subscribe to a tool's completion channel; None means poll instead"""
+    try:
+        pubsub = _get_async_redis().pubsub()
+        await pubsub.subscribe(channel)
+        return pubsub
     except Exception as e:
-        duration = time.time() - start_time
-        log_scan(uid, f"💥 {service} crashed after {duration:.1f}s: {e}")
-        return (service, False, str(e))
+        logger.warning("Event channel %s unavailable, polling instead: %s", channel, e)
+        return None
 
 
-async def _fetch_and_store_results(client, url, svc_scan_id, service, uid):
-    """Fetch results from microservice and store in Redis"""
+async def _wait_for_event(pubsub, svc_scan_id: str, timeout: float):
+    """Wait up to `timeout` seconds for this scan's completion event"""
+    deadline = time.time() + timeout
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        try:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+        except Exception:
+            return None
+        if not message:
+            continue
+        try:
+            event = json.loads(message["data"])
+        except (TypeError, ValueError):
+            continue
+        if event.get("scan_id") == svc_scan_id:
+            return event
+
+
+async def _collect_live_ports(client, url, svc_scan_id, uid):
+    """Record the open ports a running nmap scan has published so far"""
+    res = await client.get(f"{url}/results/{svc_scan_id}")
+    if res.status_code == 200:
+        _record_discovered_services(uid, res.text, merge=True)
+
+
+async def _fetch_results(client, url, svc_scan_id, label, uid):
+    """A finished tool scan's /results body, or None if it can't be fetched"""
     try:
         res = await client.get(f"{url}/results/{svc_scan_id}")
         if res.status_code == 200:
-            content = res.text
-            redis_client.set(f"scan:{uid}:result:{service}", content)
-            redis_client.expire(f"scan:{uid}:result:{service}", 3600)
-            log_scan(uid, f"💾 {service} results saved ({len(content)} bytes)")
+            return res.text
+        log_scan(uid, f"⚠️ Failed to fetch {label} results: HTTP {res.status_code}")
+    except Exception as e:
+        log_scan(uid, f"⚠️ Failed to fetch {label} results: {e}")
+    return None
+
+
+def _merge_results(service: str, results: list) -> tuple:
+    """(payload, findings) for a tool that ran against several endpoints.
+
+    Each endpoint's output goes through the tool's parser on its own; the
+    findings are renumbered and tagged with their endpoint.
+    """
+    base = service.split("_")[0]
+    findings, raw_outputs, svc_findings, endpoints = [], [], [], {}
+    for target, content in results:
+        for finding in parsers.parse_result(service, content):
+            findings.append(dict(finding, id=f"{base}-{len(findings)}", endpoint=target))
+        try:
+            data = json.loads(content)
+        except ValueError:
+            data = {"raw_output": content}
+        if not isinstance(data, dict):
+            data = {"raw_output": content}
+        for finding in data.get("findings") or []:
+            svc_findings.append(dict(finding, details={**(finding.get("details") or {}), "endpoint": target}))
+        if data.get("raw_output"):
+            raw_outputs.append(f"===== {target} =====\n{data['raw_output']}")
+        endpoints[target] = data.get("metadata")
+    payload = {
+        "status": "completed",
+        "findings": svc_findings,
+        "raw_output": "\n\n".join(raw_outputs),
+        "metadata": {"endpoints": endpoints},
+    }
+    return json.dumps(payload, ensure_ascii=False), findings
+
+
+async def _store_results(uid: str, service: str, results: list) -> dict:
+    """Parse and store a service's results ([(target, /results body)]).
+
+    Returns {"result_size", "findings"} for the service state ({} on failure).
+    """
+    try:
+        if len(results) == 1:
+            content = results[0][1]
+            # Parse once here; the API serves the normalized findings as-is
+            findings = await asyncio.to_thread(parsers.parse_result, service, content)
+        else:
+            content, findings = await asyncio.to_thread(_merge_results, service, results)
+        stored = await asyncio.to_thread(result_store.encode_result, uid, service, content)
+        _scan_write(uid, "set", f"scan:{uid}:result:{service}", stored)
+        _scan_write(uid, "hset", f"scan:{uid}:findings", service, json.dumps(findings))
+        log_scan(uid, f"💾 {service} results saved ({len(content)} bytes, {len(stored)} stored, "
+                      f"{len(findings)} findings)")
+        return {"result_size": len(content), "findings": len(findings)}
     except Exception as e:
         log_scan(uid, f"⚠️ Failed to save {service} results: {e}")
+    return {}
+
 
+async def run_all_services(services, target_info: dict, uid: str, category: str):
+    """Run tool services via HTTP, each as soon as its dependencies finish.
 
-async def run_all_services(services: list, target_info: dict, uid: str, category: str):
-    """Run all tool services in parallel via HTTP"""
-    # Separate nuclei (run last)
-    nuclei_svcs = [s for s in services if "nuclei" in s]
-    other_svcs  = [s for s in services if "nuclei" not in s]
+    `services` is a dependency graph ({tool: [deps]}) or a plain list of
+    independent tools. Ready tools start in SERVICE_PRIORITY order, with at
+    most MAX_PARALLEL_TOOLS running at once. A dependency counts as finished
+    whether it succeeded or failed. Tools that follow nmap's endpoints
+    (ENDPOINT_SOURCE) aren't held back by it; they hear about what it finds
+    through the scan's _Discovery, which ends when nmap does. A follower
+    that has finished its own targets and only waits for nmap gives its
+    slot up; endpoint runs it adds later go without one.
+    """
+    graph = services if isinstance(services, dict) else {svc: [] for svc in services}
+    waiting = dict(graph)
+    finished = set()
+    running = {}
+    outcomes = {}
+    announced = set()
+    holding = set()   # running tools that take up a MAX_PARALLEL_TOOLS slot
+    slot_freed = asyncio.Event()
 
-    results = []
+    def release(svc):
+        holding.discard(svc)
+        slot_freed.set()
 
-    # 1. Run non-nuclei in parallel
-    if other_svcs:
-        log_scan(uid, f"📋 Running {len(other_svcs)} services in parallel...")
-        tasks = [call_service(svc, target_info, uid, category) for svc in other_svcs]
-        results.extend(await asyncio.gather(*tasks, return_exceptions=True))
+    log_scan(uid, f"📋 Scheduling {len(graph)} services (max {MAX_PARALLEL_TOOLS} in parallel)...")
+    for svc in graph:
+        set_service_state(uid, svc, "pending", depends_on=list(graph[svc]))
+    if graph.get("nmap") == [] and any(ENDPOINT_SOURCE.get(svc) == "nmap" for svc in graph):
+        # nmap starts right away; its followers pick up what it discovers
+        _discoveries[uid] = _Discovery(release)
 
-    # 2. Run nuclei last
-    if nuclei_svcs:
-        log_scan(uid, f"📋 Running Nuclei ({len(nuclei_svcs)}) — last step...")
-        tasks = [call_service(svc, target_info, uid, category) for svc in nuclei_svcs]
-        results.extend(await asyncio.gather(*tasks, return_exceptions=True))
+    try:
+        while waiting or running:
+            ready = sorted(
+                (svc for svc, deps in waiting.items()
+                 if all(dep in finished or dep not in graph for dep in deps)),
+                key=lambda svc: SERVICE_PRIORITY.get(svc, len(SERVICE_PRIORITY)),
+            )
+            for svc in ready[:max(MAX_PARALLEL_TOOLS - len(holding), 0)]:
+                del waiting[svc]
+                task = asyncio.create_task(call_service(svc, target_info, uid, category))
+                running[task] = svc
+                holding.add(svc)
+
+            if not running:
+                # Only reachable with a dependency cycle
+                for svc in waiting:
+                    log_scan(uid, f"❌ {svc} failed: unresolvable dependencies {graph[svc]}")
+                    set_service_state(uid, svc, "failed", error="Unresolvable dependencies")
+                    outcomes[svc] = (svc, False, "Unresolvable dependencies")
+                break
+
+            for svc in waiting.keys() - announced:
+                announced.add(svc)
+                log_scan(uid, f"⏳ Pending {svc}")
+
+            freed = asyncio.ensure_future(slot_freed.wait())
+            try:
+                done, _ = await asyncio.wait([*running, freed], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                freed.cancel()
+            slot_freed.clear()
+            for task in done - {freed}:
+                svc = running.pop(task)
+                holding.discard(svc)
+                finished.add(svc)
+                if svc == "nmap" and uid in _discoveries:
+                    # Followers now have every endpoint there will be
+                    _discoveries.pop(uid).notify(finished=True)
+                try:
+                    outcomes[svc] = task.result()
+                except Exception as e:
+                    outcomes[svc] = e
+    finally:
+        # Cancelled or timed out (the worker wraps scans in wait_for): don't
+        # leave tool calls running and writing to a scan that has ended
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        _discoveries.pop(uid, None)
 
+    results = [outcomes[svc] for svc in graph]
     successful = sum(1 for r in results if isinstance(r, tuple) and r[1])
     failed = len(results) - successful
     log_scan(uid, f"📊 Summary: {successful} succeeded, {failed} failed")
 
-    redis_client.set(f"scan:{uid}:status", "completed")
-    redis_client.expire(f"scan:{uid}:status", 3600)
+    _scan_write(uid, "set", f"scan:{uid}:status", "completed")
     return results
 
 
-def run_scan(target: str, category: str, uid: str = None) -> str:
-    """Main scan execution — called by RQ worker"""
+async def run_scan_async(target: str, category: str, uid: str = None) -> str:
+    """Main scan execution on the current event loop.
+
+    Used directly by the asyncio worker (many scans per loop) and wrapped
+    by `run_scan` for the RQ fork-per-job worker.
+    """
     if not uid:
         uid = uuid.uuid4().hex
 
+    writer = ScanWriteBuffer(uid)
+    _scan_writers[uid] = writer
+    _scan_deadlines[uid] = time.time() + SCAN_TIME_BUDGET
+    writer.start()
+    try:
+        return await _run_scan_pipeline(target, category, uid, writer)
+    finally:
+        await writer.close()
+        _scan_writers.pop(uid, None)
+        _service_states.pop(uid, None)
+        _discovered_services.pop(uid, None)
+        _scan_deadlines.pop(uid, None)
+        try:
+            await archive_scan(uid, list(PROFILE_SERVICES.get(category, {})))
+        except Exception as e:
+            print(f"[{uid}] Archiving failed: {e}")
+
+
+async def archive_scan(uid: str, services: list) -> bool:
+    """Compact a finished scan into the on-disk archive.
+
+    Meta, logs, findings and service states stay in Redis until their TTL
+    (the API rehydrates them from the archive afterwards); raw tool output
+    is only needed again from the archive, so it leaves Redis right away.
+    """
+    scan_archive = await asyncio.to_thread(archive.get_archive)
+    if scan_archive is None:
+        await asyncio.to_thread(_prune_result_blobs, None)
+        return False
+
+    redis = _get_async_redis()
+    result_keys = [f"scan:{uid}:result:{svc}" for svc in services]
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hgetall(f"scan:{uid}:meta")
+        pipe.xrange(f"scan:{uid}:logstream")
+        pipe.hgetall(f"scan:{uid}:findings")
+        pipe.hgetall(f"scan:{uid}:services")
+        pipe.get(f"scan:{uid}:insightmap")
+        for key in result_keys:
+            pipe.get(key)
+        meta, log_entries, findings, states, insightmap, *raws = await pipe.execute()
+    if not meta:
+        return False
+
+    record = {
+        "meta": meta,
+        "logs": [fields["line"] for _, fields in log_entries],
+        "findings": findings,
+        "services": states,
+        "insightmap": insightmap,
+        # Spilled raw outputs stay in the blob store; the record keeps the reference
+        "results": {svc: result_store.decode_result(raw) for svc, raw in zip(services, raws) if raw},
+    }
+    await asyncio.to_thread(scan_archive.put, uid, record)
+    if result_keys:
+        await redis.delete(*result_keys)
+    print(f"[{uid}] Archived ({len(record['results'])} results, {len(record['logs'])} log lines)")
+
+    pruned = await asyncio.to_thread(scan_archive.prune)
+    for scan_id in pruned:
+        await asyncio.to_thread(result_store.delete_blobs, scan_id)
+    if pruned:
+        print(f"[{uid}] Pruned {len(pruned)} scans past archive retention")
+    await asyncio.to_thread(_prune_result_blobs, scan_archive)
+    return True
+
+
+def _prune_result_blobs(scan_archive) -> None:
+    """Drop spilled raw outputs of scans that are neither in Redis nor archived"""
+    def referenced(scan_id: str) -> bool:
+        if scan_archive is not None and scan_id in scan_archive:
+            return True
+        return bool(redis_client.exists(f"scan:{scan_id}:meta"))
+
+    removed = result_store.prune_blobs(referenced, min_age=SCAN_TTL)
+    if removed:
+        print(f"Removed raw output blobs of {len(removed)} expired scans")
+
+
+async def _run_scan_pipeline(target: str, category: str, uid: str, writer: ScanWriteBuffer) -> str:
     # 1. Resolve and analyze target
-    target_info = resolve_target(target)
+    target_info = await resolve_target_async(target, cache=_get_async_redis())
     
     # Update meta status
-    redis_client.hset(f"scan:{uid}:meta", "status", "running")
+    _scan_write(uid, "hset", f"scan:{uid}:meta", "status", "running", expire=False)
+    publish_update(uid, "status", status="running")
+    # The API indexes scans it creates; this covers scans queued any other way
+    started = time.time()
+    _scan_write(uid, "hsetnx", f"scan:{uid}:meta", "started_at", datetime.now().isoformat(), expire=False)
+    user_id = await _get_async_redis().hget(f"scan:{uid}:meta", "user_id") or "anonymous"
+    _scan_write(uid, "zadd", "scans:index", {uid: started}, nx=True, expire=False)
+    _scan_write(uid, "zadd", f"scans:user:{user_id}", {uid: started}, nx=True, expire=False)
 
-    services = PROFILE_SERVICES.get(category, [])
+    graph = PROFILE_SERVICES.get(category, {})
+    services = list(graph)
     log_scan(uid, f"🎯 Starting {category.upper()} scan for {target}")
-    log_scan(uid, f"📄 Target Strategy: IP={target_info['ip']}, FQDN={target_info['fqdn']}")
+    log_scan(uid, f"📄 Target Strategy: IP={target_info['ip']}, FQDN={target_info['fqdn']}, "
+                  f"addresses={', '.join(target_info['ips']) or 'none'}")
 
     # Run all services via HTTP
     try:
-        asyncio.run(run_all_services(services, target_info, uid, category))
+        await run_all_services(graph, target_info, uid, category)
+    except asyncio.CancelledError:
+        # Job timeout or worker shutdown: the scan won't finish, so don't
+        # leave it "running"
+        log_scan(uid, "🛑 Scan cancelled")
+        _scan_write(uid, "hset", f"scan:{uid}:meta", "status", "failed", expire=False)
+        publish_update(uid, "status", status="failed", error="Scan cancelled")
+        raise
     except Exception as e:
         log_scan(uid, f"💥 Scan execution failed: {e}")
+        _scan_write(uid, "hset", f"scan:{uid}:meta", "status", "failed", expire=False)
+        publish_update(uid, "status", status="failed", error=str(e))
         raise RuntimeError(f"Scan failed: {e}")
 
     # Mark completed
     log_scan(uid, f"✅ Scan completed for {target}")
-    redis_client.hset(f"scan:{uid}:meta", "status", "completed")
-    redis_client.hset(f"scan:{uid}:meta", "completed_at", datetime.now().isoformat())
+    completed_at = datetime.now().isoformat()
+    _scan_write(uid, "hset", f"scan:{uid}:meta", mapping={
+        "status": "completed",
+        "completed_at": completed_at,
+    }, expire=False)
+    publish_update(uid, "status", status="completed", completed_at=completed_at)
+    # InsightMap reads results and meta back — make sure they're written
+    await writer.flush()
 
+    # InsightMap and SMTP are blocking clients — keep them off the loop
     try:
-        send_to_insightmap(uid, target, category, services)
+        await asyncio.to_thread(send_to_insightmap, uid, target, category, services)
     except Exception as insight_err:
         log_scan(uid, f"⚠️ InsightMap analizi gönderilemedi: {insight_err}")
 
     # Email notification
     try:
-        meta = redis_client.hgetall(f"scan:{uid}:meta")
+        meta = await _get_async_redis().hgetall(f"scan:{uid}:meta")
         user_email = meta.get("user_email") or os.getenv("MAIL_TO", "")
         user_name  = meta.get("user_name", "Kullanıcı")
         if user_email:
-            send_scan_email(
+            await asyncio.to_thread(
+                send_scan_email,
                 to_email=user_email,
                 to_name=user_name,
                 target=target,
@@ -302,10 +1007,21 @@ def run_scan(target: str, category: str, uid: str = None) -> str:
     return uid
 
 
+def run_scan(target: str, category: str, uid: str = None) -> str:
+    """Main scan execution — called by RQ worker"""
+    async def _run():
+        try:
+            return await run_scan_async(target, category, uid)
+        finally:
+            await close_loop_clients()
+
+    return asyncio.run(_run())
+
+
 def _collect_service_findings(uid: str, services: list[str]) -> list[dict]:
     findings = []
     for service in services:
-        raw = redis_client.get(f"scan:{uid}:result:{service}")
+        raw = result_store.decode_result(redis_client.get(f"scan:{uid}:result:{service}"))
         if not raw:
             continue
         try:
@@ -340,7 +1056,7 @@ def send_to_insightmap(uid: str, target: str, category: str, services: list[str]
         "findings": _collect_service_findings(uid, services),
     }
 
-    response = httpx.post(
+    response = http_pool.sync_client("insightmap").post(
         f"{INSIGHTMAP_URL}/api/security/pentest/analyze",
         headers={"X-API-Key": INSIGHTMAP_API_KEY},
         json=payload,
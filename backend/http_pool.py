@@ -0,0 +1,191 @@
+"""
+Shared HTTP client registry
+Keep-alive connection pools per upstream, reused by the engine and the API.
+"""
+import os
+import asyncio
+import threading
+import logging
+import importlib.util
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# httpx needs the h2 package for http2=True
+_H2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# HTTP/2 is negotiated via ALPN, so it only applies to https:// upstreams
+# (auth, Turnstile, InsightMap); plain-http tool services stay on HTTP/1.1.
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "200"))
+POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "50"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+
+# Default request timeout per upstream (seconds)
+UPSTREAM_TIMEOUTS = {
+    "tool-services": 30,
+    "auth": 5,
+    "turnstile": 10,
+    "insightmap": 30,
+}
+
+if HTTP2_ENABLED and not _H2_AVAILABLE:
+    logger.warning("HTTP2_ENABLED set but the h2 package is missing — using HTTP/1.1")
+
+
+class _UpstreamStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+
+    def as_dict(self):
+        return {"requests": self.requests, "errors": self.errors, "in_flight": self.in_flight}
+
+
+class ClientRegistry:
+    """One pooled client per upstream, for async (per event loop) and sync use"""
+
+    def __init__(self):
+        self._async_clients = {}
+        self._async_loop = None
+        self._sync_clients = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @staticmethod
+    def _transport_kwargs() -> dict:
+        return {
+            "limits": httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+            ),
+            "http2": HTTP2_ENABLED and _H2_AVAILABLE,
+        }
+
+    def _stats_for(self, upstream: str) -> _UpstreamStats:
+        with self._lock:
+            return self._stats.setdefault(upstream, _UpstreamStats())
+
+    def async_client(self, upstream: str) -> httpx.AsyncClient:
+        """Pooled AsyncClient for `upstream`, bound to the running event loop.
+
+        The RQ worker runs each job under its own ``asyncio.run``; clients
+        from a previous (closed) loop are dropped and rebuilt.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_clients = {}
+            self._async_loop = loop
+        client = self._async_clients.get(upstream)
+        if client is None:
+            client = httpx.AsyncClient(
+                transport=_CountingAsyncTransport(self._stats_for(upstream), **self._transport_kwargs()),
+                timeout=UPSTREAM_TIMEOUTS.get(upstream, 30),
+            )
+            self._async_clients[upstream] = client
+        return client
+
+    def sync_client(self, upstream: str) -> httpx.Client:
+        """Pooled, thread-safe Client for blocking callers (e.g. InsightMap)"""
+        stats = self._stats_for(upstream)
+        with self._lock:
+            client = self._sync_clients.get(upstream)
+            if client is None:
+                client = httpx.Client(
+                    transport=_CountingTransport(stats, **self._transport_kwargs()),
+                    timeout=UPSTREAM_TIMEOUTS.get(upstream, 30),
+                )
+                self._sync_clients[upstream] = client
+            return client
+
+    def stats(self) -> dict:
+        """Request counters and connection pool usage per upstream"""
+        result = {}
+        with self._lock:
+            upstreams = dict(self._stats)
+        for upstream, stats in upstreams.items():
+            entry = stats.as_dict()
+            connections = []
+            for client in (self._async_clients.get(upstream), self._sync_clients.get(upstream)):
+                if client is not None:
+                    connections.extend(_pool_connections(client))
+            entry["connections"] = len(connections)
+            entry["idle_connections"] = sum(1 for c in connections if c.is_idle())
+            result[upstream] = entry
+        return {
+            "http2": HTTP2_ENABLED and _H2_AVAILABLE,
+            "max_connections": POOL_MAX_CONNECTIONS,
+            "max_keepalive": POOL_MAX_KEEPALIVE,
+            "upstreams": result,
+        }
+
+    async def aclose(self):
+        """Close the async clients of the running loop"""
+        if self._async_loop is not asyncio.get_running_loop():
+            return
+        clients, self._async_clients = self._async_clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+class _CountingAsyncTransport(httpx.AsyncHTTPTransport):
+    """Pooled transport that records per-upstream request counters"""
+
+    def __init__(self, stats: _UpstreamStats, **kwargs):
+        super().__init__(**kwargs)
+        self._upstream_stats = stats
+
+    async def handle_async_request(self, request):
+        stats = self._upstream_stats
+        stats.requests += 1
+        stats.in_flight += 1
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+        if response.status_code >= 500:
+            stats.errors += 1
+        return response
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    def __init__(self, stats: _UpstreamStats, **kwargs):
+        super().__init__(**kwargs)
+        self._upstream_stats = stats
+
+    def handle_request(self, request):
+        stats = self._upstream_stats
+        with stats.lock:
+            stats.requests += 1
+            stats.in_flight += 1
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            with stats.lock:
+                stats.errors += 1
+            raise
+        finally:
+            with stats.lock:
+                stats.in_flight -= 1
+        if response.status_code >= 500:
+            with stats.lock:
+                stats.errors += 1
+        return response
+
+
+def _pool_connections(client) -> list:
+    # httpx doesn't expose pool state publicly; read it defensively
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    return list(getattr(pool, "connections", []) or [])
+
+
+registry = ClientRegistry()
+async_client = registry.async_client
+sync_client = registry.sync_client
+stats = registry.stats
@@ -1,16 +1,31 @@
 from fastapi import FastAPI, BackgroundTasks, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
 import os
 import uuid
 import json
+import asyncio
+import gzip
+import hashlib
 import logging
+import re
 import httpx
-from redis import Redis
-from datetime import datetime, date
-import xml.etree.ElementTree as ET
+import http_pool
+import parsers
+import archive
+import result_store
+import redis_pool
+from session_cache import SessionCache, SESSION_CACHE_SHARED
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime, date, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+try:
+    import brotli
+except ImportError:  # brotli is optional — gzip only
+    brotli = None
 
 # ── Günlük tarama limiti ──────────────────────────────────────────────────────
 DAILY_SCAN_LIMIT = 2
@@ -29,6 +44,11 @@ AUTH_SESSION_URL = os.getenv("AUTH_SESSION_URL", "").rstrip("/")
 SESSION_COOKIE = os.getenv("SESSION_COOKIE", "better-auth.session_token")
 
 
+# Doğrulanmış oturumlar kısa süre önbelleklenir (session_cache.py); aynı token
+# için eşzamanlı istekler tek bir get-session çağrısını paylaşır.
+_session_cache = SessionCache()
+
+
 async def _verify_session(request: Request, claimed_user_id: str) -> None:
     """Oturum cookie'sinden gerçek userId'i çözer ve kullanıcının gönderdiği
     `claimed_user_id` ile eşleştirir. Eşleşmiyorsa 401.
@@ -45,27 +65,36 @@ async def _verify_session(request: Request, claimed_user_id: str) -> None:
     if not token:
         logger.warning("Oturum cookie'si yok — userId doğrulanamadı")
         raise HTTPException(status_code=401, detail="Oturum bulunamadı. Lütfen tekrar giriş yapın.")
+
+    real_user_id = await _session_cache.resolve(token, _fetch_session_user)
+    if not real_user_id:
+        raise HTTPException(status_code=401, detail="Oturum geçersiz veya süresi dolmuş.")
+    if real_user_id != claimed_user_id:
+        logger.warning("userId uyuşmazlığı: claim=%s session=%s", claimed_user_id, real_user_id)
+        raise HTTPException(status_code=401, detail="Oturum kullanıcısı ile uyuşmuyor.")
+
+
+async def _fetch_session_user(token: str):
+    """better-auth get-session çağrısı → (user_id | None, önbelleklenebilir mi)"""
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            resp = await client.get(
-                f"{AUTH_SESSION_URL}/api/auth/get-session",
-                headers={"Cookie": f"{SESSION_COOKIE}={token}"},
-            )
-        if resp.status_code != 200:
-            logger.warning("Session doğrulama başarısız (HTTP %s)", resp.status_code)
-            raise HTTPException(status_code=401, detail="Oturum geçersiz veya süresi dolmuş.")
-        body = resp.json()
-        real_user_id = (
-            (body.get("user") or {}).get("id")
-            if isinstance(body, dict)
-            else None
+        resp = await http_pool.async_client("auth").get(
+            f"{AUTH_SESSION_URL}/api/auth/get-session",
+            headers={"Cookie": f"{SESSION_COOKIE}={token}"},
         )
-        if not real_user_id or real_user_id != claimed_user_id:
-            logger.warning("userId uyuşmazlığı: claim=%s session=%s", claimed_user_id, real_user_id)
-            raise HTTPException(status_code=401, detail="Oturum kullanıcısı ile uyuşmuyor.")
     except httpx.RequestError as e:
         logger.error("Session doğrulama servisine ulaşılamadı: %s", e)
         raise HTTPException(status_code=503, detail="Oturum doğrulama servisi erişilemez.")
+    if resp.status_code != 200:
+        logger.warning("Session doğrulama başarısız (HTTP %s)", resp.status_code)
+        # Yalnızca kesin ret negatif önbelleğe girer; 5xx tekrar denenir
+        return None, resp.status_code in (401, 403)
+    body = resp.json()
+    real_user_id = (
+        (body.get("user") or {}).get("id")
+        if isinstance(body, dict)
+        else None
+    )
+    return real_user_id, True
 
 
 # Version
@@ -92,16 +121,21 @@ app.add_middleware(
 )
 
 # Redis Connection – REDIS_URL varsa onu kullan, yoksa REDIS_HOST'a bak
+# Async pools (redis_pool.py) so a Redis round trip never blocks the event loop
 REDIS_URL = os.getenv("REDIS_URL")
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 try:
-    if REDIS_URL:
-        redis_conn = Redis.from_url(REDIS_URL, decode_responses=True)
-    else:
-        redis_conn = Redis(host=REDIS_HOST, port=6379, db=0, decode_responses=True)
+    redis_conn = redis_pool.create_client(REDIS_URL, REDIS_HOST)
+    # SSE clients sit in a blocking XREAD — separate pool, no socket timeout
+    stream_redis = redis_pool.create_client(
+        REDIS_URL, REDIS_HOST, max_connections=redis_pool.SSE_REDIS_POOL_SIZE, socket_timeout=None
+    )
 except Exception as e:
     logger.error(f"Failed to connect to Redis: {e}")
-    redis_conn = None
+    redis_conn = stream_redis = None
+
+if SESSION_CACHE_SHARED:
+    _session_cache.redis = redis_conn
 
 # Directories (kept for legacy references or temp storage if needed)
 BASE_DIR = "/app"
@@ -133,11 +167,11 @@ def read_root():
 
 
 @app.get("/health")
-def health_check():
+async def health_check():
     redis_status = "unavailable"
     if redis_conn:
         try:
-            redis_status = "ok" if redis_conn.ping() else "unavailable"
+            redis_status = "ok" if await redis_conn.ping() else "unavailable"
         except Exception:
             redis_status = "unavailable"
 
@@ -152,6 +186,26 @@ def health_check():
     }
 
 
+@app.get("/metrics")
+def get_metrics():
+    """Connection pool usage, for sizing the shared clients"""
+    return {
+        "http_pools": http_pool.stats(),
+        "redis_pools": {
+            "api": redis_pool.pool_stats(redis_conn) if redis_conn else {},
+            "sse": redis_pool.pool_stats(stream_redis) if stream_redis else {},
+        },
+    }
+
+
+@app.on_event("shutdown")
+async def close_http_pools():
+    await http_pool.registry.aclose()
+    for client in (redis_conn, stream_redis):
+        if client:
+            await client.aclose()
+
+
 @app.get("/version")
 def get_version():
     """Get API version information"""
@@ -179,7 +233,7 @@ async def get_scan_quota(request: Request, user_id: str):
 
     today = date.today().isoformat()          # e.g. 2026-02-28
     key = f"quota:{user_id}:{today}"
-    used = int(redis_conn.get(key) or 0)
+    used = int(await redis_conn.get(key) or 0)
     return {
         "used": used,
         "limit": DAILY_SCAN_LIMIT,
@@ -187,6 +241,77 @@ async def get_scan_quota(request: Request, user_id: str):
     }
 
 
+# Kota rezervasyonu, meta ve indeks tek atomik script'te: eşzamanlı iki istek
+# son hakkı birlikte harcayamaz.
+#   KEYS: quota, meta, scans:index, scans:user:{id}
+#   ARGV: limit, quota ttl, meta ttl, score, scan_id, meta field/value pairs...
+_RESERVE_SCAN_LUA = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+if used >= tonumber(ARGV[1]) then
+    return -1
+end
+used = redis.call('INCR', KEYS[1])
+if used == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+redis.call('HSET', KEYS[2], unpack(ARGV, 6))
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[5])
+redis.call('ZADD', KEYS[4], ARGV[4], ARGV[5])
+return used
+"""
+_reserve_scan_script = redis_conn.register_script(_RESERVE_SCAN_LUA) if redis_conn else None
+
+
+async def _verify_turnstile(scan: ScanRequest, request: Request) -> None:
+    """Turnstile token doğrulama"""
+    turnstile_secret = os.getenv("TURNSTILE_SECRET_KEY")
+    if not turnstile_secret:
+        logger.warning("⚠️ TURNSTILE_SECRET_KEY tanımlanmamış, captcha doğrulaması atlanıyor")
+        return
+    client_ip = request.client.host if request.client else None
+    try:
+        response = await http_pool.async_client("turnstile").post(
+            "https://challenges.cloudflare.com/turnstile/v0/siteverify",
+            data={
+                "secret": turnstile_secret,
+                "response": scan.turnstileToken or "",
+                "remoteip": client_ip
+            }
+        )
+        result = response.json()
+        if not result.get("success"):
+            raise HTTPException(status_code=400, detail="Bot doğrulaması başarısız. Lütfen sayfayı yenileyip tekrar deneyin.")
+    except httpx.RequestError as e:
+        logger.error(f"Turnstile verification error: {e}")
+        # Ağ hatasında geç (veya isteğe göre reddet)
+
+
+def _quota_key(user_id: str) -> str:
+    return f"quota:{user_id}:{date.today().isoformat()}"
+
+
+async def _reserve_scan(scan_id: str, user_id: str, meta: dict) -> bool:
+    """Kotadan bir hak düş, meta'yı yaz ve indeksle; kota doluysa False"""
+    score = datetime.fromisoformat(meta["started_at"]).timestamp()
+    fields = [item for pair in meta.items() for item in pair]
+    used = await _reserve_scan_script(
+        keys=[_quota_key(user_id), f"scan:{scan_id}:meta", SCAN_INDEX_KEY, _user_index_key(user_id)],
+        args=[DAILY_SCAN_LIMIT, 86400, 3600, score, scan_id, *fields],
+    )
+    return used != -1
+
+
+async def _release_scan(scan_id: str, user_id: str) -> None:
+    """Kuyruğa alınamayan taramanın rezervasyonunu geri al (kotayı iade et)"""
+    async with redis_conn.pipeline(transaction=True) as pipe:
+        pipe.decr(_quota_key(user_id))
+        pipe.delete(f"scan:{scan_id}:meta")
+        pipe.zrem(SCAN_INDEX_KEY, scan_id)
+        pipe.zrem(_user_index_key(user_id), scan_id)
+        await pipe.execute()
+
+
 @app.post("/scan", response_model=ScanResponse)
 async def create_scan(scan: ScanRequest, background_tasks: BackgroundTasks, request: Request):
     """
@@ -195,72 +320,46 @@ async def create_scan(scan: ScanRequest, background_tasks: BackgroundTasks, requ
     """
     from worker import queue_scan  # Deferred import to avoid circular dependency
 
-    # ── Kullanıcı kimlik kontrolü (session doğrulamalı) ─────────────────────
-    await _verify_session(request, scan.userId or "")
-
-    # ── Günlük kota kontrolü ───────────────────────────────────────────────────
-    if redis_conn:
-        today = date.today().isoformat()
-        quota_key = f"quota:{scan.userId}:{today}"
-        used = int(redis_conn.get(quota_key) or 0)
-        if used >= DAILY_SCAN_LIMIT:
-            raise HTTPException(
-                status_code=429,
-                detail=f"Günlük tarama limitinize ({DAILY_SCAN_LIMIT}) ulaştınız. Yarın tekrar deneyin."
-            )
+    # ── Oturum ve bot doğrulaması birbirinden bağımsız — eşzamanlı çalışır ──────
+    # Oturum hatası (401) her zaman önceliklidir.
+    session_check, turnstile_check = await asyncio.gather(
+        _verify_session(request, scan.userId or ""),
+        _verify_turnstile(scan, request),
+        return_exceptions=True,
+    )
+    for outcome in (session_check, turnstile_check):
+        if isinstance(outcome, BaseException):
+            raise outcome
 
-    # Turnstile token doğrulama
-    turnstile_secret = os.getenv("TURNSTILE_SECRET_KEY")
-    if turnstile_secret:
-        client_ip = request.client.host if request.client else None
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://challenges.cloudflare.com/turnstile/v0/siteverify",
-                    data={
-                        "secret": turnstile_secret,
-                        "response": scan.turnstileToken or "",
-                        "remoteip": client_ip
-                    }
-                )
-                result = response.json()
-                if not result.get("success"):
-                    raise HTTPException(status_code=400, detail="Bot doğrulaması başarısız. Lütfen sayfayı yenileyip tekrar deneyin.")
-        except httpx.RequestError as e:
-            logger.error(f"Turnstile verification error: {e}")
-            # Ağ hatasında geç (veya isteğe göre reddet)
-    else:
-        logger.warning("⚠️ TURNSTILE_SECRET_KEY tanımlanmamış, captcha doğrulaması atlanıyor")
-    
     # Map frontend fields to backend variables
     target = scan.ip
     scan_type = scan.category
+    user_id = scan.userId or "anonymous"
 
     scan_id = uuid.uuid4().hex
-    
-    # Save initial metadata to Redis immediately
+
+    # ── Günlük kota + meta + indeks (atomik) ───────────────────────────────────
     if redis_conn:
-        redis_conn.hmset(f"scan:{scan_id}:meta", {
+        reserved = await _reserve_scan(scan_id, user_id, {
             "target": target,
             "category": scan_type,
             "uid": scan_id,
-            "user_id": scan.userId or "anonymous",
+            "user_id": user_id,
             "user_name": scan.userName or "unknown",
             "user_email": scan.userEmail or "",
             "status": "queued",
             "started_at": datetime.now().isoformat()
         })
-        redis_conn.expire(f"scan:{scan_id}:meta", 3600)
-
-        # ── Kotayı artır ───────────────────────────────────────────────────────
-        today = date.today().isoformat()
-        quota_key = f"quota:{scan.userId}:{today}"
-        redis_conn.incr(quota_key)
-        redis_conn.expire(quota_key, 86400)  # 24 saat sonra otomatik sil
+        if not reserved:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Günlük tarama limitinize ({DAILY_SCAN_LIMIT}) ulaştınız. Yarın tekrar deneyin."
+            )
 
     try:
         # Enqueue task
-        job = queue_scan(target, scan_type, scan_id)
+        # RQ's client is synchronous — enqueue off the event loop
+        job = await run_in_threadpool(queue_scan, target, scan_type, scan_id)
         
         return {
             "message": "Scan started successfully",
@@ -269,38 +368,259 @@ async def create_scan(scan: ScanRequest, background_tasks: BackgroundTasks, requ
         }
     except Exception as e:
         logger.error(f"Failed to queue scan: {e}")
+        if redis_conn:
+            try:
+                await _release_scan(scan_id, user_id)
+            except Exception as release_err:
+                logger.error(f"Failed to release quota for scan {scan_id}: {release_err}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ── Conditional GET & compression ──────────────────────────────────────────────
+# Results, report and logs only change when a service finishes, a log line is
+# appended or the scan completes; validators are derived from that state so a
+# poll is answered with 304 before anything is rebuilt.
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+async def _scan_state(scan_id: str, rehydrate: bool = True) -> dict:
+    """Cheap summary of everything the scan's responses are built from"""
+    async with redis_conn.pipeline(transaction=False) as pipe:
+        pipe.hmget(f"scan:{scan_id}:meta", "status", "completed_at")
+        pipe.hlen(f"scan:{scan_id}:findings")
+        pipe.exists(f"scan:{scan_id}:insightmap")
+        # The stream is trimmed (MAXLEN ~), so its length can stand still
+        # while lines are added; its last entry ID can't
+        pipe.xrevrange(f"scan:{scan_id}:logstream", "+", "-", count=1)
+        pipe.llen(f"scan:{scan_id}:logs")
+        (status, completed_at), services_done, has_analysis, last_log, legacy_lines = await pipe.execute()
+    if status is None and rehydrate and await _rehydrate(scan_id):
+        return await _scan_state(scan_id, rehydrate=False)
+    return {
+        "status": status,
+        "completed_at": completed_at,
+        "services_done": services_done,
+        "has_analysis": bool(has_analysis),
+        "log_cursor": f"{last_log[0][0] if last_log else '0-0'}|{legacy_lines}",
+    }
+
+
+def _scan_etag(kind: str, scan_id: str, state: dict, *extra) -> str:
+    parts = [kind, scan_id, state["status"], state["completed_at"],
+             state["services_done"], state["has_analysis"], __version__, *extra]
+    digest = hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def _last_modified(state: dict) -> Optional[str]:
+    if not state.get("completed_at"):
+        return None
+    try:
+        completed = datetime.fromisoformat(state["completed_at"]).astimezone(timezone.utc)
+    except ValueError:
+        return None
+    return format_datetime(completed, usegmt=True)
+
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[str]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Compressed representations carry an encoding suffix on the same tag
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        variants = {etag} | {f'{etag[:-1]}-{enc}"' for enc in _ENCODINGS}
+        return "*" in tags or bool(tags & variants)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _pick_encoding(request: Request) -> Optional[str]:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in _ENCODINGS:
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+async def _conditional_response(request: Request, etag: str, last_modified: Optional[str],
+                                build, media_type: str) -> Response:
+    """304 if the client's copy is current, else await build() compressed per Accept-Encoding"""
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding", "ETag": etag}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    body = await build()
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    encoding = _pick_encoding(request) if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding == "br":
+        body = await run_in_threadpool(brotli.compress, body, quality=5)
+    elif encoding == "gzip":
+        body = await run_in_threadpool(gzip.compress, body, compresslevel=6)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def _json_bytes(payload: dict) -> bytes:
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+# ── Archive read-through ───────────────────────────────────────────────────────
+# The engine compacts finished scans into archive.py's on-disk store. Once the
+# Redis copy has expired, the first request for a scan copies it back into
+# Redis for SCAN_REHYDRATE_TTL seconds and every endpoint reads Redis as usual.
+SCAN_REHYDRATE_TTL = int(os.getenv("SCAN_REHYDRATE_TTL", "900"))
+
+
+async def _archived(method: str, *args):
+    """Call a ScanArchive method in the threadpool (None if there is no archive)"""
+    def call():
+        scan_archive = archive.get_archive()
+        return getattr(scan_archive, method)(*args) if scan_archive is not None else None
+    return await run_in_threadpool(call)
+
+
+async def _rehydrate(scan_id: str) -> bool:
+    """Copy an archived scan back into Redis; False if it isn't archived"""
+    record = await _archived("get", scan_id)
+    if not record or not record.get("meta"):
+        return False
+
+    keys = {name: f"scan:{scan_id}:{name}" for name in ("meta", "findings", "services", "logstream", "insightmap")}
+    # One MULTI, and the log stream is rebuilt from scratch, so concurrent
+    # rehydrations of the same scan are harmless
+    async with redis_conn.pipeline(transaction=True) as pipe:
+        pipe.delete(keys["logstream"])
+        pipe.hset(keys["meta"], mapping=record["meta"])
+        if record.get("findings"):
+            pipe.hset(keys["findings"], mapping=record["findings"])
+        if record.get("services"):
+            pipe.hset(keys["services"], mapping=record["services"])
+        if record.get("insightmap"):
+            pipe.set(keys["insightmap"], record["insightmap"])
+        for line in record.get("logs") or []:
+            pipe.xadd(keys["logstream"], {"line": line})
+        for key in keys.values():
+            pipe.expire(key, SCAN_REHYDRATE_TTL)
+        await pipe.execute()
+    return True
+
+
+# ── Scan index ─────────────────────────────────────────────────────────────────
+# scans:index and scans:user:{user_id} are sorted sets of scan ids scored by
+# started_at (epoch seconds); /scans pages through them instead of KEYS.
+SCAN_INDEX_KEY = "scans:index"
+SCANS_PAGE_MAX = 200
+
+
+def _user_index_key(user_id: str) -> str:
+    return f"scans:user:{user_id}"
+
+
+def _index_scan(pipe, scan_id: str, user_id: str, started_at: str):
+    score = datetime.fromisoformat(started_at).timestamp()
+    pipe.zadd(SCAN_INDEX_KEY, {scan_id: score})
+    pipe.zadd(_user_index_key(user_id), {scan_id: score})
+
+
+@app.on_event("startup")
+async def backfill_scan_index():
+    """Index scans created before the sorted-set index existed (runs once)"""
+    if not redis_conn:
+        return
+    try:
+        if not await redis_conn.set(f"{SCAN_INDEX_KEY}:backfilled", "1", nx=True):
+            return
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            async for key in redis_conn.scan_iter(match="scan:*:meta", count=500):
+                meta = await redis_conn.hmget(key, "user_id", "started_at")
+                if meta[1]:
+                    _index_scan(pipe, key.split(":")[1], meta[0] or "anonymous", meta[1])
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Scan index backfill failed: {e}")
+
+
 @app.get("/scans")
-def list_scans():
-    """List all past scans from Redis"""
+async def list_scans(limit: int = 50, cursor: Optional[str] = None, user_id: Optional[str] = None,
+               status: Optional[str] = None, category: Optional[str] = None):
+    """List past scans, newest first.
+
+    Pass the returned `next_cursor` back as `cursor` for the next page.
+    """
     if not redis_conn:
         return {"scans": []}
-    
+
+    limit = max(1, min(limit, SCANS_PAGE_MAX))
+    index_key = _user_index_key(user_id) if user_id else SCAN_INDEX_KEY
     try:
-        # Find all scan meta keys
-        keys = redis_conn.keys("scan:*:meta")
-        scans = []
-        
-        for key in keys:
-            try:
-                # key format: scan:{uid}:meta
-                uid = key.split(":")[1]
-                meta = redis_conn.hgetall(key)
+        max_score = f"({cursor}" if cursor else "+inf"
+        scans, next_cursor = [], None
+        while len(scans) < limit:
+            # Over-fetch when filtering on meta fields so a page needs few round trips
+            batch = limit * 2 if (status or category) else limit - len(scans)
+            entries = await redis_conn.zrevrangebyscore(
+                index_key, max_score, "-inf", start=0, num=batch, withscores=True
+            )
+            if not entries:
+                next_cursor = None
+                break
+
+            async with redis_conn.pipeline(transaction=False) as pipe:
+                for uid, _ in entries:
+                    pipe.hmget(f"scan:{uid}:meta", "target", "category", "status", "started_at")
+                metas = await pipe.execute()
+
+            # Meta expired from Redis: archived scans are still listed
+            missing = [uid for (uid, _), meta in zip(entries, metas) if meta[3] is None]
+            archived = (await _archived("get_meta_many", missing) or {}) if missing else {}
+            stale = []
+            for (uid, score), (target, scan_type, scan_status, started_at) in zip(entries, metas):
+                if len(scans) == limit:
+                    break
+                next_cursor = repr(score)
+                if started_at is None:
+                    if uid not in archived:
+                        stale.append(uid)
+                        continue
+                    meta = archived[uid]
+                    target, scan_type, scan_status, started_at = (
+                        meta["target"], meta["category"], meta["status"], meta["started_at"]
+                    )
+                if (status and scan_status != status) or (category and scan_type != category):
+                    continue
                 scans.append({
                     "scan_id": uid,
-                    "target": meta.get("target", "Unknown"),
-                    "scan_type": meta.get("category", "Unknown"),
-                    "status": meta.get("status", "Unknown"),
-                    "timestamp": meta.get("started_at", "")
+                    "target": target or "Unknown",
+                    "scan_type": scan_type or "Unknown",
+                    "status": scan_status or "Unknown",
+                    "timestamp": started_at,
                 })
-            except:
-                continue
-        
-        # Sort by timestamp desc
-        scans.sort(key=lambda x: x["timestamp"], reverse=True)
-        return {"scans": scans}
+            if stale:
+                # Neither in Redis nor archived — drop the stale index entries
+                await redis_conn.zrem(index_key, *stale)
+            if len(entries) < batch:
+                # Index exhausted; keep a cursor only if this batch wasn't fully consumed
+                if next_cursor == repr(entries[-1][1]):
+                    next_cursor = None
+                break
+            max_score = f"({next_cursor}"
+
+        return {"scans": scans, "next_cursor": next_cursor}
     except Exception as e:
         logger.error(f"Error listing scans: {e}")
         return {"scans": [], "error": str(e)}
@@ -313,39 +633,21 @@ async def get_scan_status(scan_id: str):
          return {"status": "error", "message": "Redis unavailable"}
 
     try:
-        # Check metadata in Redis
-        meta = redis_conn.hgetall(f"scan:{scan_id}:meta")
-        if not meta:
-            return {"status": "not_found", "scan_id": scan_id}
-        
-        status = meta.get("status", "running")
-        
-        # Check individual services status from logs logic
+        # Meta and the engine's per-service state hash, one round trip
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            pipe.hget(f"scan:{scan_id}:meta", "status")
+            pipe.hgetall(f"scan:{scan_id}:services")
+            status, services = await pipe.execute()
+        if status is None:
+            if not await _rehydrate(scan_id):
+                return {"status": "not_found", "scan_id": scan_id}
+            return await get_scan_status(scan_id)
+
         services_status = {}
-        logs = redis_conn.lrange(f"scan:{scan_id}:logs", 0, -1)
-        
-        for line in logs:
-            if "🚀 Starting" in line:
-                parts = line.split("Starting ")
-                if len(parts) > 1:
-                    svc = parts[1].split("(")[0].strip().split("...")[0].strip()
-                    services_status[svc] = {"status": "running", "completed": False}
-            elif "⏳ Pending" in line:
-                parts = line.split("Pending ")
-                if len(parts) > 1:
-                    svc = parts[1].strip()
-                    if svc not in services_status:
-                        services_status[svc] = {"status": "pending", "completed": False}
-            elif "✅" in line and "completed" in line:
-                parts = line.split("] ✅ ")
-                if len(parts) > 1:
-                    svc = parts[1].split(" completed")[0].strip()
-                    services_status[svc] = {"status": "completed", "completed": True}
-            elif "❌" in line and "failed" in line:
-                 parts = line.split("] ❌ ")
-                 if len(parts) > 1:
-                    svc = parts[1].split(" failed")[0].strip()
-                    services_status[svc] = {"status": "failed", "completed": True}
+        for svc, raw in services.items():
+            state = json.loads(raw)
+            state["completed"] = state.get("status") in ("completed", "failed")
+            services_status[svc] = state
 
         return {
             "status": status,
@@ -358,684 +660,340 @@ async def get_scan_status(scan_id: str):
 
 
 @app.get("/scan/{scan_id}/logs")
-def get_scan_logs(scan_id: str):
-    """Get real-time scan logs from Redis"""
+async def get_scan_logs(scan_id: str, request: Request, since: Optional[str] = None):
+    """Get real-time scan logs from Redis.
+
+    Pass the returned `cursor` as `since` to get only the lines added after it.
+    """
     if not redis_conn:
          return {"logs": [], "error": "Redis unavailable"}
 
     try:
-        logs = redis_conn.lrange(f"scan:{scan_id}:logs", 0, -1)
-        if not logs:
-             return {"scan_id": scan_id, "logs": [], "message": "No logs found"}
-             
-        return {
-            "scan_id": scan_id,
-            "logs": logs,
-            "total_lines": len(logs)
-        }
+        # Logs are append-only, so the position of the last line is a valid validator
+        state = await _scan_state(scan_id)
+        etag = _scan_etag("logs", scan_id, state, state["log_cursor"], since)
+
+        async def build():
+            return _json_bytes(await _build_scan_logs(scan_id, since))
+        return await _conditional_response(request, etag, _last_modified(state), build, "application/json")
     except Exception as e:
         logger.error(f"Error getting logs: {e}")
         return {"scan_id": scan_id, "logs": [], "error": str(e)}
 
 
-@app.get("/scan/{scan_id}/results")
-def get_scan_results(scan_id: str):
-    """Get scan results from Redis — supports microservice JSON format"""
-    if not redis_conn:
-        raise HTTPException(status_code=500, detail="Redis unavailable")
+async def _build_scan_logs(scan_id: str, since: Optional[str] = None) -> dict:
+    stream_key = f"scan:{scan_id}:logstream"
+    async with redis_conn.pipeline(transaction=False) as pipe:
+        pipe.xrange(stream_key, f"({since}" if since else "-", "+")
+        pipe.xlen(stream_key)
+        entries, total = await pipe.execute()
+
+    if entries or total:
+        return {
+            "scan_id": scan_id,
+            "logs": [fields["line"] for _, fields in entries],
+            "total_lines": total,
+            "cursor": entries[-1][0] if entries else since,
+        }
 
-    meta = redis_conn.hgetall(f"scan:{scan_id}:meta")
-    target   = meta.get("target", "unknown")
-    category = meta.get("category", "unknown")
+    # Scans logged before the stream existed kept a plain list
+    logs = await redis_conn.lrange(f"scan:{scan_id}:logs", int(since or 0), -1)
+    if not logs and not since:
+         return {"scan_id": scan_id, "logs": [], "message": "No logs found"}
 
-    results = {
+    return {
         "scan_id": scan_id,
-        "target": target,
-        "scan_type": category,
-        "timestamp": meta.get("started_at", datetime.now().isoformat()),
-        "findings": [],
-        "insightmap_analysis": None,
+        "logs": logs,
+        "total_lines": int(since or 0) + len(logs),
+        "cursor": str(int(since or 0) + len(logs)),
     }
 
-    insightmap_raw = redis_conn.get(f"scan:{scan_id}:insightmap")
-    if insightmap_raw:
-        try:
-            results["insightmap_analysis"] = json.loads(insightmap_raw)
-        except json.JSONDecodeError:
-            logger.warning("Invalid InsightMap analysis for scan %s", scan_id)
 
-    # All service names (new + legacy compat)
-    all_services = [
-        "nmap", "nuclei", "testssl", "dirsearch", "nikto",
-        "whatweb", "arjun", "dalfox", "wafw00f", "dnsrecon",
-        "wpscan", "zap", "sslyze",
-        "nmap_white", "nmap_gray", "nmap_black",
-        "nikto_white", "nikto_black", "nuclei_white"
-    ]
-
-    for svc in all_services:
-        raw = redis_conn.get(f"scan:{scan_id}:result:{svc}")
-        if not raw:
-            continue
+# ── Server-Sent Events ─────────────────────────────────────────────────────────
+SSE_BLOCK_MS = int(os.getenv("SSE_BLOCK_MS", "15000"))
+_FINAL_STATUSES = ("completed", "failed")
+# Event IDs are "<log stream ID>|<update stream ID>"
+_EVENT_ID = re.compile(r"^(\d+-\d+)\|(\d+-\d+)$")
 
-        try:
-            data = json.loads(raw)
-        except Exception:
-            results["findings"].append({
-                "id": f"{svc}-raw", "title": f"{svc.capitalize()} Output",
-                "severity": "Info", "description": raw[:500]
-            })
-            continue
 
-        # Microservice format: {scan_id, status, findings, raw_output, metadata}
-        svc_findings = data.get("findings", [])
-        raw_output   = data.get("raw_output", "")
-        base = svc.split("_")[0]
-
-        # 1. Use service's own findings if available
-        if svc_findings:
-            for f in svc_findings:
-                results["findings"].append({
-                    "id": f"{base}-{len(results['findings'])}",
-                    "title": f.get("title", f"{base.capitalize()} Finding"),
-                    "severity": f.get("severity", "Info").capitalize(),
-                    "description": f.get("description", "")
-                })
-            continue
+@app.get("/scan/{scan_id}/events")
+async def stream_scan_events(scan_id: str, request: Request):
+    """Push log lines, service state changes and the final status as SSE.
 
-        # 2. Parse raw_output based on tool type
-        if not raw_output:
-            results["findings"].append({
-                "id": f"{base}-info", "title": f"{base.capitalize()} Completed",
-                "severity": "Info", "description": f"{base.capitalize()} scan completed — no findings."
-            })
+    Events: `log` ({"line"}), `service` (service state), `status`
+    ({"status", ...}). The stream ends after a completed/failed status.
+    Reconnecting clients resume from Last-Event-ID.
+    """
+    if stream_redis is None:
+        raise HTTPException(status_code=503, detail="Redis unavailable")
+    log_id, update_id = "0-0", "0-0"
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id:
+        resume = _EVENT_ID.match(last_event_id)
+        if resume is None:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+        log_id, update_id = resume.groups()
+    if await stream_redis.hget(f"scan:{scan_id}:meta", "status") is None and not await _rehydrate(scan_id):
+        raise HTTPException(status_code=404, detail="Scan not found")
+
+    return StreamingResponse(
+        _scan_event_stream(scan_id, log_id, update_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse(event: str, data: dict, event_id: str = None) -> str:
+    message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n"
+    if event_id:
+        message += f"id: {event_id}\n"
+    return message + "\n"
+
+
+async def _scan_event_stream(scan_id: str, log_id: str, update_id: str):
+    log_key, update_key = f"scan:{scan_id}:logstream", f"scan:{scan_id}:updates"
+    while True:
+        response = await stream_redis.xread(
+            {log_key: log_id, update_key: update_id}, count=500, block=SSE_BLOCK_MS
+        )
+        if not response:
+            # Nothing new: finished scans (or ones predating the streams) end here
+            meta = await stream_redis.hgetall(f"scan:{scan_id}:meta")
+            if not meta or meta.get("status") in _FINAL_STATUSES:
+                yield _sse("status", {"status": meta.get("status", "expired"),
+                                      "completed_at": meta.get("completed_at")})
+                return
+            yield ": keepalive\n\n"
             continue
 
-        # ── Nmap ──────────────────────────────────────────────────────────
-        if base == "nmap":
-            found = False
-            if raw_output.strip().startswith("<?xml"):
-                try:
-                    root = ET.fromstring(raw_output)
-                    for port in root.findall(".//port"):
-                        portid = port.get("portid")
-                        state = port.find("state")
-                        if state is not None and state.get("state") == "open":
-                            service = port.find("service")
-                            sn = service.get("name") if service is not None else "unknown"
-                            results["findings"].append({
-                                "id": f"nmap-{len(results['findings'])}",
-                                "title": f"Open Port: {portid} ({sn})",
-                                "severity": "Low",
-                                "description": f"Port {portid} is open running {sn}."
-                            })
-                            found = True
-                except Exception:
-                    pass
-            else:
-                for line in raw_output.splitlines():
-                    parts = line.strip().split()
-                    if len(parts) >= 2 and parts[1] == "open":
-                        results["findings"].append({
-                            "id": f"nmap-{len(results['findings'])}",
-                            "title": f"Open Port: {parts[0]} ({parts[2] if len(parts)>2 else 'unknown'})",
-                            "severity": "Low",
-                            "description": " ".join(parts)
-                        })
-                        found = True
-            if not found:
-                results["findings"].append({
-                    "id": "nmap-info", "title": "Nmap Completed", "severity": "Info",
-                    "description": raw_output[:500]
-                })
-
-        # ── Nuclei ────────────────────────────────────────────────────────
-        elif base == "nuclei":
-            found = False
-            for line in raw_output.splitlines():
-                if not line.strip():
+        finished = None
+        for key, entries in response:
+            for entry_id, fields in entries:
+                if key == log_key:
+                    log_id = entry_id
+                    yield _sse("log", {"line": fields["line"]}, f"{log_id}|{update_id}")
                     continue
-                try:
-                    finding = json.loads(line)
-                    results["findings"].append({
-                        "id": f"nuc-{len(results['findings'])}",
-                        "title": finding.get("info", {}).get("name", "Nuclei Finding"),
-                        "severity": finding.get("info", {}).get("severity", "Low").capitalize(),
-                        "description": f"Template: {finding.get('template-id')}\nMatcher: {finding.get('matcher-name','N/A')}"
-                    })
-                    found = True
-                except Exception:
-                    pass
-            if not found:
-                results["findings"].append({
-                    "id": "nuc-info", "title": "Nuclei Completed", "severity": "Info",
-                    "description": raw_output[:500] or "No vulnerabilities found."
-                })
+                update_id = entry_id
+                data = json.loads(fields["data"])
+                if fields["type"] == "status" and data.get("status") in _FINAL_STATUSES:
+                    finished = data
+                    continue
+                yield _sse(fields["type"], data, f"{log_id}|{update_id}")
+        if finished is not None:
+            # Drain log lines written alongside the final status before closing
+            tail = await stream_redis.xrange(log_key, f"({log_id}", "+")
+            for entry_id, fields in tail:
+                log_id = entry_id
+                yield _sse("log", {"line": fields["line"]}, f"{log_id}|{update_id}")
+            yield _sse("status", finished, f"{log_id}|{update_id}")
+            return
 
-        # ── Nikto ─────────────────────────────────────────────────────────
-        elif base == "nikto":
-            try:
-                ndata = json.loads(raw_output)
-                items = []
-                if isinstance(ndata, list):
-                    for entry in ndata:
-                        items.extend(entry.get("vulnerabilities", []))
-                else:
-                    items = ndata.get("vulnerabilities", [])
-                for item in items:
-                    results["findings"].append({
-                        "id": f"nikto-{len(results['findings'])}",
-                        "title": "Nikto Finding", "severity": "Medium",
-                        "description": item.get("msg", str(item))
-                    })
-                if not items:
-                    results["findings"].append({
-                        "id": "nikto-info", "title": "Nikto Completed", "severity": "Info",
-                        "description": raw_output[:500] or "No findings."
-                    })
-            except Exception:
-                results["findings"].append({
-                    "id": "nikto-info", "title": "Nikto Completed", "severity": "Info",
-                    "description": raw_output[:500]
-                })
 
-        # ── TestSSL ───────────────────────────────────────────────────────
-        elif base == "testssl":
-            try:
-                tdata = json.loads(raw_output)
-                if isinstance(tdata, list):
-                    for item in tdata:
-                        sev = item.get("severity", "INFO")
-                        if sev in ["FATAL","CRITICAL","HIGH","MEDIUM","LOW"]:
-                            results["findings"].append({
-                                "id": f"tssl-{len(results['findings'])}",
-                                "title": f"TestSSL: {item.get('id')}",
-                                "severity": sev.capitalize(),
-                                "description": item.get("finding","")
-                            })
-            except Exception:
-                results["findings"].append({
-                    "id": "tssl-info", "title": "TestSSL Completed", "severity": "Info",
-                    "description": raw_output[:500]
-                })
+@app.get("/scan/{scan_id}/results")
+async def get_scan_results(scan_id: str, request: Request):
+    """Get scan results from Redis — normalized findings written by the engine"""
+    if not redis_conn:
+        raise HTTPException(status_code=500, detail="Redis unavailable")
 
-        # ── WAF detection ─────────────────────────────────────────────────
-        elif base in ("wafw00f", "waf"):
-            results["findings"].append({
-                "id": f"waf-{len(results['findings'])}", "title": "WAF Detection",
-                "severity": "Info", "description": raw_output[:500]
-            })
-
-        # ── Everything else (dirsearch, whatweb, arjun, dalfox, dnsrecon, zap, sslyze, wpscan) ──
-        else:
-            label = {"dirsearch": "Directory Scan", "whatweb": "Technology Detection",
-                     "arjun": "Parameter Discovery", "dalfox": "XSS Scan",
-                     "dnsrecon": "DNS Reconnaissance", "zap": "ZAP Scan",
-                     "sslyze": "SSL Analysis", "wpscan": "WordPress Scan"}.get(base, f"{base.capitalize()} Scan")
-            results["findings"].append({
-                "id": f"{base}-{len(results['findings'])}", "title": label,
-                "severity": "Info", "description": raw_output[:500]
-            })
+    state = await _scan_state(scan_id)
+    etag = _scan_etag("results", scan_id, state)
 
-    return results
+    async def build():
+        return _json_bytes(await _build_scan_results(scan_id))
+    return await _conditional_response(request, etag, _last_modified(state), build, "application/json")
 
 
-    
+async def _build_scan_results(scan_id: str) -> dict:
+    async with redis_conn.pipeline(transaction=False) as pipe:
+        pipe.hgetall(f"scan:{scan_id}:meta")
+        pipe.get(f"scan:{scan_id}:insightmap")
+        pipe.hgetall(f"scan:{scan_id}:findings")
+        meta, insightmap_raw, stored = await pipe.execute()
+
     results = {
         "scan_id": scan_id,
-        "target": target,
-        "scan_type": category,
+        "target": meta.get("target", "unknown"),
+        "scan_type": meta.get("category", "unknown"),
         "timestamp": meta.get("started_at", datetime.now().isoformat()),
-        "findings": []
+        "findings": [],
+        "insightmap_analysis": None,
     }
 
-    # Helper to get content from Redis
-    def get_content(service_name):
-        return redis_conn.get(f"scan:{scan_id}:result:{service_name}")
-
-    # 1. Nuclei (Critical)
-    nuclei_found = False
-    for nuclei_svc in ["nuclei", "nuclei_white"]:
-        content = get_content(nuclei_svc)
-        if content:
-            has_findings = False
-            for line in content.splitlines():
-                if not line.strip(): continue
-                try:
-                    finding = json.loads(line)
-                    results["findings"].append({
-                        "id": f"nuc-{len(results['findings'])}",
-                        "title": finding.get("info", {}).get("name", "Unknown Vuln"),
-                        "severity": finding.get("info", {}).get("severity", "Low").capitalize(),
-                        "description": f"Template: {finding.get('template-id')}\nMatcher: {finding.get('matcher-name', 'N/A')}\nExtracted: {finding.get('extracted-results', [])}"
-                    })
-                    has_findings = True
-                    nuclei_found = True
-                except Exception as e:
-                    logger.error(f"Nuclei parsing error: {e}")
-                    results["findings"].append({
-                        "id": "err-nuc",
-                        "title": "Nuclei Parse Error",
-                        "severity": "Info",
-                        "description": f"Failed to parse output: {str(e)}"
-                    })
-            
-            # If content exists but no findings were added
-            if not has_findings and not any(f["id"].startswith("err-nuc") for f in results["findings"]):
-                results["findings"].append({
-                    "id": f"nuc-info",
-                    "title": "Nuclei Scan Completed",
-                    "severity": "Info",
-                    "description": "Nuclei scan completed successfully. No vulnerabilities found."
-                })
-                nuclei_found = True
-
-    # 2. Nikto
-    for nikto_svc in ["nikto_white", "nikto_black"]:
-        content = get_content(nikto_svc)
-        if content:
-            try:
-                data = json.loads(content)
-                items = []
-                if isinstance(data, list):
-                    for entry in data:
-                        items.extend(entry.get("vulnerabilities", []))
-                else:
-                    items = data.get("vulnerabilities", [])
-                
-                for item in items:
-                    results["findings"].append({
-                        "id": f"nikto-{len(results['findings'])}",
-                        "title": "Nikto Finding",
-                        "severity": "Medium",
-                        "description": item.get("msg", "Unknown finding")
-                    })
-            except Exception as e:
-                logger.error(f"Nikto parsing error: {e}")
-                results["findings"].append({"id": "err-nikto", "title": "Nikto Parse Error", "severity": "Info", "description": str(e)})
-
-    # 3. ZAP
-    content = get_content("zap")
-    if content:
-        try:
-            data = json.loads(content)
-            sites = data.get("site", [])
-            if isinstance(sites, dict): sites = [sites]
-            for site in sites:
-                for alert in site.get("alerts", []):
-                    risk = alert.get("riskdesc", "Medium").split(" ")[0].capitalize()
-                    results["findings"].append({
-                        "id": f"zap-{len(results['findings'])}",
-                        "title": alert.get("name", "ZAP Finding"),
-                        "severity": risk,
-                        "description": alert.get("desc", "No description provided.")
-                    })
-        except Exception as e:
-            logger.error(f"ZAP parsing error: {e}")
-            results["findings"].append({"id": "err-zap", "title": "ZAP Parse Error", "severity": "Info", "description": str(e)})
-
-    # 4. WPScan
-    content = get_content("wpscan")
-    if content:
-        try:
-            data = json.loads(content)
-            if data.get("scan_aborted"):
-                 results["findings"].append({"id": f"wps-a", "title": "WPScan Aborted", "severity": "Info", "description": data.get("scan_aborted")})
-            else:
-                # Add parsing if needed
-                pass 
-        except Exception as e:
-            logger.error(f"WPScan parsing error: {e}")
-            results["findings"].append({"id": "err-wps", "title": "WPScan Parse Error", "severity": "Info", "description": str(e)})
-
-    # 5. Nmap
-    for nmap_svc in ["nmap_white", "nmap_gray", "nmap_black"]:
-        content = get_content(nmap_svc)
-        if content:
-            try:
-                root = ET.fromstring(content)
-                for port in root.findall(".//port"):
-                    portid = port.get("portid")
-                    state = port.find("state")
-                    if state is not None and state.get("state") == "open":
-                        service = port.find("service")
-                        svc_name = service.get("name") if service is not None else "unknown"
-                        results["findings"].append({
-                            "id": f"nmap-{len(results['findings'])}",
-                            "title": f"Open Port: {portid} ({svc_name})",
-                            "severity": "Low",
-                            "description": f"Port {portid} is open."
-                        })
-            except: pass
-
-    # 6. Dirsearch
-    content = get_content("dirsearch")
-    if content:
-        try:
-            data = json.loads(content)
-            entries = data if isinstance(data, list) else data.get("results", [])
-            for entry in entries:
-                if entry.get("status") in [200, 204, 301, 302, 307]:
-                    results["findings"].append({
-                        "id": f"dir-{len(results['findings'])}",
-                        "title": f"Directory: {entry.get('path')}",
-                        "severity": "Info",
-                        "description": f"URL: {entry.get('url')} ({entry.get('status')})"
-                    })
-        except Exception as e:
-            logger.error(f"Dirsearch parsing error: {e}")
-            results["findings"].append({"id": "err-dirsearch", "title": "Dirsearch Parse Error", "severity": "Info", "description": str(e)})
-
-    # 7. SSLyze (Simplified)
-    content = get_content("sslyze")
-    if content:
-         results["findings"].append({"id": "ssl-info", "title": "SSLyze Completed", "severity": "Info", "description": "SSL Scan finished."})
-
-
-    # 8. TestSSL
-    content = get_content("testssl")
-    if content:
-        try:
-            data = json.loads(content)
-            if isinstance(data, list):
-                for item in data:
-                   sev = item.get("severity", "INFO")
-                   if sev in ["FATAL", "CRITICAL", "HIGH", "MEDIUM", "LOW"]:
-                       results["findings"].append({
-                           "id": f"tssl-{len(results['findings'])}",
-                           "title": f"TestSSL: {item.get('id')}",
-                           "severity": sev.capitalize(),
-                           "description": item.get("finding")
-                       })
-        except Exception as e:
-            logger.error(f"TestSSL parsing error: {e}")
-            results["findings"].append({"id": "err-testssl", "title": "TestSSL Parse Error", "severity": "Info", "description": str(e)})
-
-    # 9. WhatWeb
-    content = get_content("whatweb")
-    if content:
-        try:
-            data = json.loads(content)
-            for entry in data:
-                plugins = entry.get("plugins", {})
-                results["findings"].append({
-                    "id": f"ww-{len(results['findings'])}",
-                    "title": "WhatWeb Tech Detected",
-                    "severity": "Info",
-                    "description": ", ".join(plugins.keys())
-                })
-        except: pass
-
-    # 10. Arjun
-    content = get_content("arjun")
-    if content:
+    if insightmap_raw:
         try:
-            data = json.loads(content)
-            has_params = False
-            for url, params in data.items():
-                if params:
-                    results["findings"].append({
-                        "id": f"arj-{len(results['findings'])}",
-                        "title": "Hidden Parameters",
-                        "severity": "Medium",
-                        "description": f"Params: {', '.join(params)}"
-                    })
-                    has_params = True
-            
-            if not has_params:
-                results["findings"].append({
-                    "id": "arj-info",
-                    "title": "Arjun Scan Completed",
-                    "severity": "Info",
-                    "description": "Arjun scan completed. No hidden parameters found."
-                })
-        except Exception as e:
-            logger.error(f"Arjun parsing error: {e}")
-            results["findings"].append({"id": "err-arjun", "title": "Arjun Parse Error", "severity": "Info", "description": str(e)})
+            results["insightmap_analysis"] = json.loads(insightmap_raw)
+        except json.JSONDecodeError:
+            logger.warning("Invalid InsightMap analysis for scan %s", scan_id)
 
-    # 11. Dalfox
-    content = get_content("dalfox")
-    if content:
-        try:
-             items = []
-             has_findings = False
-             
-             # Try to parse as JSON array or line-by-line JSON
-             if content.strip().startswith("["):
-                 try: items = json.loads(content)
-                 except: pass
-             else:
-                 for line in content.splitlines():
-                     if line.strip():
-                         try: items.append(json.loads(line))
-                         except: pass
-             
-             for item in items:
-                # Dalfox JSON structure varies, try multiple key patterns
-                # Common keys: data, message, message_str, url, param, poc, payload, type
-                
-                # Extract URL/Target
-                url_val = (item.get('data') or item.get('url') or 
-                          item.get('target') or item.get('message_str') or "")
-                
-                # Extract Parameter
-                param_val = item.get('param') or item.get('parameter') or ""
-                
-                # Extract Payload/POC
-                poc_val = item.get('poc') or item.get('payload') or item.get('evidence') or ""
-                
-                # Extract vulnerability type
-                vuln_type = item.get('type') or item.get('cwe') or 'XSS'
-                
-                # Only add if we have meaningful data (not all N/A)
-                if url_val or param_val or poc_val:
-                    results["findings"].append({
-                        "id": f"dal-{len(results['findings'])}",
-                        "title": f"XSS Vulnerability: {vuln_type}",
-                        "severity": "High",
-                        "description": f"URL: {url_val if url_val else 'Not specified'}\nParameter: {param_val if param_val else 'Not specified'}\nPayload: {poc_val if poc_val else 'Not specified'}"
-                    })
-                    has_findings = True
-             
-             # If content exists but no valid findings parsed, add info message
-             if not has_findings and content.strip():
-                 results["findings"].append({
-                     "id": "dal-info",
-                     "title": "Dalfox Scan Completed",
-                     "severity": "Info",
-                     "description": f"Dalfox scan completed. Raw output length: {len(content)} bytes. No XSS vulnerabilities detected."
-                 })
-        except Exception as e:
-            logger.error(f"Dalfox parsing error: {e}")
-            results["findings"].append({
-                "id": "err-dalfox",
-                "title": "Dalfox Parse Error",
-                "severity": "Info",
-                "description": f"Failed to parse Dalfox output: {str(e)}"
-            })
-
-    # 12. Wafw00f
-    content = get_content("wafw00f")
-    if content:
-        try:
-            data = json.loads(content)
-            if isinstance(data, list):
-                for entry in data:
-                    firewall = entry.get("firewall", "None")
-                    if firewall and firewall != "None":
-                         results["findings"].append({
-                             "id": f"waf-{len(results['findings'])}",
-                             "title": f"WAF: {firewall}",
-                             "severity": "Info",
-                             "description": "WAF Detected"
-                         })
-        except: pass
-
-    # 13. DNSRecon
-    content = get_content("dnsrecon")
-    if content:
-        try:
-            data = json.loads(content)
-            if isinstance(data, list) and len(data) > 0:
-                # Group records by type for better readability
-                record_types = {}
-                for record in data:
-                    rec_type = record.get('type', 'Unknown')
-                    if rec_type not in record_types:
-                        record_types[rec_type] = []
-                    record_types[rec_type].append(record)
-                
-                # Create findings for each record type
-                for rec_type, records in record_types.items():
-                    record_details = []
-                    # Show ALL records (no limit)
-                    for rec in records:
-                        name = rec.get('name', rec.get('hostname', 'N/A'))
-                        address = rec.get('address', rec.get('target', rec.get('exchange', 'N/A')))
-                        record_details.append(f"  • {name} → {address}")
-                    
-                    results["findings"].append({
-                        "id": f"dns-{rec_type.lower()}-{len(results['findings'])}",
-                        "title": f"DNS Records: {rec_type} ({len(records)} found)",
-                        "severity": "Info",
-                        "description": "\n".join(record_details) if record_details else f"Found {len(records)} {rec_type} records"
-                    })
-        except Exception as e:
-            logger.error(f"DNSRecon parsing error: {e}")
-            results["findings"].append({
-                "id": "err-dns",
-                "title": "DNSRecon Parse Error",
-                "severity": "Info",
-                "description": f"Failed to parse DNSRecon output: {str(e)}"
-            })
+    if stored:
+        per_service = {svc: json.loads(findings) for svc, findings in stored.items()}
+    else:
+        # Scans stored before ingestion-time parsing: parse the raw results
+        per_service = await _parse_legacy_results(scan_id)
 
+    for svc in sorted(per_service, key=_service_order):
+        results["findings"].extend(per_service[svc])
     return results
 
 
+# Result display order (new + legacy compat names)
+RESULT_SERVICES = [
+    "nmap", "nuclei", "testssl", "dirsearch", "nikto",
+    "whatweb", "arjun", "dalfox", "wafw00f", "dnsrecon",
+    "wpscan", "zap", "sslyze",
+    "nmap_white", "nmap_gray", "nmap_black",
+    "nikto_white", "nikto_black", "nuclei_white"
+]
+
+
+def _service_order(service: str):
+    if service in RESULT_SERVICES:
+        return (RESULT_SERVICES.index(service), service)
+    return (len(RESULT_SERVICES), service)
+
+
+async def _parse_legacy_results(scan_id: str) -> dict:
+    raws = await redis_conn.mget([f"scan:{scan_id}:result:{svc}" for svc in RESULT_SERVICES])
+
+    # Parsing large tool output is CPU work — keep it off the event loop
+    def parse():
+        return {
+            svc: parsers.parse_result(svc, result_store.decode_result(raw, load_raw=True))
+            for svc, raw in zip(RESULT_SERVICES, raws) if raw
+        }
+    return await run_in_threadpool(parse)
+
+
 @app.get("/report/{scan_id}", response_class=HTMLResponse)
-async def get_scan_report_html(scan_id: str):
+async def get_scan_report_html(scan_id: str, request: Request):
     """Generate and serve a standalone HTML report for a scan"""
     try:
-        # Reuse existing logic to get results
-        # Assuming get_scan_results is synchronous as defined in main.py
-        results_data = get_scan_results(scan_id)
-        
-        target = results_data.get("target", "Unknown")
-        scan_type = results_data.get("scan_type", "Unknown")
-        timestamp = results_data.get("timestamp", "Unknown")
-        findings = results_data.get("findings", [])
-        
-        # Calculate Severity Counts
-        counts = {"Critical": 0, "High": 0, "Medium": 0, "Low": 0, "Info": 0}
-        for f in findings:
-            sev = f.get("severity", "Info")
-            if sev in counts: counts[sev] += 1
-            else: counts["Info"] += 1
-
-        import html as _html
-        _target = _html.escape(str(target))
-        _scan_type = _html.escape(str(scan_type))
-        _timestamp = _html.escape(str(timestamp))
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Scan Report - {_target}</title>
-            <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-            <style>
-                body {{ background-color: #f4f6f9; }}
-                .severity-Critical {{ background-color: #dc3545; color: white; }}
-                .severity-High {{ background-color: #fd7e14; color: white; }}
-                .severity-Medium {{ background-color: #ffc107; color: black; }}
-                .severity-Low {{ background-color: #0dcaf0; color: white; }}
-                .severity-Info {{ background-color: #6c757d; color: white; }}
-                .card {{ border: none; box-shadow: 0 0.125rem 0.25rem rgba(0,0,0,0.075); margin-bottom: 20px; }}
-            </style>
-        </head>
-        <body>
-            <div class="container py-5">
-                <div class="header d-flex justify-content-between align-items-center mb-5">
-                    <div>
-                        <h1 class="display-5 fw-bold text-dark">PentaaS OneClick Report</h1>
-                        <p class="text-muted mb-0">Scan ID: {scan_id}</p>
-                    </div>
-                    <div class="text-end">
-                        <h3 class="fw-bold">{_target}</h3>
-                        <span class="badge bg-dark fs-6">{_scan_type.upper()}</span>
-                        <span class="badge bg-secondary fs-6">{_timestamp}</span>
-                    </div>
-                </div>
+        state = await _scan_state(scan_id)
+        etag = _scan_etag("report", scan_id, state)
 
-                <!-- Summary Cards -->
-                <div class="row g-3 mb-5">
-                    <div class="col"><div class="card p-3 text-center border-top border-4 border-danger"><h3 class="text-danger fw-bold">{counts['Critical']}</h3><span class="text-muted">Critical</span></div></div>
-                    <div class="col"><div class="card p-3 text-center border-top border-4 border-warning"><h3 class="text-warning fw-bold">{counts['High']}</h3><span class="text-muted">High</span></div></div>
-                    <div class="col"><div class="card p-3 text-center border-top border-4 border-warning" style="border-color: #ffc107 !important;"><h3 class="text-dark fw-bold">{counts['Medium']}</h3><span class="text-muted">Medium</span></div></div>
-                    <div class="col"><div class="card p-3 text-center border-top border-4 border-info"><h3 class="text-info fw-bold">{counts['Low']}</h3><span class="text-muted">Low</span></div></div>
-                    <div class="col"><div class="card p-3 text-center border-top border-4 border-secondary"><h3 class="text-secondary fw-bold">{counts['Info']}</h3><span class="text-muted">Info</span></div></div>
-                </div>
+        async def build():
+            return _render_report(scan_id, await _build_scan_results(scan_id))
+        return await _conditional_response(request, etag, _last_modified(state), build,
+                                           "text/html; charset=utf-8")
+    except Exception as e:
+        logger.error(f"Error generating report: {e}")
+        return HTMLResponse(content=f"<h1>Error generating report</h1><p>{str(e)}</p>", status_code=500)
 
-                <!-- Detailed Findings -->
-                <div class="card">
-                    <div class="card-header bg-white py-3">
-                        <h4 class="mb-0 fw-bold">Detailed Findings</h4>
-                    </div>
-                    <div class="card-body p-0">
-                        <div class="table-responsive">
-                            <table class="table table-hover mb-0 align-middle">
-                                <thead class="bg-light">
-                                    <tr>
-                                        <th style="width: 100px;">Severity</th>
-                                        <th style="width: 200px;">ID</th>
-                                        <th>Finding / Title</th>
-                                        <th>Description / Info</th>
-                                    </tr>
-                                </thead>
-                                <tbody>
-        """
-        
-        if not findings:
-            html_content += '<tr><td colspan="4" class="text-center p-4">No vulnerabilities found. System appears secure.</td></tr>'
-        else:
-            for f in findings:
-                sev_class = f"severity-{f.get('severity', 'Info')}"
-                fid = f.get('id', 'N/A')
-                title = f.get('title', 'N/A')
-                desc = f.get('description', '')
-                if len(desc) > 300: desc = desc[:300] + "..."
-                
-                # HTML Escape (simple)
-                title = str(title).replace("<", "&lt;").replace(">", "&gt;")
-                desc = str(desc).replace("<", "&lt;").replace(">", "&gt;").replace("\\n", "<br>")
-
-                html_content += f"""
-                <tr>
-                    <td><span class="badge {sev_class} w-100 py-2">{f.get('severity', 'Info')}</span></td>
-                    <td class="text-secondary small">{fid}</td>
-                    <td class="fw-bold">{title}</td>
-                    <td class="text-muted small">{desc}</td>
-                </tr>
-                """
-
-        html_content += """
-                                </tbody>
-                            </table>
-                        </div>
-                    </div>
+
+def _render_report(scan_id: str, results_data: dict) -> str:
+    """Standalone HTML report for a scan"""
+    
+    target = results_data.get("target", "Unknown")
+    scan_type = results_data.get("scan_type", "Unknown")
+    timestamp = results_data.get("timestamp", "Unknown")
+    findings = results_data.get("findings", [])
+    
+    # Calculate Severity Counts
+    counts = {"Critical": 0, "High": 0, "Medium": 0, "Low": 0, "Info": 0}
+    for f in findings:
+        sev = f.get("severity", "Info")
+        if sev in counts: counts[sev] += 1
+        else: counts["Info"] += 1
+
+    import html as _html
+    _target = _html.escape(str(target))
+    _scan_type = _html.escape(str(scan_type))
+    _timestamp = _html.escape(str(timestamp))
+    html_content = f"""
+    <!DOCTYPE html>
+    <html lang="en">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>Scan Report - {_target}</title>
+        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
+        <style>
+            body {{ background-color: #f4f6f9; }}
+            .severity-Critical {{ background-color: #dc3545; color: white; }}
+            .severity-High {{ background-color: #fd7e14; color: white; }}
+            .severity-Medium {{ background-color: #ffc107; color: black; }}
+            .severity-Low {{ background-color: #0dcaf0; color: white; }}
+            .severity-Info {{ background-color: #6c757d; color: white; }}
+            .card {{ border: none; box-shadow: 0 0.125rem 0.25rem rgba(0,0,0,0.075); margin-bottom: 20px; }}
+        </style>
+    </head>
+    <body>
+        <div class="container py-5">
+            <div class="header d-flex justify-content-between align-items-center mb-5">
+                <div>
+                    <h1 class="display-5 fw-bold text-dark">PentaaS OneClick Report</h1>
+                    <p class="text-muted mb-0">Scan ID: {scan_id}</p>
                 </div>
-                
-                <div class="text-center mt-5 text-muted">
-                    <small>Generated by PentaaS OneClick Scanner | Zafer Karaca</small>
+                <div class="text-end">
+                    <h3 class="fw-bold">{_target}</h3>
+                    <span class="badge bg-dark fs-6">{_scan_type.upper()}</span>
+                    <span class="badge bg-secondary fs-6">{_timestamp}</span>
                 </div>
             </div>
-        </body>
-        </html>
-        """
-        
-        return HTMLResponse(content=html_content, status_code=200)
 
-    except Exception as e:
-        logger.error(f"Error generating report: {e}")
-        return HTMLResponse(content=f"<h1>Error generating report</h1><p>{str(e)}</p>", status_code=500)
+            <!-- Summary Cards -->
+            <div class="row g-3 mb-5">
+                <div class="col"><div class="card p-3 text-center border-top border-4 border-danger"><h3 class="text-danger fw-bold">{counts['Critical']}</h3><span class="text-muted">Critical</span></div></div>
+                <div class="col"><div class="card p-3 text-center border-top border-4 border-warning"><h3 class="text-warning fw-bold">{counts['High']}</h3><span class="text-muted">High</span></div></div>
+                <div class="col"><div class="card p-3 text-center border-top border-4 border-warning" style="border-color: #ffc107 !important;"><h3 class="text-dark fw-bold">{counts['Medium']}</h3><span class="text-muted">Medium</span></div></div>
+                <div class="col"><div class="card p-3 text-center border-top border-4 border-info"><h3 class="text-info fw-bold">{counts['Low']}</h3><span class="text-muted">Low</span></div></div>
+                <div class="col"><div class="card p-3 text-center border-top border-4 border-secondary"><h3 class="text-secondary fw-bold">{counts['Info']}</h3><span class="text-muted">Info</span></div></div>
+            </div>
+
+            <!-- Detailed Findings -->
+            <div class="card">
+                <div class="card-header bg-white py-3">
+                    <h4 class="mb-0 fw-bold">Detailed Findings</h4>
+                </div>
+                <div class="card-body p-0">
+                    <div class="table-responsive">
+                        <table class="table table-hover mb-0 align-middle">
+                            <thead class="bg-light">
+                                <tr>
+                                    <th style="width: 100px;">Severity</th>
+                                    <th style="width: 200px;">ID</th>
+                                    <th>Finding / Title</th>
+                                    <th>Description / Info</th>
+                                </tr>
+                            </thead>
+                            <tbody>
+    """
+    
+    if not findings:
+        html_content += '<tr><td colspan="4" class="text-center p-4">No vulnerabilities found. System appears secure.</td></tr>'
+    else:
+        for f in findings:
+            sev_class = f"severity-{f.get('severity', 'Info')}"
+            fid = f.get('id', 'N/A')
+            title = f.get('title', 'N/A')
+            desc = f.get('description', '')
+            if len(desc) > 300: desc = desc[:300] + "..."
+            
+            # HTML Escape (simple)
+            title = str(title).replace("<", "&lt;").replace(">", "&gt;")
+            desc = str(desc).replace("<", "&lt;").replace(">", "&gt;").replace("\\n", "<br>")
+
+            html_content += f"""
+            <tr>
+                <td><span class="badge {sev_class} w-100 py-2">{f.get('severity', 'Info')}</span></td>
+                <td class="text-secondary small">{fid}</td>
+                <td class="fw-bold">{title}</td>
+                <td class="text-muted small">{desc}</td>
+            </tr>
+            """
+
+    html_content += """
+                            </tbody>
+                        </table>
+                    </div>
+                </div>
+            </div>
+            
+            <div class="text-center mt-5 text-muted">
+                <small>Generated by PentaaS OneClick Scanner | Zafer Karaca</small>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    return html_content
@@ -0,0 +1,164 @@
+"""
+Tool result parsers
+Turn a tool service's /results payload into the normalized findings the API
+serves ({id, title, severity, description, service}). The engine runs them
+once when a result is stored; the API only reads the output.
+"""
+import json
+import logging
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# tool name -> parser(service, raw_output) -> list of findings
+PARSERS: Dict[str, Callable[[str, str], List[dict]]] = {}
+
+# Labels for tools whose raw output is shown as a single summary finding
+SUMMARY_LABELS = {
+    "dirsearch": "Directory Scan", "whatweb": "Technology Detection",
+    "arjun": "Parameter Discovery", "dalfox": "XSS Scan",
+    "dnsrecon": "DNS Reconnaissance", "zap": "ZAP Scan",
+    "sslyze": "SSL Analysis", "wpscan": "WordPress Scan",
+    "wafw00f": "WAF Detection",
+}
+
+
+def register_parser(*tools: str):
+    """Register a raw-output parser for one or more tools"""
+    def decorator(func):
+        for tool in tools:
+            PARSERS[tool] = func
+        return func
+    return decorator
+
+
+def _finding(service: str, index: int, title: str, severity: str, description: str) -> dict:
+    return {
+        "id": f"{service}-{index}",
+        "title": title,
+        "severity": severity,
+        "description": description,
+        "service": service,
+    }
+
+
+def _completed(service: str, raw_output: str, fallback: str = "No findings.") -> List[dict]:
+    return [_finding(service, 0, f"{service.capitalize()} Completed", "Info",
+                     raw_output[:500] or fallback)]
+
+
+def parse_result(service: str, raw) -> List[dict]:
+    """Normalized findings for one stored tool result.
+
+    `service` may carry a legacy suffix (nmap_white); the base tool name
+    picks the parser. Services that already return structured findings are
+    used as-is; otherwise raw_output goes through the tool's parser.
+    """
+    base = service.split("_")[0]
+    try:
+        data = json.loads(raw)
+    except (TypeError, ValueError):
+        return [_finding(base, 0, f"{base.capitalize()} Output", "Info", str(raw)[:500])]
+    if not isinstance(data, dict):
+        data = {"raw_output": raw}
+
+    svc_findings = data.get("findings") or []
+    if svc_findings:
+        return [
+            _finding(base, i,
+                     f.get("title", f"{base.capitalize()} Finding"),
+                     str(f.get("severity", "Info")).capitalize(),
+                     f.get("description", ""))
+            for i, f in enumerate(svc_findings)
+        ]
+
+    raw_output = data.get("raw_output") or ""
+    if not raw_output:
+        return [_finding(base, 0, f"{base.capitalize()} Completed", "Info",
+                         f"{base.capitalize()} scan completed — no findings.")]
+
+    parser = PARSERS.get(base, _parse_summary)
+    try:
+        return parser(base, raw_output)
+    except Exception as e:
+        logger.warning("Parser for %s failed: %s", base, e)
+        return _completed(base, raw_output)
+
+
+@register_parser("nmap")
+def _parse_nmap(service: str, raw_output: str) -> List[dict]:
+    findings = []
+    if raw_output.strip().startswith("<?xml"):
+        try:
+            root = ET.fromstring(raw_output)
+        except ET.ParseError:
+            root = None
+        for port in root.findall(".//port") if root is not None else []:
+            state = port.find("state")
+            if state is not None and state.get("state") == "open":
+                svc = port.find("service")
+                name = svc.get("name") if svc is not None else "unknown"
+                findings.append(_finding(service, len(findings),
+                                         f"Open Port: {port.get('portid')} ({name})", "Low",
+                                         f"Port {port.get('portid')} is open running {name}."))
+    else:
+        for line in raw_output.splitlines():
+            parts = line.strip().split()
+            if len(parts) >= 2 and parts[1] == "open":
+                findings.append(_finding(service, len(findings),
+                                         f"Open Port: {parts[0]} ({parts[2] if len(parts) > 2 else 'unknown'})",
+                                         "Low", " ".join(parts)))
+    return findings or [_finding(service, 0, "Nmap Completed", "Info", raw_output[:500])]
+
+
+@register_parser("nuclei")
+def _parse_nuclei(service: str, raw_output: str) -> List[dict]:
+    findings = []
+    for line in raw_output.splitlines():
+        if not line.strip():
+            continue
+        try:
+            finding = json.loads(line)
+        except ValueError:
+            continue
+        findings.append(_finding(
+            service, len(findings),
+            finding.get("info", {}).get("name", "Nuclei Finding"),
+            finding.get("info", {}).get("severity", "Low").capitalize(),
+            f"Template: {finding.get('template-id')}\nMatcher: {finding.get('matcher-name', 'N/A')}",
+        ))
+    return findings or _completed(service, raw_output, "No vulnerabilities found.")
+
+
+@register_parser("nikto")
+def _parse_nikto(service: str, raw_output: str) -> List[dict]:
+    ndata = json.loads(raw_output)
+    items = []
+    if isinstance(ndata, list):
+        for entry in ndata:
+            items.extend(entry.get("vulnerabilities", []))
+    else:
+        items = ndata.get("vulnerabilities", [])
+    findings = [
+        _finding(service, i, "Nikto Finding", "Medium", item.get("msg", str(item)))
+        for i, item in enumerate(items)
+    ]
+    return findings or _completed(service, raw_output)
+
+
+@register_parser("testssl")
+def _parse_testssl(service: str, raw_output: str) -> List[dict]:
+    tdata = json.loads(raw_output)
+    findings = []
+    for item in tdata if isinstance(tdata, list) else []:
+        sev = item.get("severity", "INFO")
+        if sev in ["FATAL", "CRITICAL", "HIGH", "MEDIUM", "LOW"]:
+            findings.append(_finding(service, len(findings), f"TestSSL: {item.get('id')}",
+                                     sev.capitalize(), item.get("finding", "")))
+    return findings
+
+
+def _parse_summary(service: str, raw_output: str) -> List[dict]:
+    label = SUMMARY_LABELS.get(service, f"{service.capitalize()} Scan")
+    return [_finding(service, 0, label, "Info", raw_output[:500])]
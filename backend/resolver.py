@@ -0,0 +1,114 @@
+"""
+Async DNS resolution
+A/AAAA/PTR lookups run in parallel with timeouts; answers are cached in
+Redis for their DNS TTL so repeated scans of a host skip the network.
+"""
+import os
+import json
+import socket
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import dns.asyncresolver
+    import dns.exception
+    import dns.resolver
+    _resolver = dns.asyncresolver.Resolver()
+except ImportError:  # dnspython is optional — fall back to the system resolver
+    _resolver = None
+
+DNS_TIMEOUT = float(os.getenv("DNS_TIMEOUT", "3"))
+DNS_CACHE_MIN_TTL = int(os.getenv("DNS_CACHE_MIN_TTL", "30"))
+DNS_CACHE_MAX_TTL = int(os.getenv("DNS_CACHE_MAX_TTL", "3600"))
+DNS_NEGATIVE_TTL = int(os.getenv("DNS_NEGATIVE_TTL", "60"))
+
+
+def _clamp_ttl(ttl: int) -> int:
+    return max(DNS_CACHE_MIN_TTL, min(int(ttl), DNS_CACHE_MAX_TTL))
+
+
+async def _cached(cache, key: str, lookup):
+    """Return a cached answer or run `lookup` -> (value, ttl) and cache it"""
+    if cache is not None:
+        try:
+            hit = await cache.get(key)
+            if hit is not None:
+                return json.loads(hit)
+        except Exception as e:
+            logger.warning("DNS cache read failed for %s: %s", key, e)
+
+    value, ttl = await lookup()
+
+    if cache is not None:
+        try:
+            await cache.set(key, json.dumps(value), ex=ttl)
+        except Exception as e:
+            logger.warning("DNS cache write failed for %s: %s", key, e)
+    return value
+
+
+async def _query(name: str, rdtype: str):
+    """(addresses, ttl) for one record type; empty on NXDOMAIN/no answer"""
+    try:
+        answer = await _resolver.resolve(name, rdtype, lifetime=DNS_TIMEOUT)
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        return [], DNS_NEGATIVE_TTL
+    except (dns.exception.DNSException, OSError) as e:
+        logger.info("DNS %s lookup for %s failed: %s", rdtype, name, e)
+        return [], DNS_NEGATIVE_TTL
+    return sorted({rdata.address for rdata in answer}), _clamp_ttl(answer.rrset.ttl)
+
+
+async def _system_lookup(name: str):
+    """Resolver of last resort: getaddrinfo (covers /etc/hosts, no TTL)"""
+    loop = asyncio.get_running_loop()
+    try:
+        infos = await asyncio.wait_for(
+            loop.getaddrinfo(name, None, type=socket.SOCK_STREAM), DNS_TIMEOUT
+        )
+    except (OSError, asyncio.TimeoutError):
+        return {"ipv4": [], "ipv6": []}
+    ipv4 = sorted({info[4][0] for info in infos if info[0] == socket.AF_INET})
+    ipv6 = sorted({info[4][0] for info in infos if info[0] == socket.AF_INET6})
+    return {"ipv4": ipv4, "ipv6": ipv6}
+
+
+async def resolve_host(name: str, cache=None) -> dict:
+    """Every IPv4/IPv6 address of `name`: {"ipv4": [...], "ipv6": [...]}"""
+    name = name.rstrip(".").lower()
+
+    async def lookup_rdtype(rdtype):
+        return await _cached(cache, f"dns:{rdtype}:{name}", lambda: _query(name, rdtype))
+
+    if _resolver is not None:
+        ipv4, ipv6 = await asyncio.gather(lookup_rdtype("A"), lookup_rdtype("AAAA"))
+        if ipv4 or ipv6:
+            return {"ipv4": ipv4, "ipv6": ipv6}
+
+    async def system():
+        return await _system_lookup(name), DNS_CACHE_MIN_TTL
+
+    return await _cached(cache, f"dns:sys:{name}", system)
+
+
+async def reverse_lookup(ip: str, cache=None):
+    """PTR name of `ip`, or None"""
+    async def lookup():
+        if _resolver is not None:
+            try:
+                answer = await _resolver.resolve_address(ip, lifetime=DNS_TIMEOUT)
+                return str(answer[0].target).rstrip("."), _clamp_ttl(answer.rrset.ttl)
+            except (dns.exception.DNSException, OSError):
+                return None, DNS_NEGATIVE_TTL
+        loop = asyncio.get_running_loop()
+        try:
+            host = await asyncio.wait_for(
+                loop.run_in_executor(None, socket.gethostbyaddr, ip), DNS_TIMEOUT
+            )
+            return host[0], DNS_CACHE_MIN_TTL
+        except (OSError, asyncio.TimeoutError):
+            return None, DNS_NEGATIVE_TTL
+
+    return await _cached(cache, f"dns:PTR:{ip}", lookup)
@@ -0,0 +1,128 @@
+"""
+Result payload encoding
+Tool /results payloads are compressed before they go into Redis, and raw
+outputs above RAW_OUTPUT_SPILL_BYTES are written to a local blob store with
+only a reference and a bounded preview left in the payload. Blobs live as
+long as the scan they belong to is in Redis or in the archive.
+"""
+import os
+import json
+import time
+import base64
+import shutil
+import logging
+from typing import Callable, List, Optional
+
+import archive
+
+logger = logging.getLogger(__name__)
+
+RESULT_BLOB_DIR = os.getenv("RESULT_BLOB_DIR", "/app/archive/blobs")
+RAW_OUTPUT_SPILL_BYTES = int(os.getenv("RAW_OUTPUT_SPILL_BYTES", str(256 * 1024)))
+RAW_OUTPUT_PREVIEW_BYTES = int(os.getenv("RAW_OUTPUT_PREVIEW_BYTES", "4096"))
+# Payloads smaller than this are stored as plain JSON
+RESULT_COMPRESS_MIN_BYTES = int(os.getenv("RESULT_COMPRESS_MIN_BYTES", "1024"))
+
+# Redis clients decode responses, so compressed payloads are stored as
+# "enc:<codec>:<base64>"; anything else is a plain JSON payload.
+_PREFIX = "enc:"
+
+
+def encode_result(uid: str, service: str, content: str) -> str:
+    """Redis value for a service's /results payload"""
+    try:
+        payload = json.loads(content)
+    except ValueError:
+        payload = None
+    if isinstance(payload, dict):
+        raw_output = payload.get("raw_output")
+        if isinstance(raw_output, str) and len(raw_output.encode("utf-8")) > RAW_OUTPUT_SPILL_BYTES:
+            try:
+                payload["raw_output_ref"] = _spill(uid, service, raw_output)
+                # Cut on the encoded bytes; a split trailing character is dropped
+                preview = raw_output.encode("utf-8")[:RAW_OUTPUT_PREVIEW_BYTES]
+                payload["raw_output"] = preview.decode("utf-8", "ignore")
+                content = json.dumps(payload, ensure_ascii=False)
+            except OSError as e:
+                logger.warning("Could not spill %s raw output for %s: %s", service, uid, e)
+
+    data = content.encode("utf-8")
+    if len(data) < RESULT_COMPRESS_MIN_BYTES:
+        return content
+    codec, blob = archive.compress(data)
+    return f"{_PREFIX}{codec}:{base64.b64encode(blob).decode('ascii')}"
+
+
+def decode_result(stored: Optional[str], load_raw: bool = False) -> Optional[str]:
+    """The JSON payload behind a stored value (plain or encoded).
+
+    With `load_raw`, a spilled raw_output is read back from the blob store.
+    """
+    if stored is None:
+        return None
+    if stored.startswith(_PREFIX):
+        codec, _, encoded = stored[len(_PREFIX):].partition(":")
+        stored = archive.decompress(codec, base64.b64decode(encoded)).decode("utf-8")
+    if not load_raw or "raw_output_ref" not in stored:
+        return stored
+
+    payload = json.loads(stored)
+    ref = payload.pop("raw_output_ref", None)
+    if ref:
+        try:
+            payload["raw_output"] = _load_spilled(ref)
+        except OSError as e:
+            logger.warning("Spilled raw output %s unavailable: %s", ref.get("path"), e)
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def _spill(uid: str, service: str, raw_output: str) -> dict:
+    data = raw_output.encode("utf-8")
+    codec, blob = archive.compress(data)
+    relative = os.path.join(uid, f"{service}.raw.{codec}")
+    path = os.path.join(RESULT_BLOB_DIR, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return {"path": relative, "codec": codec, "size": len(data)}
+
+
+def _load_spilled(ref: dict) -> str:
+    root = os.path.realpath(RESULT_BLOB_DIR)
+    path = os.path.realpath(os.path.join(root, ref["path"]))
+    if not path.startswith(root + os.sep):
+        raise OSError(f"blob path outside {RESULT_BLOB_DIR}")
+    with open(path, "rb") as f:
+        return archive.decompress(ref["codec"], f.read()).decode("utf-8")
+
+
+def delete_blobs(uid: str) -> None:
+    """Remove every spilled raw output of a scan"""
+    if not uid or os.path.basename(uid) != uid:
+        raise ValueError(f"invalid scan id: {uid!r}")
+    shutil.rmtree(os.path.join(RESULT_BLOB_DIR, uid), ignore_errors=True)
+
+
+def prune_blobs(keep: Callable[[str], bool], min_age: float = 0) -> List[str]:
+    """Delete the blobs of every scan for which `keep(uid)` is false.
+
+    Scans whose blobs were written less than `min_age` seconds ago are left
+    alone. Returns the scan ids whose blobs were removed.
+    """
+    cutoff = time.time() - min_age
+    removed = []
+    try:
+        entries = list(os.scandir(RESULT_BLOB_DIR))
+    except FileNotFoundError:
+        return removed
+    for entry in entries:
+        try:
+            if not entry.is_dir() or entry.stat().st_mtime > cutoff or keep(entry.name):
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed.append(entry.name)
+    return removed
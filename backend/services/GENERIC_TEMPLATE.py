@@ -5,7 +5,6 @@ sys.path.append('/app')
 
 from services.base.tool_service import BaseToolService
 from services.base.models import Finding
-import subprocess
 from typing import Dict, Any
 
 
@@ -21,7 +20,7 @@ class GenericToolService(BaseToolService):
         cmd = [self.tool_command, target]
         
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+            result = await self.run_process(cmd, timeout=300)
             
             return {
                 "findings": [],  # Parse output to create findings
@@ -18,6 +18,8 @@ class ScanRequest(BaseModel):
 class ScanResponse(BaseModel):
     scan_id: str
     status: ScanStatus
+    # Seconds the scan may run once started, if the tool bounds it
+    timeout: Optional[int] = None
 
 
 class ScanStatusResponse(BaseModel):
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from .models import ScanStatus
+
+
+# Scans in these states are never evicted — the engine is still waiting on them
+ACTIVE_STATES = {ScanStatus.QUEUED.value, ScanStatus.RUNNING.value}
+
+
+class ScanStateStore(ABC):
+    """Storage for per-scan state (status, target, options, progress, message)"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, scan_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the scan state, or None if unknown/expired"""
+
+    @abstractmethod
+    def put(self, scan_id: str, state: Dict[str, Any]):
+        """Create or replace the scan state"""
+
+    def update(self, scan_id: str, **fields):
+        """Merge fields into an existing scan state"""
+        state = self.get(scan_id)
+        if state is None:
+            return
+        state.update(fields)
+        self.put(scan_id, state)
+
+    def recover_interrupted(self):
+        """Fail scans that were queued/running when the process died"""
+
+    def __contains__(self, scan_id: str) -> bool:
+        return self.get(scan_id) is not None
+
+    def __getitem__(self, scan_id: str) -> Dict[str, Any]:
+        state = self.get(scan_id)
+        if state is None:
+            raise KeyError(scan_id)
+        return state
+
+    def __setitem__(self, scan_id: str, state: Dict[str, Any]):
+        self.put(scan_id, state)
+
+
+def _normalize(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Store plain strings so every backend round-trips the same way"""
+    state = dict(state)
+    status = state.get("status")
+    if isinstance(status, ScanStatus):
+        state["status"] = status.value
+    return state
+
+
+class MemoryStateStore(ScanStateStore):
+    """In-process LRU with TTL eviction; finished scans go first"""
+
+    def __init__(self, ttl: int, max_entries: int):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, scan_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(scan_id)
+        if entry is None:
+            return None
+        updated_at, state = entry
+        if time.time() - updated_at > self.ttl and state.get("status") not in ACTIVE_STATES:
+            del self._entries[scan_id]
+            return None
+        self._entries.move_to_end(scan_id)
+        return dict(state)
+
+    def put(self, scan_id: str, state: Dict[str, Any]):
+        self._entries[scan_id] = (time.time(), _normalize(state))
+        self._entries.move_to_end(scan_id)
+        self._evict()
+
+    def _evict(self):
+        now = time.time()
+        for scan_id, (updated_at, state) in list(self._entries.items()):
+            if len(self._entries) <= self.max_entries and now - updated_at <= self.ttl:
+                break
+            if state.get("status") not in ACTIVE_STATES:
+                del self._entries[scan_id]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteStateStore(ScanStateStore):
+    """Scan state persisted in SQLite so it survives container restarts"""
+
+    def __init__(self, ttl: int, path: str):
+        super().__init__(ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scans ("
+            " scan_id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS scans_updated ON scans (updated_at)")
+        self._last_purge = 0.0
+
+    def get(self, scan_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, status, updated_at FROM scans WHERE scan_id = ?", (scan_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        state, status, updated_at = row
+        if time.time() - updated_at > self.ttl and status not in ACTIVE_STATES:
+            return None
+        return json.loads(state)
+
+    def put(self, scan_id: str, state: Dict[str, Any]):
+        state = _normalize(state)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scans (scan_id, status, state, updated_at) VALUES (?, ?, ?, ?)",
+                (scan_id, state.get("status", ""), json.dumps(state), now),
+            )
+            if now - self._last_purge > 60:
+                self._last_purge = now
+                self._conn.execute(
+                    "DELETE FROM scans WHERE updated_at < ? AND status NOT IN (?, ?)",
+                    (now - self.ttl, *ACTIVE_STATES),
+                )
+
+    def recover_interrupted(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT scan_id, state FROM scans WHERE status IN (?, ?)", tuple(ACTIVE_STATES)
+            ).fetchall()
+        for scan_id, state in rows:
+            state = json.loads(state)
+            state["status"] = ScanStatus.FAILED.value
+            state["message"] = "Scan interrupted by service restart"
+            self.put(scan_id, state)
+
+
+def create_state_store(service_name: str, results_dir: str) -> ScanStateStore:
+    """Build the store selected by SCAN_STATE_BACKEND (memory | sqlite)"""
+    backend = os.getenv("SCAN_STATE_BACKEND", "memory").lower()
+    ttl = int(os.getenv("SCAN_STATE_TTL", "86400"))
+    if backend == "sqlite":
+        path = os.getenv("SCAN_STATE_DB", os.path.join(results_dir, f".{service_name}_state.db"))
+        store = SQLiteStateStore(ttl, path)
+        store.recover_interrupted()
+        return store
+    return MemoryStateStore(ttl, int(os.getenv("SCAN_STATE_MAX_ENTRIES", "1000")))
@@ -3,12 +3,51 @@ from abc import ABC, abstractmethod
 import uuid
 import os
 import json
+import signal
 import asyncio
-from typing import Dict, Any
+import shutil
+import inspect
+import tempfile
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Callable
 from .models import (
     ScanRequest, ScanResponse, ScanStatusResponse, 
     ScanResultsResponse, HealthResponse, ScanStatus
 )
+from .state_store import create_state_store
+
+try:
+    from redis.asyncio import Redis as AsyncRedis
+except ImportError:  # redis is optional — without it the engine falls back to polling
+    AsyncRedis = None
+
+
+# Workspace directory of the scan running in the current task
+_current_workspace: ContextVar[Optional[str]] = ContextVar("scan_workspace", default=None)
+# Id of the scan running in the current task
+_current_scan_id: ContextVar[Optional[str]] = ContextVar("scan_id", default=None)
+
+# Tools like nuclei/dalfox emit single JSON lines far above asyncio's 64 KiB default
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+@dataclass
+class ProcessResult:
+    """Outcome of a tool process run through ``BaseToolService.run_process``"""
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+
+
+class ToolTimeoutError(TimeoutError):
+    """A tool ran past its run_process timeout; ``result`` holds the partial output"""
+
+    def __init__(self, cmd: List[str], timeout: float, result: ProcessResult):
+        super().__init__(f"{cmd[0]} timed out after {timeout:g}s")
+        self.result = result
 
 
 class BaseToolService(ABC):
@@ -18,9 +57,27 @@ class BaseToolService(ABC):
         self.service_name = service_name
         self.version = version
         self.app = FastAPI(title=f"{service_name} Service")
-        self.scans: Dict[str, Dict[str, Any]] = {}
-        self.results_dir = os.getenv("RESULTS_DIR", "/data/results")
+        # RESULTS_DIR may be shared between services; each keeps its results
+        # files in its own subdirectory so scan ids can't collide
+        results_root = os.getenv("RESULTS_DIR", "/data/results")
+        self.results_dir = os.path.join(results_root, service_name)
         os.makedirs(self.results_dir, exist_ok=True)
+        self.scans = create_state_store(service_name, results_root)
+        self.redis_url = os.getenv("REDIS_URL")
+        self._events_redis = None
+        
+        # Bounded executor: MAX_CONCURRENT_SCANS slots, FIFO queue behind them
+        self.max_concurrent_scans = max(1, int(os.getenv("MAX_CONCURRENT_SCANS", "2")))
+        self.max_queue_depth = max(0, int(os.getenv("MAX_QUEUE_DEPTH", "20")))
+        self.retry_after = int(os.getenv("QUEUE_RETRY_AFTER", "30"))
+        self._pending: deque = deque()
+        self._running: Dict[str, asyncio.Task] = {}
+        # Findings reported by scans that are still running
+        self._partial_findings: Dict[str, List[Dict[str, Any]]] = {}
+        
+        # Per-scan temp workspaces. Docker caps /dev/shm at 64MB by default,
+        # so tmpfs is opt-in (SCAN_WORKSPACE_ROOT=/dev/shm plus a shm_size)
+        self.workspace_root = os.getenv("SCAN_WORKSPACE_ROOT") or tempfile.gettempdir()
         
         # Register routes
         self._register_routes()
@@ -39,10 +96,25 @@ class BaseToolService(ABC):
         @self.app.get("/ready")
         async def ready():
             """Readiness check"""
-            return {"ready": True, "service": self.service_name}
+            return {
+                "ready": True,
+                "service": self.service_name,
+                "slots": self.max_concurrent_scans,
+                "running": len(self._running),
+                "queued": len(self._pending),
+                "max_queue_depth": self.max_queue_depth,
+            }
         
         @self.app.post("/scan", response_model=ScanResponse)
         async def create_scan(request: ScanRequest):
+            if (len(self._running) >= self.max_concurrent_scans
+                    and len(self._pending) >= self.max_queue_depth):
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"{self.service_name} queue is full",
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+            
             scan_id = str(uuid.uuid4())
             
             # Store scan info
@@ -52,17 +124,27 @@ class BaseToolService(ABC):
                 "status": ScanStatus.QUEUED
             }
             
-            # Start scan asynchronously in background
-            asyncio.create_task(self._execute_scan(scan_id, request.target, request.options))
+            # Queue the scan; it starts as soon as a slot is free
+            self._pending.append(scan_id)
+            self._dispatch()
             
-            return ScanResponse(scan_id=scan_id, status=ScanStatus.QUEUED)
+            return ScanResponse(scan_id=scan_id, status=ScanStatus.QUEUED,
+                                timeout=self.time_budget(request.options or {}))
         
         @self.app.get("/status/{scan_id}", response_model=ScanStatusResponse)
         async def get_status(scan_id: str):
-            if scan_id not in self.scans:
+            scan_info = self._get_scan(scan_id)
+            if scan_info is None:
                 raise HTTPException(status_code=404, detail="Scan not found")
             
-            scan_info = self.scans[scan_id]
+            if scan_info["status"] == ScanStatus.QUEUED and scan_id in self._pending:
+                position = self._pending.index(scan_id) + 1
+                return ScanStatusResponse(
+                    scan_id=scan_id,
+                    status=ScanStatus.QUEUED,
+                    progress=0,
+                    message=f"Queued: position {position} of {len(self._pending)}"
+                )
             return ScanStatusResponse(
                 scan_id=scan_id,
                 status=scan_info["status"],
@@ -72,18 +154,20 @@ class BaseToolService(ABC):
         
         @self.app.get("/results/{scan_id}", response_model=ScanResultsResponse)
         async def get_results(scan_id: str):
-            if scan_id not in self.scans:
+            scan_info = self._get_scan(scan_id)
+            if scan_info is None:
                 raise HTTPException(status_code=404, detail="Scan not found")
             
-            scan_info = self.scans[scan_id]
             
             # Load results from file
             results_file = os.path.join(self.results_dir, f"{scan_id}.json")
             if not os.path.exists(results_file):
+                partial = self._partial_findings.get(scan_id)
                 return ScanResultsResponse(
                     scan_id=scan_id,
                     status=scan_info["status"],
-                    findings=[]
+                    findings=list(partial or []),
+                    metadata={"partial": True} if partial is not None else None
                 )
             
             with open(results_file, 'r') as f:
@@ -97,10 +181,85 @@ class BaseToolService(ABC):
                 metadata=results.get("metadata")
             )
     
+    def _dispatch(self):
+        """Start queued scans (FIFO) while there are free slots"""
+        while self._pending and len(self._running) < self.max_concurrent_scans:
+            scan_id = self._pending.popleft()
+            scan_info = self.scans.get(scan_id)
+            if scan_info is None:
+                continue
+            task = asyncio.create_task(
+                self._execute_scan(scan_id, scan_info["target"], scan_info["options"])
+            )
+            self._running[scan_id] = task
+            task.add_done_callback(lambda _t, sid=scan_id: self._on_scan_done(sid))
+
+    def _get_scan(self, scan_id: str) -> Optional[Dict[str, Any]]:
+        """Scan state from the store, falling back to a results file on disk.
+
+        After a restart (or once the entry has been evicted) a finished scan
+        is still known through ``RESULTS_DIR/{service_name}/{scan_id}.json``; the state is
+        rebuilt from it and put back into the store.
+        """
+        scan_info = self.scans.get(scan_id)
+        if scan_info is not None:
+            return scan_info
+        results_file = os.path.join(self.results_dir, f"{scan_id}.json")
+        try:
+            with open(results_file, 'r') as f:
+                results = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(results, dict):
+            return None
+        if results.get("error"):
+            scan_info = {"status": ScanStatus.FAILED, "message": results["error"]}
+        else:
+            scan_info = {"status": ScanStatus.COMPLETED}
+        self.scans.put(scan_id, scan_info)
+        return scan_info
+
+    def _on_scan_done(self, scan_id: str):
+        self._running.pop(scan_id, None)
+        self._dispatch()
+
+    @property
+    def workspace(self) -> str:
+        """Private temp directory of the scan being executed.
+
+        Created before ``scan()`` runs and removed once its results are
+        persisted, so concurrent scans in one container never share files.
+        """
+        workspace = _current_workspace.get()
+        if workspace is None:
+            raise RuntimeError("workspace is only available while a scan is running")
+        return workspace
+
+    def workspace_path(self, name: str) -> str:
+        """Path of a file inside the current scan's workspace"""
+        return os.path.join(self.workspace, name)
+
+    def add_partial_findings(self, findings: List[Dict[str, Any]]):
+        """Expose findings of the running scan on /results before it completes"""
+        scan_id = _current_scan_id.get()
+        if scan_id is None:
+            return
+        self._partial_findings.setdefault(scan_id, []).extend(findings)
+
+    def report_progress(self, progress: int, message: Optional[str] = None):
+        """Publish progress (0-100) of the running scan on /status"""
+        scan_id = _current_scan_id.get()
+        if scan_id is None:
+            return
+        self.scans.update(scan_id, progress=max(0, min(100, int(progress))), message=message)
+
     async def _execute_scan(self, scan_id: str, target: str, options: Dict[str, Any]):
         """Execute the scan (to be implemented by subclasses)"""
+        workspace = tempfile.mkdtemp(prefix=f"{self.service_name}-{scan_id}-", dir=self.workspace_root)
+        token = _current_workspace.set(workspace)
+        scan_token = _current_scan_id.set(scan_id)
         try:
-            self.scans[scan_id]["status"] = ScanStatus.RUNNING
+            self.scans.update(scan_id, status=ScanStatus.RUNNING)
             
             # Call the tool-specific scan method
             results = await self.scan(target, options)
@@ -110,12 +269,12 @@ class BaseToolService(ABC):
             with open(results_file, 'w') as f:
                 json.dump(results, f, indent=2)
             
-            self.scans[scan_id]["status"] = ScanStatus.COMPLETED
+            self.scans.update(scan_id, status=ScanStatus.COMPLETED)
             print(f"[{self.service_name}] Scan {scan_id} completed successfully")
+            await self._publish_event(scan_id, options, ScanStatus.COMPLETED)
         except Exception as e:
             error_msg = f"Scan failed: {type(e).__name__}: {str(e)}"
-            self.scans[scan_id]["status"] = ScanStatus.FAILED
-            self.scans[scan_id]["message"] = error_msg
+            self.scans.update(scan_id, status=ScanStatus.FAILED, message=error_msg)
             print(f"[{self.service_name}] Scan {scan_id} failed: {error_msg}")
             
             # Save partial results if any
@@ -125,7 +284,120 @@ class BaseToolService(ABC):
                     json.dump({"error": error_msg, "findings": []}, f, indent=2)
             except:
                 pass
+            await self._publish_event(scan_id, options, ScanStatus.FAILED, error_msg)
+        finally:
+            self._partial_findings.pop(scan_id, None)
+            _current_scan_id.reset(scan_token)
+            _current_workspace.reset(token)
+            shutil.rmtree(workspace, ignore_errors=True)
     
+    async def _publish_event(self, scan_id: str, options: Dict[str, Any],
+                             status: ScanStatus, message: Optional[str] = None):
+        """Push a completion/failure event to the caller's Redis channel.
+
+        The engine passes ``notify_channel`` in the scan options and waits on
+        it instead of polling ``/status``. Publishing is best effort: if Redis
+        is not configured or unreachable the engine's fallback poll still
+        picks up the final state.
+        """
+        channel = (options or {}).get("notify_channel")
+        if not channel or not self.redis_url or AsyncRedis is None:
+            return
+        try:
+            if self._events_redis is None:
+                self._events_redis = AsyncRedis.from_url(self.redis_url, decode_responses=True)
+            await self._events_redis.publish(channel, json.dumps({
+                "scan_id": scan_id,
+                "service": self.service_name,
+                "status": status.value,
+                "message": message,
+            }))
+        except Exception as e:
+            print(f"[{self.service_name}] Could not publish event for {scan_id}: {e}")
+    
+    async def run_process(self, cmd: List[str], timeout: float = 300,
+                          on_stdout: Optional[Callable[[str], Any]] = None,
+                          on_stderr: Optional[Callable[[str], Any]] = None,
+                          cwd: Optional[str] = None, check_timeout: bool = True) -> ProcessResult:
+        """Run a tool without blocking the event loop.
+
+        stdout/stderr are streamed line by line (optionally into the given
+        callbacks, which may be coroutines) so /status and /health stay
+        responsive while the tool runs. Inside a scan the process runs in
+        the scan's workspace unless ``cwd`` is given. On timeout the
+        process group is killed and ToolTimeoutError is raised, so the scan
+        is marked failed rather than completed with truncated output; with
+        ``check_timeout=False`` the partial output is returned instead, with
+        ``timed_out=True``. On cancellation the process is killed and the
+        cancellation propagates.
+        """
+        if cwd is None:
+            cwd = _current_workspace.get()
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            limit=STREAM_LIMIT,
+            start_new_session=True,
+        )
+        stdout: List[str] = []
+        stderr: List[str] = []
+
+        async def pump(stream, sink, callback):
+            async for raw in stream:
+                line = raw.decode(errors="replace")
+                sink.append(line)
+                if callback is not None:
+                    ret = callback(line.rstrip("\n"))
+                    if inspect.isawaitable(ret):
+                        await ret
+
+        timed_out = False
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                pump(proc.stdout, stdout, on_stdout),
+                pump(proc.stderr, stderr, on_stderr),
+                proc.wait(),
+            ), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await self._kill_process(proc)
+        except BaseException:
+            await self._kill_process(proc)
+            raise
+
+        result = ProcessResult(
+            returncode=proc.returncode,
+            stdout="".join(stdout),
+            stderr="".join(stderr),
+            timed_out=timed_out,
+        )
+        if timed_out and check_timeout:
+            raise ToolTimeoutError(cmd, timeout, result)
+        return result
+
+    @staticmethod
+    async def _kill_process(proc):
+        """Kill a tool and any children it spawned (own session/process group)"""
+        if proc.returncode is not None:
+            return
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        await proc.wait()
+
+    def time_budget(self, options: Dict[str, Any]) -> Optional[int]:
+        """Longest a scan with these options may run, in seconds (None: unknown).
+
+        Reported from POST /scan so callers can wait long enough.
+        """
+        return None
+
     @abstractmethod
     async def scan(self, target: str, options: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -1,7 +1,6 @@
 ﻿import sys
 sys.path.append('/app')
 from services.base.tool_service import BaseToolService
-import subprocess
 from typing import Dict, Any
 
 class DirsearchService(BaseToolService):
@@ -10,7 +9,7 @@ class DirsearchService(BaseToolService):
     
     async def scan(self, target: str, options: Dict[str, Any]) -> Dict[str, Any]:
         cmd = ['dirsearch', '-u', target, '--format=json']
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        result = await self.run_process(cmd, timeout=300)
         return {'findings': [], 'raw_output': result.stdout, 'metadata': {'command': ' '.join(cmd)}}
 
 if __name__ == '__main__':
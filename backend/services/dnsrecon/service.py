@@ -1,7 +1,6 @@
 ﻿import sys
 sys.path.append('/app')
 from services.base.tool_service import BaseToolService
-import subprocess
 from typing import Dict, Any
 
 class DnsreconService(BaseToolService):
@@ -10,7 +9,7 @@ class DnsreconService(BaseToolService):
     
     async def scan(self, target: str, options: Dict[str, Any]) -> Dict[str, Any]:
         cmd = ['dnsrecon', target]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        result = await self.run_process(cmd, timeout=300)
         return {'findings': [], 'raw_output': result.stdout, 'metadata': {'command': ' '.join(cmd)}}
 
 if __name__ == '__main__':
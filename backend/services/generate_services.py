@@ -17,7 +17,6 @@ TOOLS_CONFIG = {
 SERVICE_TEMPLATE = """import sys
 sys.path.append('/app')
 from services.base.tool_service import BaseToolService
-import subprocess
 from typing import Dict, Any
 
 class {class_name}Service(BaseToolService):
@@ -26,7 +25,7 @@ class {class_name}Service(BaseToolService):
     
     async def scan(self, target: str, options: Dict[str, Any]) -> Dict[str, Any]:
         cmd = ["{tool_cmd}", target]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        result = await self.run_process(cmd, timeout=300)
         return {{
             "findings": [],
             "raw_output": result.stdout,
@@ -3,7 +3,6 @@ import os
 import json
 sys.path.append('/app')
 from services.base.tool_service import BaseToolService
-import subprocess
 from typing import Dict, Any
 
 class NiktoService(BaseToolService):
@@ -13,7 +12,7 @@ class NiktoService(BaseToolService):
     async def scan(self, target: str, options: Dict[str, Any]) -> Dict[str, Any]:
         # Nikto doesn't have native JSON output, so we'll parse text output
         cmd = ['nikto', '-h', target, '-nointeractive']
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        result = await self.run_process(cmd, timeout=300)
         
         # Parse Nikto output and create findings
         findings = []
@@ -1,12 +1,103 @@
 import sys
 import os
+import re
+import time
+import asyncio
 sys.path.append('/app')
 
 from services.base.tool_service import BaseToolService
 from services.base.models import Finding
-import subprocess
+import copy
 import xml.etree.ElementTree as ET
-from typing import Dict, Any, List
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+
+# Two-stage mode: a fast, rate-controlled sweep of every port, then version
+# detection / NSE scripts only on the ports found open.
+NMAP_STAGED = os.getenv("NMAP_STAGED", "true").lower() in ("1", "true", "yes")
+# Upper bound in seconds for the whole scan (both stages); a profile's
+# host_timeout can only lower it (see scan_budget)
+NMAP_TIMEOUT = int(os.getenv("NMAP_TIMEOUT", "1800"))
+NMAP_DISCOVERY_TIMEOUT = int(os.getenv("NMAP_DISCOVERY_TIMEOUT", "900"))
+
+# Full-port sweeps are split into port-range/host shards run as parallel
+# nmap processes; at most NMAP_CPU_BUDGET of them run at once per container.
+NMAP_CPU_BUDGET = max(1, int(os.getenv("NMAP_CPU_BUDGET", str(os.cpu_count() or 1))))
+NMAP_PORT_SHARDS = max(1, int(os.getenv("NMAP_PORT_SHARDS", str(NMAP_CPU_BUDGET))))
+NMAP_STATS_INTERVAL = os.getenv("NMAP_STATS_INTERVAL", "15s")
+
+# Timing/rate profiles. min_rate is the aggregate packets/s floor of a
+# full-port sweep (0 leaves it to nmap's congestion control).
+PERF_PROFILES = {
+    "fast": {"timing": 4, "min_rate": 1000, "max_retries": 2, "host_timeout": "30m"},
+    "balanced": {"timing": 4, "min_rate": 300, "max_retries": 3, "host_timeout": "45m"},
+    "accurate": {"timing": 3, "min_rate": 0, "max_retries": 6, "host_timeout": "60m"},
+}
+CATEGORY_PROFILES = {
+    "white": "fast",
+    "gray": "balanced",
+    "black": "accurate",
+    "basic": "balanced",
+}
+# A shard that loses probes is re-run once at half its rate, down to this floor
+NMAP_MIN_RATE_FLOOR = int(os.getenv("NMAP_MIN_RATE_FLOOR", "100"))
+
+MAX_PORT = 65535
+
+# "SYN Stealth Scan Timing: About 23.45% done; ETC: 12:01 (0:00:41 remaining)"
+_PROGRESS_RE = re.compile(r"About ([\d.]+)% done")
+# --stats-every lines, kept out of raw_output
+_STATS_RE = re.compile(r"^(Stats: |.*Timing: About )")
+# -v output as each port is found: "Discovered open port 443/tcp on 192.0.2.1"
+_DISCOVERED_RE = re.compile(r"^Discovered open port (\d+)/(\w+) on (\S+)")
+# Packet loss warnings: probes dropped by the path or ports given up on
+_LOSS_RE = re.compile(r"dropped probes|giving up on port")
+
+# Detection flags per profile, applied to the open ports in stage two
+DETECTION_ARGS = {
+    "white": ["-sV"],
+    "gray": ["-sV", "-sC"],
+    "black": ["-A"],
+}
+
+
+def perf_profile(category: str, override=None) -> Dict[str, Any]:
+    """Timing profile for a category; `override` is a profile name or a dict of fields"""
+    profile = dict(PERF_PROFILES[CATEGORY_PROFILES.get(category, "balanced")])
+    if isinstance(override, str):
+        if override not in PERF_PROFILES:
+            raise ValueError(f"Unknown nmap perf profile: {override}")
+        profile = dict(PERF_PROFILES[override])
+    elif isinstance(override, dict):
+        profile.update({k: v for k, v in override.items() if k in profile})
+    return profile
+
+
+def _seconds(duration) -> float:
+    """nmap time spec ("90", "500ms", "30s", "45m", "2h") in seconds"""
+    value = str(duration).strip()
+    for suffix, scale in (("ms", 0.001), ("s", 1), ("m", 60), ("h", 3600)):
+        if value.endswith(suffix):
+            return float(value[:-len(suffix)]) * scale
+    return float(value)
+
+
+def scan_budget(profile: Dict[str, Any]) -> int:
+    """Seconds a scan with this profile may take: its host_timeout, at most NMAP_TIMEOUT"""
+    return int(min(NMAP_TIMEOUT, _seconds(profile["host_timeout"])))
+
+
+def _timing_args(profile: Dict[str, Any]) -> List[str]:
+    return [
+        f"-T{int(profile['timing'])}",
+        "--max-retries", str(int(profile["max_retries"])),
+        "--host-timeout", str(profile["host_timeout"]),
+    ]
+
+
+# (ip, port, protocol) already published as partial findings by this scan
+_live_ports: ContextVar[Optional[set]] = ContextVar("nmap_live_ports", default=None)
 
 
 class NmapService(BaseToolService):
@@ -14,13 +105,34 @@ class NmapService(BaseToolService):
     
     def __init__(self):
         super().__init__(service_name="nmap", version="1.0.0")
+        # Shared by every scan in this container
+        self._shard_slots = asyncio.Semaphore(NMAP_CPU_BUDGET)
     
+    def time_budget(self, options: Dict[str, Any]) -> Optional[int]:
+        scan_type = options.get("category") or options.get("scan_type", "basic")
+        try:
+            return scan_budget(perf_profile(scan_type, options.get("perf_profile")))
+        except (ValueError, KeyError):
+            return None  # the scan itself reports the bad profile
+
     async def scan(self, target: str, options: Dict[str, Any]) -> Dict[str, Any]:
         """Execute Nmap scan"""
         
-        # Determine scan type from options
-        scan_type = options.get("scan_type", "basic")
-        
+        # The engine sends the scan category; scan_type is the older name
+        scan_type = options.get("category") or options.get("scan_type", "basic")
+        profile = perf_profile(scan_type, options.get("perf_profile"))
+        budget = scan_budget(profile)
+        _live_ports.set(set())
+
+        # Scan every resolved address; dual-stack targets get an IPv4 and
+        # an IPv6 run (see _by_family) whose reports are merged
+        hosts = options.get("addresses") or [target]
+
+        output_file = self.workspace_path("nmap.xml")
+        staged = options.get("staged", NMAP_STAGED)
+        if scan_type in DETECTION_ARGS and staged:
+            return await self._staged_scan(scan_type, profile, hosts, output_file, budget)
+
         if scan_type == "white":
             nmap_args = ["-sV", "-p-", "--open"]
         elif scan_type == "gray":
@@ -31,17 +143,13 @@ class NmapService(BaseToolService):
             nmap_args = ["-sV", "-p", "80,443,8080,8443"]
         
         # Run Nmap
-        output_file = f"/tmp/nmap_{target.replace('.', '_')}.xml"
-        cmd = ["nmap"] + nmap_args + ["-oX", output_file, target]
-        
-        try:
-            # Increased timeout to 30 minutes for full port scans
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=1800)
-            raw_output = result.stdout
-        except subprocess.TimeoutExpired:
-            raw_output = f"Scan timed out after 1800 seconds. Command: {' '.join(cmd)}"
-        except Exception as e:
-            raw_output = f"Error running nmap: {str(e)}"
+        if "-p-" in nmap_args:
+            nmap_args.remove("-p-")
+            stage = await self._run_sharded("scan", nmap_args, hosts, output_file,
+                                            budget, profile, progress_span=(0, 100))
+        else:
+            stage = await self._run_per_family("scan", nmap_args + _timing_args(profile), hosts,
+                                               output_file, budget)
         
         # Parse XML output
         findings = []
@@ -51,56 +159,317 @@ class NmapService(BaseToolService):
         
         return {
             "findings": [f.dict() for f in findings],
-            "raw_output": raw_output,
+            "raw_output": stage.pop("output"),
             "metadata": {
                 "scan_type": scan_type,
-                "command": " ".join(cmd)
+                "command": stage["command"],
+                "shards": stage.get("shards", 1),
+                "perf_profile": profile,
+                "rate_adjustments": stage.get("rate_adjustments", []),
             }
         }
+
+    async def _staged_scan(self, scan_type: str, profile: Dict[str, Any], hosts: List[str],
+                           output_file: str, budget: float) -> Dict[str, Any]:
+        """Full-port discovery sweep, then detection on the open ports only"""
+        deadline = time.monotonic() + budget
+
+        discovery_file = self.workspace_path("discovery.xml")
+        discovery = await self._run_sharded("discovery", ["--open", "-n"], hosts, discovery_file,
+                                            min(NMAP_DISCOVERY_TIMEOUT, budget), profile,
+                                            progress_span=(0, 60))
+        open_ports = self._open_ports(discovery_file) if os.path.exists(discovery_file) else []
+        discovery["open_ports"] = len(open_ports)
+        stages = [discovery]
+
+        result_file = discovery_file
+        if open_ports:
+            self.report_progress(60, f"detection: {len(open_ports)} open ports")
+            detection_args = DETECTION_ARGS[scan_type] + _timing_args(profile) + ["-p", ",".join(open_ports)]
+            remaining = max(deadline - time.monotonic(), 60)
+            detection = await self._run_per_family("detection", detection_args, hosts,
+                                                   output_file, remaining)
+            stages.append(detection)
+            if os.path.exists(output_file):
+                result_file = output_file
+
+        findings = self._parse_nmap_xml(result_file) if os.path.exists(result_file) else []
+        return {
+            "findings": [f.dict() for f in findings],
+            "raw_output": "\n".join(stage.pop("output") for stage in stages),
+            "metadata": {
+                "scan_type": scan_type,
+                "mode": "staged",
+                "command": " && ".join(stage["command"] for stage in stages),
+                "stages": stages,
+                "perf_profile": profile,
+                "rate_adjustments": discovery["rate_adjustments"],
+            }
+        }
+
+    async def _run_stage(self, name: str, cmd: List[str], timeout: float,
+                         on_stdout=None) -> Dict[str, Any]:
+        """Run one nmap invocation; returns its timing, command and output"""
+        started = time.monotonic()
+        timed_out = False
+
+        def handle_line(line):
+            match = _DISCOVERED_RE.match(line)
+            if match:
+                self._live_port(*match.groups())
+            if on_stdout is not None:
+                on_stdout(line)
+
+        try:
+            # A timed-out stage still yields the ports found so far
+            result = await self.run_process(cmd, timeout=timeout, on_stdout=handle_line,
+                                            check_timeout=False)
+            timed_out = result.timed_out
+            if timed_out:
+                output = f"Scan timed out after {int(timeout)} seconds. Command: {' '.join(cmd)}"
+            else:
+                output = "".join(line for line in result.stdout.splitlines(True)
+                                 if not _STATS_RE.match(line))
+        except Exception as e:
+            output = f"Error running nmap: {str(e)}"
+        return {
+            "name": name,
+            "command": " ".join(cmd),
+            "duration": round(time.monotonic() - started, 2),
+            "timed_out": timed_out,
+            "output": output,
+        }
+
+    async def _run_per_family(self, name: str, nmap_args: List[str], hosts: List[str],
+                              output_file: str, timeout: float) -> Dict[str, Any]:
+        """One nmap run per address family, merged into `output_file`"""
+        families = _by_family(hosts)
+        if len(families) == 1:
+            family, family_hosts = families[0]
+            cmd = ["nmap", "-v"] + nmap_args + family + ["-oX", output_file] + family_hosts
+            return await self._run_stage(name, cmd, timeout)
+
+        started = time.monotonic()
+        xml_files = [self.workspace_path(f"{name}-ipv{6 if family else 4}.xml") for family, _ in families]
+        results = await asyncio.gather(*(
+            self._run_stage(name, ["nmap", "-v"] + nmap_args + family + ["-oX", xml_file] + family_hosts, timeout)
+            for (family, family_hosts), xml_file in zip(families, xml_files)
+        ))
+        self._merge_xml(xml_files, output_file)
+        return {
+            "name": name,
+            "command": " & ".join(r["command"] for r in results),
+            "duration": round(time.monotonic() - started, 2),
+            "timed_out": any(r["timed_out"] for r in results),
+            "output": "\n".join(r["output"] for r in results),
+        }
+
+    async def _run_sharded(self, name: str, nmap_args: List[str], hosts: List[str], output_file: str,
+                           timeout: float, profile: Dict[str, Any], progress_span=(0, 100)) -> Dict[str, Any]:
+        """Full-port sweep split into shards; their XML is merged into `output_file`.
+
+        Each shard's "About N% done" lines are averaged into the scan's
+        /status progress, scaled into `progress_span`. The profile's
+        min_rate is divided between the shards; a shard that reports
+        packet loss is re-run once at half its rate.
+        """
+        shards = self._shards(hosts)
+        deadline = time.monotonic() + timeout
+        started = time.monotonic()
+        progress = [0.0] * len(shards)
+        adjustments = []
+        low, high = progress_span
+        shard_rate = profile["min_rate"] // len(shards) if profile["min_rate"] else 0
+        if shard_rate:
+            shard_rate = max(shard_rate, NMAP_MIN_RATE_FLOOR)
+
+        def report(index, value):
+            progress[index] = value
+            done = sum(1 for p in progress if p >= 100)
+            overall = low + (high - low) * sum(progress) / (100 * len(shards))
+            self.report_progress(overall, f"{name}: {done}/{len(shards)} shards done")
+
+        async def run_shard(index, ports, family, shard_hosts):
+            xml_file = self.workspace_path(f"{name}-{index}.xml")
+            rate = shard_rate
+            retried = False
+            while True:
+                cmd = ["nmap", "-v"] + nmap_args + family + _timing_args(profile) + [
+                    "-p", ports, "--stats-every", NMAP_STATS_INTERVAL,
+                ]
+                if rate:
+                    cmd += ["--min-rate", str(rate)]
+                cmd += ["-oX", xml_file] + shard_hosts
+                lossy = False
+
+                def on_stdout(line):
+                    nonlocal lossy
+                    if _LOSS_RE.search(line):
+                        lossy = True
+                    match = _PROGRESS_RE.search(line)
+                    if match:
+                        report(index, min(float(match.group(1)), 99.0))
+
+                async with self._shard_slots:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return {"command": " ".join(cmd), "timed_out": True,
+                                "output": f"Shard {ports} skipped: {name} budget exhausted"}
+                    stage = await self._run_stage(f"{name}-{index}", cmd, remaining, on_stdout=on_stdout)
+
+                lowered = max(rate // 2, NMAP_MIN_RATE_FLOOR)
+                if retried or not lossy or lowered >= rate or stage["timed_out"]:
+                    break
+                # Lost probes mean ports may have been missed: retry slower
+                adjustments.append({"shard": index, "ports": ports, "from": rate, "to": lowered})
+                rate, retried = lowered, True
+            report(index, 100.0)
+            return stage
+
+        results = await asyncio.gather(*(
+            run_shard(i, ports, family, shard_hosts) for i, (ports, family, shard_hosts) in enumerate(shards)
+        ))
+        self._merge_xml([self.workspace_path(f"{name}-{i}.xml") for i in range(len(shards))],
+                        output_file)
+        return {
+            "name": name,
+            "command": " & ".join(r["command"] for r in results),
+            "duration": round(time.monotonic() - started, 2),
+            "timed_out": any(r["timed_out"] for r in results),
+            "shards": len(shards),
+            "rate_adjustments": adjustments,
+            "output": "\n".join(r["output"] for r in results),
+        }
+
+    @staticmethod
+    def _shards(hosts: List[str]) -> List[tuple]:
+        """(port range, family args, hosts) covering every port on every host"""
+        shards = []
+        for family, family_hosts in _by_family(hosts):
+            host_groups = min(len(family_hosts), NMAP_CPU_BUDGET)
+            groups = [family_hosts[i::host_groups] for i in range(host_groups)]
+            port_shards = max(1, NMAP_PORT_SHARDS // host_groups)
+            size = -(-MAX_PORT // port_shards)
+            ranges = [f"{start}-{min(start + size - 1, MAX_PORT)}" for start in range(1, MAX_PORT + 1, size)]
+            shards += [(ports, family, group) for group in groups for ports in ranges]
+        return shards
+
+    @staticmethod
+    def _merge_xml(xml_files: List[str], output_file: str):
+        """Combine shard reports into one, merging the ports of repeated hosts.
+
+        Shards are streamed; only hosts with at least one open port are kept.
+        """
+        merged = None
+        hosts = {}
+        for xml_file in xml_files:
+            try:
+                for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+                    if event == "start":
+                        if merged is None and elem.tag == "nmaprun":
+                            merged = ET.Element(elem.tag, elem.attrib)
+                        continue
+                    if elem.tag != "host":
+                        continue
+                    open_ports = [port for port in elem.iter("port") if _is_open(port)]
+                    address = elem.find("address")
+                    if open_ports and address is not None:
+                        existing = hosts.get(address.get("addr"))
+                        if existing is None:
+                            host = copy.deepcopy(elem)
+                            hosts[address.get("addr")] = host
+                            merged.append(host)
+                        else:
+                            ports = existing.find("ports")
+                            if ports is None:
+                                ports = ET.SubElement(existing, "ports")
+                            ports.extend(copy.deepcopy(port) for port in open_ports)
+                    elem.clear()
+            except (OSError, ET.ParseError) as e:
+                print(f"Skipping nmap shard {xml_file}: {e}")
+        if merged is not None:
+            ET.ElementTree(merged).write(output_file, encoding="utf-8", xml_declaration=True)
+
+    @staticmethod
+    def _open_ports(xml_file: str) -> List[str]:
+        """Sorted open TCP ports across all hosts in an nmap XML report"""
+        ports = set()
+        for _ip, port in _iter_open_ports(xml_file):
+            ports.add(int(port.get("portid")))
+        return [str(p) for p in sorted(ports)]
+
+    def _live_port(self, port_id: str, protocol: str, ip: str):
+        """Publish a port from nmap's -v output as a partial finding"""
+        seen = _live_ports.get()
+        if seen is None or (ip, port_id, protocol) in seen:
+            return
+        seen.add((ip, port_id, protocol))
+        self.add_partial_findings([_port_finding(ip, port_id, protocol, "unknown", "").dict()])
     
     def _parse_nmap_xml(self, xml_file: str) -> List[Finding]:
         """Parse Nmap XML output"""
         findings = []
-        
-        try:
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
-            
-            for host in root.findall(".//host"):
-                address = host.find(".//address[@addrtype='ipv4']")
-                if address is None:
-                    continue
-                
-                ip = address.get("addr")
-                
-                for port in host.findall(".//port"):
-                    port_id = port.get("portid")
-                    protocol = port.get("protocol")
-                    state = port.find("state")
-                    service = port.find("service")
-                    
-                    if state is not None and state.get("state") == "open":
-                        service_name = service.get("name", "unknown") if service is not None else "unknown"
-                        version = service.get("version", "") if service is not None else ""
-                        
-                        findings.append(Finding(
-                            severity="info",
-                            title=f"Open Port: {port_id}/{protocol}",
-                            description=f"Service: {service_name} {version}",
-                            details={
-                                "ip": ip,
-                                "port": port_id,
-                                "protocol": protocol,
-                                "service": service_name,
-                                "version": version
-                            }
-                        ))
-        except Exception as e:
-            print(f"Error parsing Nmap XML: {e}")
-        
+        for ip, port in _iter_open_ports(xml_file):
+            service = port.find("service")
+            service_name = service.get("name", "unknown") if service is not None else "unknown"
+            version = service.get("version", "") if service is not None else ""
+            tunnel = service.get("tunnel", "") if service is not None else ""
+            findings.append(_port_finding(ip, port.get("portid"), port.get("protocol"),
+                                          service_name, version, tunnel))
         return findings
 
 
+def _by_family(hosts: List[str]) -> List[tuple]:
+    """[(family args, hosts)]: nmap can't mix IPv4 and IPv6 in one run"""
+    ipv4 = [h for h in hosts if ":" not in h]
+    ipv6 = [h for h in hosts if ":" in h]
+    return [(family, group) for family, group in (([], ipv4), (["-6"], ipv6)) if group]
+
+
+def _is_open(port) -> bool:
+    state = port.find("state")
+    return state is not None and state.get("state") == "open"
+
+
+def _iter_open_ports(xml_file: str):
+    """(ip, <port>) for every open port, streamed host by host.
+
+    Each host element is cleared once handled, so memory stays flat however
+    many hosts the report covers.
+    """
+    try:
+        for _event, host in ET.iterparse(xml_file, events=("end",)):
+            if host.tag != "host":
+                continue
+            address = host.find("address[@addrtype='ipv4']")
+            if address is None:
+                address = host.find("address[@addrtype='ipv6']")
+            if address is not None:
+                for port in host.iter("port"):
+                    if _is_open(port):
+                        yield address.get("addr"), port
+            host.clear()
+    except (OSError, ET.ParseError) as e:
+        print(f"Error parsing Nmap XML: {e}")
+
+
+def _port_finding(ip: str, port_id: str, protocol: str, service_name: str, version: str,
+                  tunnel: str = "") -> Finding:
+    """Open port finding; `tunnel` is "ssl" for TLS-wrapped services"""
+    return Finding(
+        severity="info",
+        title=f"Open Port: {port_id}/{protocol}",
+        description=f"Service: {service_name} {version}",
+        details={
+            "ip": ip,
+            "port": port_id,
+            "protocol": protocol,
+            "service": service_name,
+            "version": version,
+            "tunnel": tunnel
+        }
+    )
+
 if __name__ == "__main__":
     service = NmapService()
     service.run()
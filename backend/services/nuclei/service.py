@@ -4,7 +4,6 @@ sys.path.append('/app')
 
 from services.base.tool_service import BaseToolService
 from services.base.models import Finding
-import subprocess
 import json
 from typing import Dict, Any, List
 
@@ -14,11 +13,11 @@ class NucleiService(BaseToolService):
         super().__init__(service_name="nuclei", version="1.0.0")
     
     async def scan(self, target: str, options: Dict[str, Any]) -> Dict[str, Any]:
-        # Use a simple temp file name
-        output_file = "/tmp/nuclei_output.json"
+        # Per-scan workspace file, so concurrent scans don't clobber each other
+        output_file = self.workspace_path("nuclei_output.json")
         cmd = ["nuclei", "-u", target, "-j", "-o", output_file, "-silent"]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        result = await self.run_process(cmd, timeout=600)
         
         findings = []
         output_lines = []
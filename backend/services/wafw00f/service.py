@@ -1,7 +1,6 @@
 import sys
 sys.path.append('/app')
 from services.base.tool_service import BaseToolService
-import subprocess
 from typing import Dict, Any
 
 class Wafw00fService(BaseToolService):
@@ -10,7 +9,7 @@ class Wafw00fService(BaseToolService):
     
     async def scan(self, target: str, options: Dict[str, Any]) -> Dict[str, Any]:
         cmd = ["wafw00f", target]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        result = await self.run_process(cmd, timeout=60)
         return {
             "findings": [],
             "raw_output": result.stdout,
@@ -2,7 +2,6 @@ import sys
 sys.path.append('/app')
 from services.base.tool_service import BaseToolService
 from services.base.models import Finding
-import subprocess
 from typing import Dict, Any
 
 class WhatWebService(BaseToolService):
@@ -11,7 +10,7 @@ class WhatWebService(BaseToolService):
     
     async def scan(self, target: str, options: Dict[str, Any]) -> Dict[str, Any]:
         cmd = ["whatweb", "--color=never", target]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        result = await self.run_process(cmd, timeout=60)
         return {
             "findings": [],
             "raw_output": result.stdout,
@@ -0,0 +1,103 @@
+"""
+Session verification cache
+Short-TTL cache of session token -> user id lookups, kept in process and
+optionally shared through Redis. Invalid tokens are cached too (for a
+shorter time), and concurrent lookups of one token share a single request.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "60"))
+SESSION_NEGATIVE_TTL = int(os.getenv("SESSION_NEGATIVE_TTL", "10"))
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+SESSION_CACHE_SHARED = os.getenv("SESSION_CACHE_SHARED", "true").lower() in ("1", "true", "yes")
+
+
+class SessionCache:
+    """token -> user id ("" for an invalid token) with in-flight coalescing.
+
+    Tokens are only ever stored as SHA-256 digests. A revoked session stays
+    accepted for at most SESSION_CACHE_TTL seconds.
+    """
+
+    def __init__(self, redis=None, ttl: int = SESSION_CACHE_TTL,
+                 negative_ttl: int = SESSION_NEGATIVE_TTL, max_entries: int = SESSION_CACHE_MAX_ENTRIES):
+        self.redis = redis
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight = {}
+
+    async def resolve(self, token: str, fetch):
+        """User id for `token`, or None if the session is invalid.
+
+        `fetch(token)` is awaited on a miss and returns (user_id, cacheable);
+        exceptions and uncacheable answers are never stored.
+        """
+        key = hashlib.sha256(token.encode()).hexdigest()
+        cached = self._get_local(key)
+        if cached is not None:
+            return cached or None
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, token, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        # Shielded so one caller disconnecting doesn't cancel everyone's lookup
+        user_id = await asyncio.shield(task)
+        return user_id or None
+
+    async def _load(self, key: str, token: str, fetch) -> str:
+        if self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.get(f"session:{key}")
+                    pipe.pttl(f"session:{key}")
+                    shared, remaining_ms = await pipe.execute()
+            except Exception as e:
+                logger.warning("Session cache read failed: %s", e)
+                shared = None
+            if shared is not None:
+                # Never outlive the shared entry, or a revoked session lingers past its TTL
+                ttl = self.ttl if shared else self.negative_ttl
+                if remaining_ms >= 0:
+                    ttl = min(ttl, remaining_ms / 1000)
+                self._put_local(key, shared, ttl)
+                return shared
+
+        user_id, cacheable = await fetch(token)
+        value = user_id or ""
+        if cacheable:
+            ttl = self.ttl if value else self.negative_ttl
+            self._put_local(key, value, ttl)
+            if self.redis is not None:
+                try:
+                    await self.redis.set(f"session:{key}", value, ex=ttl)
+                except Exception as e:
+                    logger.warning("Session cache write failed: %s", e)
+        return value
+
+    def _get_local(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_local(self, key: str, value: str, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,339 @@
+import asyncio
+import time
+
+import pytest
+
+import archive
+
+try:
+    from lupa import lua51
+except ImportError:  # Lua scripts can't be run without it
+    lua51 = None
+
+
+@pytest.fixture(autouse=True)
+def scan_archive(tmp_path, monkeypatch):
+    """Keep the scan archive inside the test's temp dir"""
+    monkeypatch.setattr(archive, "SCAN_ARCHIVE_DB", str(tmp_path / "archive" / "scans.db"))
+    monkeypatch.setattr(archive, "_archive", None)
+    return archive
+
+
+class FakePipeline:
+    """Pipeline over FakeRedis; commands apply as they are queued"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, command):
+        run = self.redis._command(command)
+
+        def queue(*args, **kwargs):
+            self.results.append(run(*args, **kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        results, self.results = self.results, []
+        if self.redis.asynchronous:
+            return self.redis._done(results)
+        return results
+
+
+class FakeRedis:
+    """In-memory Redis with the commands the API and engine use (decode_responses=True)
+
+    Data lives in plain dicts (values, hashes, lists, streams, zsets) so tests can
+    seed and inspect it directly; every command is logged in ``commands``. With
+    ``asynchronous=True`` the commands are coroutines, like redis.asyncio.
+    """
+
+    def __init__(self, asynchronous=False):
+        self.asynchronous = asynchronous
+        self.values = {}
+        self.hashes = {}
+        self.lists = {}
+        self.streams = {}
+        self.zsets = {}
+        self.expires = {}
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        """Run a Lua script against the fake, the way EVALSHA would (needs lupa)"""
+        if lua51 is None:
+            pytest.skip("lupa is required to run Lua scripts")
+        lua = lua51.LuaRuntime()
+        lua.globals().redis = lua.table(call=self._lua_call)
+        body = lua.eval(f"function() {script} end")
+
+        def run(keys=(), args=()):
+            lua.globals().KEYS = lua.table_from([str(k) for k in keys])
+            lua.globals().ARGV = lua.table_from([str(a) for a in args])
+            return body()
+        if not self.asynchronous:
+            return run
+
+        async def call(keys=(), args=()):
+            return run(keys, args)
+        return call
+
+    def _lua_call(self, command, key, *args):
+        command = command.lower()
+        pairs = list(zip(args[::2], args[1::2]))
+        if command == "hset":
+            result = self._command("hset")(key, mapping=dict(pairs))
+        elif command == "zadd":
+            result = self._command("zadd")(key, {member: float(score) for score, member in pairs})
+        elif command == "expire":
+            result = int(self._command("expire")(key, int(args[0])))
+        else:
+            result = self._command(command)(key, *args)
+        # nil replies reach Lua as false
+        return False if result is None else result
+
+    def __getattr__(self, command):
+        run = self._command(command)
+        if not self.asynchronous:
+            return run
+
+        async def call(*args, **kwargs):
+            return run(*args, **kwargs)
+        return call
+
+    async def _done(self, result):
+        return result
+
+    def _command(self, command):
+        try:
+            impl = object.__getattribute__(self, f"_cmd_{command}")
+        except AttributeError:
+            raise AttributeError(f"FakeRedis does not implement {command}") from None
+
+        def run(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return impl(*args, **kwargs)
+        return run
+
+    def _stores(self):
+        return (self.values, self.hashes, self.lists, self.streams, self.zsets)
+
+    def _alive(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._cmd_delete(key)
+        return any(key in store for store in self._stores())
+
+    # keys
+
+    def _cmd_ping(self):
+        return True
+
+    def _cmd_exists(self, *keys):
+        return sum(self._alive(key) for key in keys)
+
+    def _cmd_delete(self, *keys):
+        removed = 0
+        for key in keys:
+            self.expires.pop(key, None)
+            removed += any([store.pop(key, None) is not None for store in self._stores()])
+        return removed
+
+    def _cmd_expire(self, key, seconds):
+        if not self._alive(key):
+            return False
+        self.expires[key] = time.monotonic() + seconds
+        return True
+
+    def _cmd_pexpire(self, key, millis):
+        return self._cmd_expire(key, millis / 1000)
+
+    def _cmd_pttl(self, key):
+        if not self._alive(key):
+            return -2
+        if key not in self.expires:
+            return -1
+        return max(0, int((self.expires[key] - time.monotonic()) * 1000))
+
+    def _cmd_ttl(self, key):
+        pttl = self._cmd_pttl(key)
+        return pttl if pttl < 0 else pttl // 1000
+
+    # strings
+
+    def _cmd_get(self, key):
+        return self.values.get(key) if self._alive(key) else None
+
+    def _cmd_mget(self, keys, *more):
+        keys = [keys, *more] if isinstance(keys, str) else list(keys)
+        return [self._cmd_get(key) for key in keys]
+
+    def _cmd_set(self, key, value, ex=None, px=None, nx=False):
+        if nx and self._alive(key):
+            return None
+        self._cmd_delete(key)
+        self.values[key] = value
+        if ex is not None or px is not None:
+            self._cmd_expire(key, ex if ex is not None else px / 1000)
+        return True
+
+    def _cmd_setex(self, key, seconds, value):
+        return self._cmd_set(key, value, ex=seconds)
+
+    def _cmd_incrby(self, key, amount=1):
+        value = int(self._cmd_get(key) or 0) + amount
+        self.values[key] = str(value)
+        return value
+
+    def _cmd_incr(self, key, amount=1):
+        return self._cmd_incrby(key, amount)
+
+    def _cmd_decr(self, key, amount=1):
+        return self._cmd_incrby(key, -amount)
+
+    # hashes
+
+    def _hash(self, key):
+        self._alive(key)
+        return self.hashes.get(key, {})
+
+    def _cmd_hset(self, key, field=None, value=None, mapping=None):
+        fields = dict(mapping or {})
+        if field is not None:
+            fields[field] = value
+        target = self.hashes.setdefault(key, {})
+        added = len(fields.keys() - target.keys())
+        target.update(fields)
+        return added
+
+    def _cmd_hsetnx(self, key, field, value):
+        if field in self._hash(key):
+            return 0
+        return self._cmd_hset(key, field, value)
+
+    def _cmd_hget(self, key, field):
+        return self._hash(key).get(field)
+
+    def _cmd_hmget(self, key, fields, *more):
+        fields = [fields, *more] if isinstance(fields, str) else list(fields)
+        return [self._hash(key).get(field) for field in fields]
+
+    def _cmd_hgetall(self, key):
+        return dict(self._hash(key))
+
+    def _cmd_hlen(self, key):
+        return len(self._hash(key))
+
+    def _cmd_hdel(self, key, *fields):
+        target = self._hash(key)
+        return sum(target.pop(field, None) is not None for field in fields)
+
+    # lists
+
+    def _cmd_rpush(self, key, *items):
+        target = self.lists.setdefault(key, [])
+        target.extend(items)
+        return len(target)
+
+    def _cmd_llen(self, key):
+        self._alive(key)
+        return len(self.lists.get(key, []))
+
+    def _cmd_lrange(self, key, start, end):
+        self._alive(key)
+        items = self.lists.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    # streams
+
+    def _cmd_xadd(self, key, fields, id="*", maxlen=None, approximate=True):
+        entries = self.streams.setdefault(key, [])
+        entry_id = f"{len(entries) + 1}-0" if id == "*" else id
+        entries.append((entry_id, dict(fields)))
+        if maxlen is not None:
+            del entries[:-maxlen]
+        return entry_id
+
+    def _cmd_xlen(self, key):
+        self._alive(key)
+        return len(self.streams.get(key, []))
+
+    def _cmd_xrange(self, key, min="-", max="+", count=None):
+        self._alive(key)
+        entries = list(self.streams.get(key, []))
+        return entries[:count] if count else entries
+
+    def _cmd_xrevrange(self, key, max="+", min="-", count=None):
+        entries = self._cmd_xrange(key, min, max)[::-1]
+        return entries[:count] if count else entries
+
+    # sorted sets
+
+    def _cmd_zadd(self, key, mapping, nx=False):
+        target = self.zsets.setdefault(key, {})
+        new = {member: score for member, score in mapping.items() if not (nx and member in target)}
+        added = len(new.keys() - target.keys())
+        target.update(new)
+        return added
+
+    def _cmd_zrem(self, key, *members):
+        target = self.zsets.get(key, {})
+        return sum(target.pop(member, None) is not None for member in members)
+
+    def _cmd_zrevrangebyscore(self, key, max, min, start=None, num=None, withscores=False):
+        def bound(value):
+            value = str(value)
+            if value in ("+inf", "-inf"):
+                return float(value), False
+            return float(value.lstrip("(")), value.startswith("(")
+
+        high, high_open = bound(max)
+        low, low_open = bound(min)
+        entries = sorted(self.zsets.get(key, {}).items(), key=lambda e: e[1], reverse=True)
+        entries = [
+            (member, score) for member, score in entries
+            if (score < high if high_open else score <= high) and (score > low if low_open else score >= low)
+        ]
+        if start is not None:
+            entries = entries[start:start + num]
+        return entries if withscores else [member for member, _ in entries]
+
+
+class FakePubSub:
+    """Pub/sub subscription that hands out pre-seeded messages"""
+
+    def __init__(self, messages=()):
+        self.messages = list(messages)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        if self.messages:
+            return self.messages.pop(0)
+        await asyncio.sleep(timeout)
+        return None
+
+
+@pytest.fixture
+def fake_redis():
+    """Synchronous Redis fake, as used by the engine"""
+    return FakeRedis()
+
+
+@pytest.fixture
+def fake_async_redis():
+    """redis.asyncio-style fake, as used by the API"""
+    return FakeRedis(asynchronous=True)
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+
+import engine
+import main
+import result_store
+from archive import ScanArchive
+
+RECORD = {
+    "meta": {"target": "example.com", "category": "black", "status": "completed",
+             "user_id": "u1", "started_at": "2026-07-28T10:00:00", "completed_at": "2026-07-28T10:05:00"},
+    "logs": ["[t] 🎯 Starting", "[t] ✅ Scan completed"],
+    "findings": {"nmap": json.dumps([{"id": "nmap-0", "title": "Open Port: 22 (ssh)"}])},
+    "services": {"nmap": json.dumps({"status": "completed"})},
+    "insightmap": json.dumps({"risk_level": "Low"}),
+    "results": {"nmap": "x" * 10000},
+}
+
+
+def test_archive_round_trip_is_compressed(tmp_path):
+    store = ScanArchive(str(tmp_path / "scans.db"))
+    store.put("s1", RECORD)
+
+    reopened = ScanArchive(str(tmp_path / "scans.db"))
+    assert reopened.get("s1") == RECORD
+    assert reopened.get_meta_many(["s1", "nope"]) == {
+        "s1": {"target": "example.com", "category": "black", "status": "completed",
+               "started_at": "2026-07-28T10:00:00"},
+    }
+    codec, size = reopened._conn.execute("SELECT codec, length(record) FROM scans").fetchone()
+    assert codec in ("zstd", "zlib") and size < 1000
+
+
+def test_prune_applies_age_and_count_limits(tmp_path):
+    store = ScanArchive(str(tmp_path / "scans.db"), retention_days=30, max_scans=2)
+    for scan_id, started_at in [("old", "2026-06-01T10:00:00"), ("a", "2026-07-26T10:00:00"),
+                                ("b", "2026-07-27T10:00:00"), ("c", "2026-07-28T10:00:00")]:
+        store.put(scan_id, {"meta": {"started_at": started_at}})
+
+    assert sorted(store.prune(now=datetime(2026, 7, 28, 12, 0))) == ["a", "old"]
+    assert [s for s in ("old", "a", "b", "c") if s in store] == ["b", "c"]
+    assert store.prune(now=datetime(2026, 7, 28, 12, 0)) == []
+    assert ScanArchive(str(tmp_path / "unbounded.db"), retention_days=0, max_scans=0).prune() == []
+
+
+def test_archived_scans_are_rehydrated_into_redis(scan_archive, fake_async_redis, monkeypatch):
+    scan_archive.get_archive().put("s1", RECORD)
+    redis = fake_async_redis
+    monkeypatch.setattr(main, "redis_conn", redis)
+
+    assert asyncio.run(main._rehydrate("s1")) is True
+    assert asyncio.run(main._rehydrate("missing")) is False
+
+    written = {(c, args[0]) for c, args, _ in redis.commands}
+    assert ("hset", "scan:s1:meta") in written and ("set", "scan:s1:insightmap") in written
+    assert [args[1] for c, args, _ in redis.commands if c == "xadd"] == [{"line": line} for line in RECORD["logs"]]
+    assert {args for c, args, _ in redis.commands if c == "expire"} >= {("scan:s1:meta", main.SCAN_REHYDRATE_TTL)}
+
+
+def test_archiving_prunes_old_scans_with_their_blobs(scan_archive, fake_async_redis, fake_redis, tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(result_store, "RAW_OUTPUT_SPILL_BYTES", 10)
+    monkeypatch.setattr(engine, "_get_async_redis", lambda: fake_async_redis)
+    monkeypatch.setattr(engine, "redis_client", fake_redis)
+    store = scan_archive.get_archive()
+    store.max_scans = 1
+    store.put("old", {"meta": {"started_at": "2026-07-27T10:00:00"}})
+    result_store.encode_result("old", "nmap", json.dumps({"raw_output": "x" * 100}))
+    fake_async_redis.hashes["scan:new:meta"] = {"status": "completed", "started_at": "2026-07-28T10:00:00"}
+    fake_async_redis.values["scan:new:result:nmap"] = result_store.encode_result(
+        "new", "nmap", json.dumps({"raw_output": "y" * 100}))
+
+    assert asyncio.run(engine.archive_scan("new", ["nmap"])) is True
+
+    assert "old" not in store and "new" in store
+    assert sorted(os.listdir(tmp_path / "blobs")) == ["new"]
@@ -0,0 +1,109 @@
+import asyncio
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+import worker
+
+PAYLOAD = {"ip": "example.com", "category": "black", "userId": "u1"}
+
+
+def patch_checks(monkeypatch, session_error=None, turnstile_error=None):
+    """Each check waits for the other to start, so a request only gets through if they run concurrently"""
+
+    async def check(request, name, other, error):
+        if not hasattr(request.state, "checks"):
+            request.state.checks = {"session": asyncio.Event(), "turnstile": asyncio.Event()}
+        request.state.checks[name].set()
+        await asyncio.wait_for(request.state.checks[other].wait(), 1)
+        if error:
+            raise error
+
+    async def verify_session(request, user_id):
+        await check(request, "session", "turnstile", session_error)
+
+    async def verify_turnstile(scan, request):
+        await check(request, "turnstile", "session", turnstile_error)
+
+    monkeypatch.setattr(main, "_verify_session", verify_session)
+    monkeypatch.setattr(main, "_verify_turnstile", verify_turnstile)
+
+
+def patch_reservation(monkeypatch, reserved=True):
+    calls = []
+
+    async def reserve(scan_id, user_id, meta):
+        calls.append(("reserve", scan_id, user_id, meta["status"]))
+        return reserved
+
+    async def release(scan_id, user_id):
+        calls.append(("release", scan_id, user_id))
+
+    monkeypatch.setattr(main, "redis_conn", object())
+    monkeypatch.setattr(main, "_reserve_scan", reserve)
+    monkeypatch.setattr(main, "_release_scan", release)
+    return calls
+
+
+def test_preflight_checks_run_concurrently(monkeypatch):
+    patch_checks(monkeypatch)
+    calls = patch_reservation(monkeypatch)
+    monkeypatch.setattr(worker, "queue_scan", lambda *args: "job-1")
+
+    response = TestClient(main.app).post("/scan", json=PAYLOAD)
+
+    assert response.status_code == 200
+    assert calls == [("reserve", response.json()["scan_id"], "u1", "queued")]
+
+
+def test_session_errors_win_over_turnstile_errors(monkeypatch):
+    patch_checks(monkeypatch, session_error=HTTPException(status_code=401),
+                 turnstile_error=HTTPException(status_code=400))
+    calls = patch_reservation(monkeypatch)
+
+    assert TestClient(main.app).post("/scan", json=PAYLOAD).status_code == 401
+    assert calls == []
+
+
+def test_quota_exhausted_and_enqueue_failure_refund(monkeypatch):
+    patch_checks(monkeypatch)
+    patch_reservation(monkeypatch, reserved=False)
+    assert TestClient(main.app).post("/scan", json=PAYLOAD).status_code == 429
+
+    calls = patch_reservation(monkeypatch)
+
+    def broken_queue(*args):
+        raise RuntimeError("redis down")
+
+    monkeypatch.setattr(worker, "queue_scan", broken_queue)
+    response = TestClient(main.app).post("/scan", json=PAYLOAD)
+
+    assert response.status_code == 500
+    assert [c[0] for c in calls] == ["reserve", "release"]
+
+
+def test_reservation_script_enforces_quota_and_release_rolls_back(fake_async_redis, monkeypatch):
+    redis = fake_async_redis
+    monkeypatch.setattr(main, "redis_conn", redis)
+    monkeypatch.setattr(main, "_reserve_scan_script", redis.register_script(main._RESERVE_SCAN_LUA))
+    monkeypatch.setattr(main, "DAILY_SCAN_LIMIT", 1)
+    meta = {"target": "example.com", "status": "queued", "started_at": "2026-07-28T10:00:00"}
+    quota = main._quota_key("u1")
+
+    async def reserve_twice():
+        return await main._reserve_scan("s1", "u1", meta), await main._reserve_scan("s2", "u1", meta)
+
+    assert asyncio.run(reserve_twice()) == (True, False)
+    assert redis.values[quota] == "1" and quota in redis.expires
+    assert redis.hashes["scan:s1:meta"] == meta
+    assert "scan:s2:meta" not in redis.hashes
+    assert list(redis.zsets[main.SCAN_INDEX_KEY]) == ["s1"]
+    assert list(redis.zsets[main._user_index_key("u1")]) == ["s1"]
+
+    asyncio.run(main._release_scan("s1", "u1"))
+
+    assert redis.values[quota] == "0"
+    assert "scan:s1:meta" not in redis.hashes
+    assert redis.zsets[main.SCAN_INDEX_KEY] == {}
+    assert asyncio.run(main._reserve_scan("s3", "u1", meta)) is True
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import engine
+
+TARGET_INFO = {
+    "original": "example.com", "ip": "192.0.2.1", "ips": ["192.0.2.1"],
+    "fqdn": "example.com", "url": "http://example.com", "type": "fqdn",
+}
+
+NMAP_RESULTS = json.dumps({"findings": [
+    {"title": "Open Port: 22/tcp", "details": {"port": "22", "protocol": "tcp", "service": "ssh"}},
+    {"title": "Open Port: 80/tcp", "details": {"port": "80", "protocol": "tcp", "service": "http"}},
+    {"title": "Open Port: 443/tcp", "details": {"port": "443", "protocol": "tcp", "service": "http", "tunnel": "ssl"}},
+    {"title": "Open Port: 8443/tcp", "details": {"port": "8443", "protocol": "tcp", "service": "unknown"}},
+    {"title": "Open Port: 8443/tcp", "details": {"port": "8443", "protocol": "tcp", "service": "https-alt"}},
+    {"title": "Open Port: 993/tcp", "details": {"port": "993", "protocol": "tcp", "service": "imap", "tunnel": "ssl"}},
+]})
+
+
+@pytest.fixture
+def redis(fake_redis, monkeypatch):
+    redis = fake_redis
+    monkeypatch.setattr(engine, "redis_client", redis)
+    monkeypatch.setattr(engine, "log_scan", lambda uid, message: None)
+    monkeypatch.setattr(engine, "publish_update", lambda uid, kind, **data: None)
+    monkeypatch.setattr(engine, "_service_states", {})
+    monkeypatch.setattr(engine, "_discovered_services", {})
+    monkeypatch.setattr(engine, "_discoveries", {})
+    monkeypatch.setattr(engine, "_scan_deadlines", {})
+    return redis
+
+
+def test_targets_cover_discovered_endpoints_once(redis):
+    engine._record_discovered_services("scan-1", NMAP_RESULTS)
+
+    assert engine._service_targets("nikto", TARGET_INFO, "scan-1") == [
+        "http://example.com", "https://example.com", "https://example.com:8443",
+    ]
+    assert engine._service_targets("testssl", TARGET_INFO, "scan-1") == [
+        "example.com", "example.com:993", "example.com:8443",
+    ]
+    assert engine._service_targets("dnsrecon", TARGET_INFO, "scan-1") == ["example.com"]
+    assert engine._service_targets("nikto", TARGET_INFO, "other-scan") == ["http://example.com"]
+
+
+def test_web_tool_fans_out_with_bounded_concurrency_and_merges(redis, monkeypatch):
+    monkeypatch.setattr(engine, "ENDPOINT_CONCURRENCY", 2)
+    engine._record_discovered_services("scan-1", NMAP_RESULTS)
+    active = peak = 0
+
+    async def fake_run(service, svc_target, label, target_info, uid, category):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if svc_target.endswith(":8443"):
+            return (False, "HTTP 500", None)
+        line = json.dumps({"info": {"name": f"Issue on {svc_target}", "severity": "high"}, "template-id": "t"})
+        return (True, None, json.dumps({"raw_output": line}))
+
+    monkeypatch.setattr(engine, "_run_service_scan", fake_run)
+
+    result = asyncio.run(engine.call_service("nuclei", TARGET_INFO, "scan-1", "white"))
+
+    assert result == ("nuclei", True, "https://example.com:8443: HTTP 500")
+    assert peak == 2
+    findings = json.loads(redis.hashes["scan:scan-1:findings"]["nuclei"])
+    assert [(f["id"], f["endpoint"]) for f in findings] == [
+        ("nuclei-0", "http://example.com"), ("nuclei-1", "https://example.com"),
+    ]
+    stored = json.loads(redis.values["scan:scan-1:result:nuclei"])
+    assert "===== https://example.com =====" in stored["raw_output"]
+    state = json.loads(redis.hashes["scan:scan-1:services"]["nuclei"])
+    assert state["status"] == "completed" and state["findings"] == 2
+    assert len(state["targets"]) == 3
+
+
+def test_single_target_service_keeps_plain_result(redis, monkeypatch):
+    async def fake_run(service, svc_target, label, target_info, uid, category):
+        assert label == "nmap"
+        return (True, None, NMAP_RESULTS)
+
+    monkeypatch.setattr(engine, "_run_service_scan", fake_run)
+
+    assert asyncio.run(engine.call_service("nmap", TARGET_INFO, "scan-1", "white")) == ("nmap", True, None)
+    assert redis.values["scan:scan-1:result:nmap"].startswith(("enc:", "{"))
+    assert [port for port, _, _ in engine._discovered_services["scan-1"]] == ["22", "80", "443", "993", "8443"]
+
+
+class FakeToolClient:
+    """A tool service whose scans finish `runtime` seconds after POST /scan"""
+
+    def __init__(self, runtime, budget=None, partial=None):
+        self.runtime = runtime
+        self.budget = budget
+        self.partial = partial
+        self.started = None
+        self.discovered = []
+
+    def running(self):
+        return time.monotonic() - self.started < self.runtime
+
+    async def post(self, url, json):
+        self.started = time.monotonic()
+        return httpx.Response(200, json={"scan_id": "t1", "status": "queued", "timeout": self.budget})
+
+    async def get(self, url):
+        if "/status/" in url:
+            # What the engine knew about the scan's endpoints at each poll
+            self.discovered.append([port for port, _, _ in engine._discovered_services.get("scan-1", [])])
+            return httpx.Response(200, json={"scan_id": "t1", "status": "running" if self.running() else "completed"})
+        if self.partial is not None and self.running():
+            return httpx.Response(200, text=self.partial)
+        return httpx.Response(200, text=NMAP_RESULTS)
+
+
+@pytest.mark.parametrize("budget, expected_error", [(None, "Timeout (partial results)"), (1, None)])
+def test_wait_covers_the_time_budget_the_tool_reports(redis, monkeypatch, budget, expected_error):
+    async def no_events(channel):
+        return None
+
+    monkeypatch.setattr(engine, "_get_http_client", lambda: FakeToolClient(0.2, budget))
+    monkeypatch.setattr(engine, "_subscribe_events", no_events)
+    monkeypatch.setattr(engine, "POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(engine, "DEFAULT_SERVICE_TIMEOUT", 0.05)
+    monkeypatch.setattr(engine, "SERVICE_TIMEOUT_GRACE", 0)
+
+    ok, error, content = asyncio.run(
+        engine._run_service_scan("nmap", "192.0.2.1", "nmap", TARGET_INFO, "scan-1", "white"))
+
+    assert ok and error == expected_error and content == NMAP_RESULTS
+
+
+def test_live_ports_are_recorded_while_nmap_runs(redis, monkeypatch):
+    async def no_events(channel):
+        return None
+
+    partial = json.dumps({"findings": [
+        {"title": "Open Port: 8080/tcp", "details": {"port": "8080", "protocol": "tcp", "service": "unknown"}},
+    ], "metadata": {"partial": True}})
+    client = FakeToolClient(0.1, partial=partial)
+    monkeypatch.setattr(engine, "_get_http_client", lambda: client)
+    monkeypatch.setattr(engine, "_subscribe_events", no_events)
+    monkeypatch.setattr(engine, "POLL_INTERVAL", 0.01)
+
+    asyncio.run(engine.call_service("nmap", TARGET_INFO, "scan-1", "white"))
+
+    assert client.discovered[0] == [] and ["8080"] in client.discovered
+    # The final report replaces the live ports
+    assert [port for port, _, _ in engine._discovered_services["scan-1"]] == ["22", "80", "443", "993", "8443"]
+
+
+def test_web_tools_start_at_once_and_pick_up_endpoints_nmap_finds(redis, monkeypatch):
+    live = json.dumps({"findings": [
+        {"title": "Open Port: 443/tcp", "details": {"port": "443", "protocol": "tcp", "service": "unknown"}},
+    ]})
+    events = []
+
+    async def fake_run(service, svc_target, label, target_info, uid, category):
+        events.append((service, svc_target))
+        if service == "nmap":
+            await asyncio.sleep(0.02)
+            engine._record_discovered_services(uid, live, merge=True)
+            await asyncio.sleep(0.02)
+            events.append(("nmap done", None))
+            return (True, None, NMAP_RESULTS)
+        return (True, None, json.dumps({"raw_output": f"scanned {svc_target}"}))
+
+    monkeypatch.setattr(engine, "_run_service_scan", fake_run)
+
+    results = asyncio.run(engine.run_all_services({"nmap": [], "nikto": []}, TARGET_INFO, "scan-1", "white"))
+
+    assert results == [("nmap", True, None), ("nikto", True, None)]
+    nikto = [target for service, target in events if service == "nikto"]
+    assert nikto == ["http://example.com", "https://example.com", "https://example.com:8443"]
+    # The default target and the live port didn't wait for nmap to finish
+    assert events.index(("nikto", "https://example.com")) < events.index(("nmap done", None))
+    assert events.index(("nikto", "https://example.com:8443")) > events.index(("nmap done", None))
+    state = json.loads(redis.hashes["scan:scan-1:services"]["nikto"])
+    assert state["targets"] == nikto and state["status"] == "completed"
+    assert engine._discoveries == {}
+
+
+def test_no_endpoint_runs_are_started_past_the_scan_deadline(redis, monkeypatch):
+    calls = []
+
+    async def fake_run(service, svc_target, label, target_info, uid, category):
+        calls.append(svc_target)
+        if service == "nmap":
+            await asyncio.sleep(0.02)
+            return (True, None, NMAP_RESULTS)
+        return (True, None, json.dumps({"raw_output": "ok"}))
+
+    monkeypatch.setattr(engine, "_run_service_scan", fake_run)
+    engine._scan_deadlines["scan-1"] = time.time() + 60
+
+    asyncio.run(engine.run_all_services({"nmap": [], "nuclei": []}, TARGET_INFO, "scan-1", "white"))
+
+    assert calls[1:] == ["http://example.com"]
+
+
+def test_followers_waiting_for_nmap_free_their_slot(redis, monkeypatch):
+    monkeypatch.setattr(engine, "MAX_PARALLEL_TOOLS", 2)
+    events = []
+
+    async def fake_run(service, svc_target, label, target_info, uid, category):
+        events.append((service, svc_target))
+        if service == "nmap":
+            await asyncio.sleep(0.05)
+            events.append(("nmap done", None))
+            return (True, None, NMAP_RESULTS)
+        return (True, None, json.dumps({"raw_output": f"scanned {svc_target}"}))
+
+    monkeypatch.setattr(engine, "_run_service_scan", fake_run)
+
+    results = asyncio.run(engine.run_all_services(
+        {"nmap": [], "nikto": [], "wafw00f": []}, TARGET_INFO, "scan-1", "white"))
+
+    assert [ok for _, ok, _ in results] == [True, True, True]
+    # nikto's wait for nmap left room for the lowest priority tool
+    assert events.index(("wafw00f", "http://example.com")) < events.index(("nmap done", None))
+    for service in ("nikto", "wafw00f"):
+        assert (service, "https://example.com:8443") in events
+        state = json.loads(redis.hashes["scan:scan-1:services"][service])
+        assert state["status"] == "completed" and len(state["targets"]) == 3
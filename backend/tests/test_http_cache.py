@@ -0,0 +1,68 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def make_client(redis, monkeypatch):
+    redis.hashes["scan:s1:meta"] = {"status": "completed", "completed_at": "2026-07-28T10:05:00",
+                                    "target": "example.com"}
+    redis.hashes["scan:s1:findings"] = {
+        "nmap": json.dumps([{"id": f"nmap-{i}", "title": "Open Port"} for i in range(100)]),
+    }
+    redis.lists["scan:s1:logs"] = ["line"] * 5
+    monkeypatch.setattr(main, "redis_conn", redis)
+    return TestClient(main.app), redis
+
+
+def test_results_are_compressed_and_revalidated(fake_async_redis, monkeypatch):
+    client, _ = make_client(fake_async_redis, monkeypatch)
+
+    first = client.get("/scan/s1/results", headers={"Accept-Encoding": "gzip"})
+    etag = first.headers["etag"]
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.headers["last-modified"]
+    assert len(first.json()["findings"]) == 100
+
+    again = client.get("/scan/s1/results", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert again.status_code == 304
+    assert again.content == b""
+
+
+def test_logs_etag_changes_when_lines_are_appended(fake_async_redis, monkeypatch):
+    client, redis = make_client(fake_async_redis, monkeypatch)
+
+    etag = client.get("/scan/s1/logs").headers["etag"]
+    assert client.get("/scan/s1/logs", headers={"If-None-Match": etag}).status_code == 304
+    assert [c for c, _, _ in redis.commands].count("lrange") == 1
+
+    redis.lists["scan:s1:logs"].append("new line")
+    refreshed = client.get("/scan/s1/logs", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.json()["total_lines"] == 6
+
+
+def test_logs_etag_follows_a_trimmed_stream(fake_async_redis, monkeypatch):
+    client, redis = make_client(fake_async_redis, monkeypatch)
+    stream = redis.streams["scan:s1:logstream"] = [(f"{i}-0", {"line": f"line {i}"}) for i in range(1, 4)]
+
+    etag = client.get("/scan/s1/logs").headers["etag"]
+    # At MAXLEN the stream's length stays put while lines are added
+    stream.append(("4-0", {"line": "line 4"}))
+    del stream[0]
+
+    refreshed = client.get("/scan/s1/logs", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.json()["logs"][-1] == "line 4"
+
+
+def test_report_honours_if_modified_since(fake_async_redis, monkeypatch):
+    client, _ = make_client(fake_async_redis, monkeypatch)
+
+    report = client.get("/report/s1")
+    assert report.status_code == 200
+    assert "example.com" in report.text
+
+    cached = client.get("/report/s1", headers={"If-Modified-Since": report.headers["last-modified"]})
+    assert cached.status_code == 304
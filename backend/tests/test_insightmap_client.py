@@ -24,6 +24,11 @@ class FakeRedis:
         return None
 
 
+class FakeClient:
+    def __init__(self, post):
+        self.post = post
+
+
 class FakeResponse:
     def raise_for_status(self):
         return None
@@ -74,7 +79,7 @@ def test_send_to_insightmap_posts_and_persists_analysis(monkeypatch):
     monkeypatch.setattr(engine, "redis_client", redis)
     monkeypatch.setattr(engine, "INSIGHTMAP_URL", "http://insightmap")
     monkeypatch.setattr(engine, "INSIGHTMAP_API_KEY", "service-secret")
-    monkeypatch.setattr(engine.httpx, "post", fake_post)
+    monkeypatch.setattr(engine.http_pool, "sync_client", lambda upstream: FakeClient(fake_post))
 
     result = engine.send_to_insightmap(
         "scan-1", "example.com", "black", ["nuclei"]
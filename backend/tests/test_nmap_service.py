@@ -0,0 +1,206 @@
+import asyncio
+
+import pytest
+
+from services.base import tool_service
+from services.base.tool_service import ProcessResult
+from services.nmap import service as nmap_service
+from services.nmap.service import NmapService
+
+DISCOVERY_XML = """<?xml version="1.0"?>
+<nmaprun><host><address addr="192.0.2.1" addrtype="ipv4"/><ports>
+<port protocol="tcp" portid="443"><state state="open"/></port>
+<port protocol="tcp" portid="22"><state state="open"/></port>
+</ports></host></nmaprun>"""
+
+DETECTION_XML = """<?xml version="1.0"?>
+<nmaprun><host><address addr="192.0.2.1" addrtype="ipv4"/><ports>
+<port protocol="tcp" portid="22"><state state="open"/><service name="ssh" version="9.6"/></port>
+<port protocol="tcp" portid="443"><state state="open"/><service name="https"/></port>
+</ports></host></nmaprun>"""
+
+EMPTY_XML = """<?xml version="1.0"?><nmaprun><host><ports/></host></nmaprun>"""
+
+
+@pytest.fixture
+def nmap(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULTS_DIR", str(tmp_path / "results"))
+    monkeypatch.setattr(nmap_service, "NMAP_CPU_BUDGET", 1)
+    monkeypatch.setattr(nmap_service, "NMAP_PORT_SHARDS", 1)
+    service = NmapService()
+    token = tool_service._current_workspace.set(str(tmp_path))
+    scan_token = tool_service._current_scan_id.set("scan-1")
+    yield service
+    tool_service._current_scan_id.reset(scan_token)
+    tool_service._current_workspace.reset(token)
+
+
+def fake_nmap(service, monkeypatch, outputs, warnings=()):
+    """Make run_process write the next XML document to the -oX path"""
+    commands = []
+
+    async def run_process(cmd, timeout=300, on_stdout=None, **kwargs):
+        commands.append(cmd)
+        if on_stdout is not None:
+            on_stdout("SYN Stealth Scan Timing: About 50.00% done; ETC: 12:01 (0:00:41 remaining)")
+            if len(commands) <= len(warnings):
+                on_stdout(warnings[len(commands) - 1])
+        with open(cmd[cmd.index("-oX") + 1], "w") as f:
+            f.write(outputs[len(commands) - 1])
+        return ProcessResult(0, f"Stats: 0:00:10 elapsed\nstage {len(commands)}\n", "", False)
+
+    monkeypatch.setattr(service, "run_process", run_process)
+    return commands
+
+
+def test_staged_scan_runs_detection_on_open_ports_only(nmap, monkeypatch):
+    commands = fake_nmap(nmap, monkeypatch, [DISCOVERY_XML, DETECTION_XML])
+
+    result = asyncio.run(nmap.scan("example.com", {"category": "gray", "addresses": ["192.0.2.1"]}))
+
+    discovery, detection = commands
+    assert discovery[discovery.index("-p") + 1] == "1-65535"
+    assert discovery[discovery.index("--min-rate") + 1] == "300"
+    assert "-T4" in detection and detection[detection.index("--max-retries") + 1] == "3"
+    assert detection[:4] == ["nmap", "-v", "-sV", "-sC"]
+    assert detection[detection.index("-p") + 1] == "22,443"
+    assert detection[-1] == "192.0.2.1"
+    stages = result["metadata"]["stages"]
+    assert [s["name"] for s in stages] == ["discovery", "detection"]
+    assert stages[0]["open_ports"] == 2
+    assert all("duration" in s and "output" not in s for s in stages)
+    assert [f["details"]["version"] for f in result["findings"]] == ["9.6", ""]
+    assert result["raw_output"] == "stage 1\n\nstage 2\n"
+
+
+def test_staged_scan_skips_detection_without_open_ports(nmap, monkeypatch):
+    commands = fake_nmap(nmap, monkeypatch, [EMPTY_XML])
+
+    result = asyncio.run(nmap.scan("192.0.2.1", {"scan_type": "white"}))
+
+    assert len(commands) == 1
+    assert result["findings"] == []
+    assert [s["name"] for s in result["metadata"]["stages"]] == ["discovery"]
+
+
+def test_basic_scan_stays_single_stage(nmap, monkeypatch):
+    commands = fake_nmap(nmap, monkeypatch, [DETECTION_XML])
+
+    result = asyncio.run(nmap.scan("192.0.2.1", {}))
+
+    assert commands[0][:5] == ["nmap", "-v", "-sV", "-p", "80,443,8080,8443"]
+    assert "stages" not in result["metadata"]
+    assert len(result["findings"]) == 2
+
+
+def shard_xml(addr, port):
+    return f"""<?xml version="1.0"?>
+<nmaprun scanner="nmap"><host><address addr="{addr}" addrtype="ipv4"/><ports>
+<port protocol="tcp" portid="{port}"><state state="open"/></port>
+</ports></host></nmaprun>"""
+
+
+def test_full_port_sweep_is_sharded_and_merged(nmap, monkeypatch):
+    monkeypatch.setattr(nmap_service, "NMAP_CPU_BUDGET", 2)
+    monkeypatch.setattr(nmap_service, "NMAP_PORT_SHARDS", 4)
+    outputs = [shard_xml("192.0.2.1", 22), shard_xml("192.0.2.1", 40000),
+               shard_xml("192.0.2.2", 443), shard_xml("192.0.2.2", 50000)]
+    commands = fake_nmap(nmap, monkeypatch, outputs)
+    progress = []
+    monkeypatch.setattr(nmap, "report_progress", lambda value, message=None: progress.append(value))
+
+    result = asyncio.run(nmap.scan("example.com", {
+        "scan_type": "white", "staged": False, "addresses": ["192.0.2.1", "192.0.2.2"],
+    }))
+
+    shards = sorted((c[c.index("-p") + 1], c[-1]) for c in commands)
+    assert shards == [("1-32768", "192.0.2.1"), ("1-32768", "192.0.2.2"),
+                      ("32769-65535", "192.0.2.1"), ("32769-65535", "192.0.2.2")]
+    assert result["metadata"]["shards"] == 4
+    assert sorted(f["details"]["ip"] + ":" + f["details"]["port"] for f in result["findings"]) == [
+        "192.0.2.1:22", "192.0.2.1:40000", "192.0.2.2:443", "192.0.2.2:50000",
+    ]
+    assert "Stats:" not in result["raw_output"]
+    assert progress[-1] == 100
+
+
+def test_perf_profile_follows_category_with_overrides():
+    assert nmap_service.perf_profile("black")["min_rate"] == 0
+    assert nmap_service.perf_profile("unknown") == nmap_service.PERF_PROFILES["balanced"]
+    assert nmap_service.perf_profile("black", "fast") == nmap_service.PERF_PROFILES["fast"]
+    custom = nmap_service.perf_profile("white", {"timing": 2, "bogus": 1})
+    assert custom["timing"] == 2 and custom["min_rate"] == 1000 and "bogus" not in custom
+    with pytest.raises(ValueError):
+        nmap_service.perf_profile("white", "ludicrous")
+
+
+def test_lossy_shard_is_rerun_once_at_lower_rate(nmap, monkeypatch):
+    loss = "Increasing send delay for 192.0.2.1 from 0 to 5 due to 11 out of 35 dropped probes since last increase."
+    commands = fake_nmap(nmap, monkeypatch, [EMPTY_XML, DISCOVERY_XML, DETECTION_XML], warnings=[loss, loss])
+
+    result = asyncio.run(nmap.scan("192.0.2.1", {"category": "white"}))
+
+    rates = [c[c.index("--min-rate") + 1] for c in commands[:2]]
+    assert rates == ["1000", "500"]
+    assert commands[2][:3] == ["nmap", "-v", "-sV"]
+    assert result["metadata"]["rate_adjustments"] == [
+        {"shard": 0, "ports": "1-65535", "from": 1000, "to": 500},
+    ]
+    assert len(result["findings"]) == 2
+
+
+def test_open_ports_are_published_while_nmap_runs(nmap, monkeypatch):
+    live = []
+    lines = ["Discovered open port 22/tcp on 192.0.2.1", "Discovered open port 22/tcp on 192.0.2.1",
+             "Discovered open port 443/tcp on 192.0.2.1"]
+
+    async def run_process(cmd, timeout=300, on_stdout=None, **kwargs):
+        for line in lines:
+            on_stdout(line)
+        live.append([f["title"] for f in nmap._partial_findings["scan-1"]])
+        with open(cmd[cmd.index("-oX") + 1], "w") as f:
+            f.write(DETECTION_XML)
+        return ProcessResult(0, "\n".join(lines), "", False)
+
+    monkeypatch.setattr(nmap, "run_process", run_process)
+
+    result = asyncio.run(nmap.scan("192.0.2.1", {}))
+
+    assert live == [["Open Port: 22/tcp", "Open Port: 443/tcp"]]
+    assert [f["details"]["service"] for f in result["findings"]] == ["ssh", "https"]
+
+
+def test_dual_stack_targets_scan_both_families(nmap, monkeypatch):
+    ipv6_xml = """<?xml version="1.0"?>
+<nmaprun><host><address addr="2001:db8::1" addrtype="ipv6"/><ports>
+<port protocol="tcp" portid="8443"><state state="open"/><service name="https-alt"/></port>
+</ports></host></nmaprun>"""
+    commands = fake_nmap(nmap, monkeypatch, [DETECTION_XML, ipv6_xml])
+
+    result = asyncio.run(nmap.scan("example.com", {"addresses": ["192.0.2.1", "2001:db8::1"]}))
+
+    assert [(c[-1], "-6" in c) for c in commands] == [("192.0.2.1", False), ("2001:db8::1", True)]
+    assert sorted((f["details"]["ip"], f["details"]["port"]) for f in result["findings"]) == [
+        ("192.0.2.1", "22"), ("192.0.2.1", "443"), ("2001:db8::1", "8443"),
+    ]
+
+
+def test_time_budget_follows_profile_and_nmap_timeout(nmap, monkeypatch):
+    assert nmap.time_budget({"category": "white"}) == 1800
+    assert nmap.time_budget({"category": "black", "perf_profile": {"host_timeout": "10m"}}) == 600
+    assert nmap.time_budget({"perf_profile": "ludicrous"}) is None
+    monkeypatch.setattr(nmap_service, "NMAP_TIMEOUT", 3600)
+    assert [nmap.time_budget({"category": c}) for c in ("white", "gray", "black")] == [1800, 2700, 3600]
+
+    timeouts = []
+
+    async def run_process(cmd, timeout=300, on_stdout=None, **kwargs):
+        timeouts.append(timeout)
+        with open(cmd[cmd.index("-oX") + 1], "w") as f:
+            f.write(EMPTY_XML)
+        return ProcessResult(0, "", "", False)
+
+    monkeypatch.setattr(nmap, "run_process", run_process)
+    asyncio.run(nmap.scan("192.0.2.1", {"category": "white", "perf_profile": {"host_timeout": "2m"}}))
+
+    assert 119 < timeouts[0] <= 120
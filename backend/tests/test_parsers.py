@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+import main
+import parsers
+
+NMAP_XML = """<?xml version="1.0"?>
+<nmaprun><host><address addr="192.0.2.1" addrtype="ipv4"/><ports>
+<port protocol="tcp" portid="22"><state state="open"/><service name="ssh"/></port>
+<port protocol="tcp" portid="25"><state state="closed"/></port>
+</ports></host></nmaprun>"""
+
+
+def test_structured_findings_are_used_as_is():
+    raw = json.dumps({"findings": [{"title": "XSS", "severity": "high", "description": "reflected"}]})
+
+    assert parsers.parse_result("dalfox", raw) == [{
+        "id": "dalfox-0", "title": "XSS", "severity": "High",
+        "description": "reflected", "service": "dalfox",
+    }]
+
+
+def test_raw_output_goes_through_registered_parser():
+    nmap = parsers.parse_result("nmap_white", json.dumps({"raw_output": NMAP_XML}))
+    nuclei_lines = "\n".join([
+        json.dumps({"template-id": "cve-1", "info": {"name": "CVE-1", "severity": "critical"}}),
+        "not json",
+    ])
+    nuclei = parsers.parse_result("nuclei", json.dumps({"raw_output": nuclei_lines}))
+
+    assert [f["title"] for f in nmap] == ["Open Port: 22 (ssh)"]
+    assert [(f["title"], f["severity"]) for f in nuclei] == [("CVE-1", "Critical")]
+    assert parsers.parse_result("whatweb", json.dumps({"raw_output": "nginx"}))[0]["title"] == "Technology Detection"
+
+
+def test_results_endpoint_reads_stored_findings_and_falls_back(fake_async_redis, monkeypatch):
+    redis = fake_async_redis
+    monkeypatch.setattr(main, "redis_conn", redis)
+    redis.hashes["scan:new:findings"] = {
+        "nuclei": json.dumps([{"id": "nuclei-0", "title": "B"}]),
+        "nmap": json.dumps([{"id": "nmap-0", "title": "A"}]),
+    }
+    redis.values["scan:old:result:nmap"] = json.dumps({"raw_output": NMAP_XML})
+
+    assert [f["title"] for f in asyncio.run(main._build_scan_results("new"))["findings"]] == ["A", "B"]
+    assert asyncio.run(main._build_scan_results("old"))["findings"][0]["title"] == "Open Port: 22 (ssh)"
@@ -0,0 +1,21 @@
+import asyncio
+
+import pytest
+from redis.exceptions import ConnectionError
+
+import redis_pool
+
+
+def test_saturated_pool_counts_waits_and_timeouts():
+    client = redis_pool.create_client("redis://localhost:6379", max_connections=1)
+    pool = client.connection_pool
+    pool.timeout = 0.05
+    pool._in_use_connections.add(object())  # the only slot is taken
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(pool.get_connection("GET"))
+
+    stats = redis_pool.pool_stats(client)
+    assert stats["in_use"] == 1 and stats["max_connections"] == 1
+    assert stats["waited"] == 1 and stats["timeouts"] == 1
+    assert stats["avg_wait_ms"] >= 50
@@ -0,0 +1,49 @@
+import asyncio
+
+import engine
+import resolver
+
+
+class FakeCache:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+def test_split_target_handles_ports_and_ipv6():
+    assert engine._split_target("https://example.com:8443/path") == ("https://", "example.com", "8443")
+    assert engine._split_target("2001:db8::1") == ("http://", "2001:db8::1", None)
+    assert engine._split_target("[2001:db8::1]:8080") == ("http://", "2001:db8::1", "8080")
+    assert engine.is_ip("2001:db8::1") and not engine.is_ip("example.com")
+
+
+def test_resolve_target_collects_all_addresses(monkeypatch):
+    async def fake_resolve_host(name, cache=None):
+        return {"ipv4": ["192.0.2.1", "192.0.2.2"], "ipv6": ["2001:db8::1"]}
+
+    monkeypatch.setattr(resolver, "resolve_host", fake_resolve_host)
+    info = asyncio.run(engine.resolve_target_async("https://example.com:8443"))
+
+    assert info["ip"] == "192.0.2.1"
+    assert info["ips"] == ["192.0.2.1", "192.0.2.2", "2001:db8::1"]
+    assert info["url"] == "https://example.com:8443"
+
+
+def test_resolver_answers_are_cached(monkeypatch):
+    calls = []
+
+    async def lookup():
+        calls.append(1)
+        return ["192.0.2.1"], 300
+
+    cache = FakeCache()
+    first = asyncio.run(resolver._cached(cache, "dns:A:example.com", lookup))
+    second = asyncio.run(resolver._cached(cache, "dns:A:example.com", lookup))
+
+    assert first == second == ["192.0.2.1"]
+    assert len(calls) == 1
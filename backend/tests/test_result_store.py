@@ -0,0 +1,55 @@
+import json
+import os
+
+import result_store
+
+
+def test_small_payloads_are_stored_as_is():
+    content = json.dumps({"findings": [], "raw_output": "ok"})
+    assert result_store.encode_result("s1", "whatweb", content) == content
+    assert result_store.decode_result(content) == content
+
+
+def test_large_raw_output_is_spilled_and_compressed(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_BLOB_DIR", str(tmp_path))
+    monkeypatch.setattr(result_store, "RAW_OUTPUT_SPILL_BYTES", 1000)
+    raw_output = "80/tcp open http\n" * 5000
+    content = json.dumps({"findings": [{"title": "x"}], "raw_output": raw_output})
+
+    stored = result_store.encode_result("s1", "nmap", content)
+
+    assert stored.startswith("enc:") and len(stored) < len(content) // 10
+    payload = json.loads(result_store.decode_result(stored))
+    assert payload["raw_output"] == raw_output[:result_store.RAW_OUTPUT_PREVIEW_BYTES]
+    assert os.path.exists(tmp_path / "s1" / f"nmap.raw.{payload['raw_output_ref']['codec']}")
+    assert payload["raw_output_ref"]["size"] == len(raw_output)
+    assert payload["findings"] == [{"title": "x"}]
+
+    full = json.loads(result_store.decode_result(stored, load_raw=True))
+    assert full["raw_output"] == raw_output and "raw_output_ref" not in full
+
+
+def test_preview_is_cut_on_encoded_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_BLOB_DIR", str(tmp_path))
+    monkeypatch.setattr(result_store, "RAW_OUTPUT_SPILL_BYTES", 100)
+    monkeypatch.setattr(result_store, "RAW_OUTPUT_PREVIEW_BYTES", 11)
+    content = json.dumps({"raw_output": "ğüşçö" * 100})
+
+    payload = json.loads(result_store.decode_result(result_store.encode_result("s1", "nikto", content)))
+
+    # 11 bytes hold five two-byte characters; the half character is dropped
+    assert payload["raw_output"] == "ğüşçö"
+
+
+def test_blobs_are_deleted_with_their_scan(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_BLOB_DIR", str(tmp_path))
+    monkeypatch.setattr(result_store, "RAW_OUTPUT_SPILL_BYTES", 10)
+    for uid in ("archived", "running", "expired", "pruned"):
+        result_store.encode_result(uid, "nmap", json.dumps({"raw_output": "x" * 100}))
+
+    result_store.delete_blobs("pruned")
+    removed = result_store.prune_blobs(lambda uid: uid in ("archived", "running"))
+
+    assert removed == ["expired"]
+    assert sorted(os.listdir(tmp_path)) == ["archived", "running"]
+    assert result_store.prune_blobs(lambda uid: False, min_age=3600) == []
@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+class FakeAsyncRedis:
+    """Serves one XREAD batch, then reports the scan as finished"""
+
+    def __init__(self, batches, meta):
+        self.batches = list(batches)
+        self.meta = meta
+        self.reads = []
+
+    async def xread(self, streams, count, block):
+        self.reads.append(dict(streams))
+        return self.batches.pop(0) if self.batches else []
+
+    async def xrange(self, key, start, end):
+        return []
+
+    async def hgetall(self, key):
+        return self.meta
+
+
+def collect(redis, monkeypatch, log_id="0-0", update_id="0-0"):
+    monkeypatch.setattr(main, "stream_redis", redis)
+
+    async def run():
+        return [chunk async for chunk in main._scan_event_stream("s1", log_id, update_id)]
+
+    return asyncio.run(run())
+
+
+def test_stream_pushes_logs_and_updates_then_closes_on_completion(monkeypatch):
+    redis = FakeAsyncRedis([[
+        ("scan:s1:logstream", [("1-0", {"line": "[t] 🚀 Starting nmap"})]),
+        ("scan:s1:updates", [
+            ("1-0", {"type": "service", "data": json.dumps({"service": "nmap", "status": "running"})}),
+            ("2-0", {"type": "status", "data": json.dumps({"status": "completed"})}),
+        ]),
+    ]], meta={"status": "running"})
+
+    chunks = collect(redis, monkeypatch)
+
+    assert [c.split("\n")[0] for c in chunks] == ["event: log", "event: service", "event: status"]
+    assert chunks[0].split("\n")[2] == "id: 1-0|0-0"
+    assert chunks[-1].split("\n")[2] == "id: 1-0|2-0"
+
+
+def test_stream_resumes_from_cursor_and_ends_for_finished_scans(monkeypatch):
+    redis = FakeAsyncRedis([], meta={"status": "completed", "completed_at": "2026-07-28T10:05:00"})
+
+    chunks = collect(redis, monkeypatch, log_id="5-0", update_id="3-0")
+
+    assert redis.reads == [{"scan:s1:logstream": "5-0", "scan:s1:updates": "3-0"}]
+    assert chunks == [main._sse("status", {"status": "completed", "completed_at": "2026-07-28T10:05:00"})]
+
+
+def test_stream_is_unavailable_without_redis(monkeypatch):
+    monkeypatch.setattr(main, "stream_redis", None)
+
+    assert TestClient(main.app).get("/scan/s1/events").status_code == 503
+
+
+def test_malformed_last_event_id_is_rejected(monkeypatch):
+    monkeypatch.setattr(main, "stream_redis", FakeAsyncRedis([], meta={"status": "running"}))
+    client = TestClient(main.app)
+
+    for last_event_id in ("garbage", "5-0", "5-0|$", "1-0|2-0; rm"):
+        response = client.get("/scan/s1/events", headers={"Last-Event-ID": last_event_id})
+        assert response.status_code == 400
@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import main
+
+
+def add_scan(redis, uid, minutes_ago, user="u1", status="completed", category="black"):
+    started_at = (datetime(2026, 7, 28, 12, 0) - timedelta(minutes=minutes_ago)).isoformat()
+    redis.hashes[f"scan:{uid}:meta"] = {"target": f"{uid}.example.com", "category": category,
+                                        "status": status, "started_at": started_at}
+    main._index_scan(redis.pipeline(), uid, user, started_at)
+
+
+def test_scans_are_paged_newest_first(fake_async_redis, monkeypatch):
+    redis = fake_async_redis
+    for i in range(5):
+        add_scan(redis, f"s{i}", minutes_ago=i)
+    monkeypatch.setattr(main, "redis_conn", redis)
+
+    first = asyncio.run(main.list_scans(limit=2))
+    second = asyncio.run(main.list_scans(limit=2, cursor=first["next_cursor"]))
+    last = asyncio.run(main.list_scans(limit=2, cursor=second["next_cursor"]))
+
+    assert [s["scan_id"] for s in first["scans"]] == ["s0", "s1"]
+    assert [s["scan_id"] for s in second["scans"]] == ["s2", "s3"]
+    assert [s["scan_id"] for s in last["scans"]] == ["s4"]
+    assert last["next_cursor"] is None
+
+
+def test_filters_and_stale_entries(fake_async_redis, monkeypatch):
+    redis = fake_async_redis
+    add_scan(redis, "a", 1, user="u1", status="running")
+    add_scan(redis, "b", 2, user="u2", status="completed")
+    add_scan(redis, "c", 3, user="u1", status="completed", category="white")
+    add_scan(redis, "gone", 4, user="u1")
+    del redis.hashes["scan:gone:meta"]
+    monkeypatch.setattr(main, "redis_conn", redis)
+
+    assert [s["scan_id"] for s in asyncio.run(main.list_scans(user_id="u1"))["scans"]] == ["a", "c"]
+    assert [s["scan_id"] for s in asyncio.run(main.list_scans(status="completed"))["scans"]] == ["b", "c"]
+    assert [s["scan_id"] for s in asyncio.run(main.list_scans(category="white"))["scans"]] == ["c"]
+    assert "gone" not in redis.zsets["scans:index"]
+
+
+def test_archived_scans_stay_listed_after_redis_expiry(scan_archive, fake_async_redis, monkeypatch):
+    redis = fake_async_redis
+    add_scan(redis, "new", 1)
+    add_scan(redis, "old", 2)
+    scan_archive.get_archive().put("old", {"meta": redis.hashes.pop("scan:old:meta")})
+    monkeypatch.setattr(main, "redis_conn", redis)
+
+    listed = asyncio.run(main.list_scans())["scans"]
+
+    assert [(s["scan_id"], s["target"]) for s in listed] == [("new", "new.example.com"), ("old", "old.example.com")]
+    assert "old" in redis.zsets["scans:index"]
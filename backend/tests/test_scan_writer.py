@@ -0,0 +1,79 @@
+import asyncio
+
+import engine
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, command):
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+        return queue
+
+    async def execute(self):
+        self.redis.round_trips.append(self.commands)
+
+
+class FakeAsyncRedis:
+    def __init__(self):
+        self.round_trips = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+def test_writes_are_batched_and_ttls_refreshed(monkeypatch):
+    redis = FakeAsyncRedis()
+    monkeypatch.setattr(engine, "_get_async_redis", lambda: redis)
+
+    async def main():
+        writer = engine.ScanWriteBuffer("scan-1")
+        engine._scan_writers["scan-1"] = writer
+        try:
+            for i in range(20):
+                engine.log_scan("scan-1", f"line {i}")
+            engine._scan_write("scan-1", "set", "scan:scan-1:result:nmap", "{}")
+            await writer.flush()
+            engine.log_scan("scan-1", "after flush")
+            engine._scan_write("scan-1", "hset", "scan:scan-1:meta", mapping={"status": "completed"}, expire=False)
+            await writer.close()
+        finally:
+            engine._scan_writers.pop("scan-1", None)
+
+    asyncio.run(main())
+
+    assert len(redis.round_trips) == 2
+    first, second = redis.round_trips
+    assert [c for c, _, _ in first].count("xadd") == 20
+    assert [args for c, args, _ in first if c == "expire"] == [
+        ("scan:scan-1:logstream", engine.SCAN_TTL),
+        ("scan:scan-1:result:nmap", engine.SCAN_TTL),
+    ]
+    assert [c for c, _, _ in second] == ["xadd", "hset", "expire", "expire"]
+    assert second[1][2] == {"mapping": {"status": "completed"}}
+    # Closing refreshes every key the scan wrote, not just the latest ones
+    assert sorted(args for c, args, _ in second if c == "expire") == [
+        ("scan:scan-1:logstream", engine.SCAN_TTL),
+        ("scan:scan-1:result:nmap", engine.SCAN_TTL),
+    ]
+
+
+def test_idle_keys_are_refreshed_during_long_scans(monkeypatch):
+    redis = FakeAsyncRedis()
+    monkeypatch.setattr(engine, "_get_async_redis", lambda: redis)
+
+    async def main():
+        writer = engine.ScanWriteBuffer("scan-1", ttl=100)
+        writer.add("set", "scan:scan-1:result:nmap", "{}")
+        await writer.flush()
+        await writer.flush()  # nothing queued, refresh not due yet
+        writer._refreshed_at -= 30
+        await writer.flush()
+
+    asyncio.run(main())
+
+    assert len(redis.round_trips) == 2
+    assert redis.round_trips[1] == [("expire", ("scan:scan-1:result:nmap", 100), {})]
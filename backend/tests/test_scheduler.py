@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import pytest
+
+import engine
+from conftest import FakeRedis
+
+
+def run(graph, monkeypatch, durations, max_parallel=8, failing=(), redis=None):
+    redis = redis or FakeRedis()
+    events = []
+    active = 0
+    peak = 0
+
+    async def fake_call_service(service, target_info, uid, category):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        events.append(("start", service))
+        await asyncio.sleep(durations.get(service, 0.01))
+        events.append(("end", service))
+        active -= 1
+        return (service, service not in failing, None)
+
+    monkeypatch.setattr(engine, "call_service", fake_call_service)
+    monkeypatch.setattr(engine, "log_scan", lambda uid, message: None)
+    monkeypatch.setattr(engine, "redis_client", redis)
+    monkeypatch.setattr(engine, "MAX_PARALLEL_TOOLS", max_parallel)
+
+    results = asyncio.run(engine.run_all_services(graph, {}, "scan-1", "white"))
+    return results, events, peak
+
+
+def test_independent_tools_do_not_wait_for_slow_ones(monkeypatch):
+    graph = {"nikto": [], "nuclei": [], "whatweb": []}
+    _, events, _ = run(graph, monkeypatch, {"nikto": 0.2})
+
+    assert events.index(("end", "nuclei")) < events.index(("end", "nikto"))
+    assert [e for e in events[:3]] == [("start", "nuclei"), ("start", "nikto"), ("start", "whatweb")]
+
+
+def test_dependents_start_when_inputs_finish_even_if_failed(monkeypatch):
+    graph = {"nmap": [], "nikto": ["nmap"], "whatweb": []}
+    results, events, _ = run(graph, monkeypatch, {"nmap": 0.05}, failing={"nmap"})
+
+    assert events.index(("start", "nikto")) > events.index(("end", "nmap"))
+    assert [r[0] for r in results] == ["nmap", "nikto", "whatweb"]
+    assert results[0][1] is False
+
+
+def test_parallel_cap_and_cycles(monkeypatch):
+    graph = {"a": [], "b": [], "c": [], "x": ["y"], "y": ["x"]}
+    results, _, peak = run(graph, monkeypatch, {}, max_parallel=2)
+
+    assert peak == 2
+    assert results[3] == ("x", False, "Unresolvable dependencies")
+
+
+def test_service_states_are_recorded(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(engine, "_service_states", {})
+    run({"nmap": [], "x": ["y"], "y": ["x"]}, monkeypatch, {}, redis=redis)
+
+    states = {name: json.loads(state) for name, state in redis.hashes["scan:scan-1:services"].items()}
+    assert states["nmap"] == {"status": "pending", "depends_on": []}
+    assert states["x"]["status"] == "failed"
+    assert states["x"]["error"] == "Unresolvable dependencies"
+
+
+def test_every_profile_is_a_valid_graph():
+    for graph in engine.PROFILE_SERVICES.values():
+        for service, deps in graph.items():
+            assert service in engine.SERVICE_PORTS
+            assert all(dep in graph for dep in deps)
+            # A follower that depended on its source would wait for it after all
+            assert engine.ENDPOINT_SOURCE.get(service) not in deps
+
+
+def test_cancelled_scan_cancels_running_tools(monkeypatch):
+    cancelled = []
+
+    async def slow_call_service(service, target_info, uid, category):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(service)
+            raise
+
+    monkeypatch.setattr(engine, "call_service", slow_call_service)
+    monkeypatch.setattr(engine, "log_scan", lambda uid, message: None)
+    monkeypatch.setattr(engine, "redis_client", FakeRedis())
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(engine.run_all_services({"nmap": [], "dnsrecon": []}, {}, "scan-1", "white"), 0.05)
+        # Already cancelled and awaited when the scan coroutine returns
+        return sorted(cancelled)
+
+    assert asyncio.run(main()) == ["dnsrecon", "nmap"]
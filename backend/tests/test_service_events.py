@@ -0,0 +1,24 @@
+import asyncio
+import json
+
+import engine
+from conftest import FakePubSub
+
+
+def test_wait_for_event_skips_other_scans():
+    pubsub = FakePubSub([
+        {"data": json.dumps({"scan_id": "other", "status": "completed"})},
+        {"data": "not-json"},
+        {"data": json.dumps({"scan_id": "svc-1", "status": "failed", "message": "boom"})},
+    ])
+
+    event = asyncio.run(engine._wait_for_event(pubsub, "svc-1", 1))
+
+    assert event["status"] == "failed"
+    assert event["message"] == "boom"
+
+
+def test_wait_for_event_times_out_for_poll_fallback():
+    pubsub = FakePubSub([])
+
+    assert asyncio.run(engine._wait_for_event(pubsub, "svc-1", 0.05)) is None
@@ -0,0 +1,78 @@
+import asyncio
+
+import session_cache
+from session_cache import SessionCache
+
+
+def test_concurrent_lookups_are_coalesced_and_cached():
+    calls = []
+
+    async def fetch(token):
+        calls.append(token)
+        await asyncio.sleep(0.01)
+        return "user-1", True
+
+    async def main():
+        cache = SessionCache()
+        first = await asyncio.gather(*(cache.resolve("tok", fetch) for _ in range(5)))
+        again = await cache.resolve("tok", fetch)
+        return first, again
+
+    first, again = asyncio.run(main())
+    assert first == ["user-1"] * 5
+    assert again == "user-1"
+    assert calls == ["tok"]
+
+
+def test_invalid_tokens_are_negatively_cached_but_errors_are_not():
+    answers = {"bad": (None, True), "flaky": (None, False)}
+    calls = []
+
+    async def fetch(token):
+        calls.append(token)
+        return answers[token]
+
+    async def main():
+        cache = SessionCache()
+        for _ in range(2):
+            assert await cache.resolve("bad", fetch) is None
+            assert await cache.resolve("flaky", fetch) is None
+
+    asyncio.run(main())
+    assert calls == ["bad", "flaky", "flaky"]
+
+
+def test_shared_cache_stores_hashed_tokens_only(fake_async_redis):
+    redis = fake_async_redis
+
+    async def fetch(token):
+        return "user-1", True
+
+    async def never(token):
+        raise AssertionError("should be served from Redis")
+
+    asyncio.run(SessionCache(redis=redis).resolve("secret-token", fetch))
+    assert not any("secret-token" in key for key in redis.values)
+    assert asyncio.run(SessionCache(redis=redis).resolve("secret-token", never)) == "user-1"
+
+
+def test_shared_hits_expire_with_the_shared_entry(fake_async_redis, monkeypatch):
+    redis = fake_async_redis
+    now = [1000.0]
+    monkeypatch.setattr(session_cache.time, "monotonic", lambda: now[0])
+    calls = []
+
+    async def fetch(token):
+        calls.append(token)
+        return "user-1", True
+
+    asyncio.run(SessionCache(redis=redis, ttl=60).resolve("tok", fetch))
+    now[0] += 50
+    reader = SessionCache(redis=redis, ttl=60)
+    assert asyncio.run(reader.resolve("tok", fetch)) == "user-1"
+    assert calls == ["tok"]
+
+    # The shared entry had 10s left, so the local copy must not last the full 60s
+    now[0] += 11
+    asyncio.run(reader.resolve("tok", fetch))
+    assert calls == ["tok", "tok"]
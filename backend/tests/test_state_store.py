@@ -0,0 +1,70 @@
+import json
+
+import services.base.state_store as state_store
+from services.base.models import ScanStatus
+from services.base.state_store import MemoryStateStore, SQLiteStateStore
+from services.base.tool_service import BaseToolService
+
+
+def test_memory_store_evicts_finished_scans_first():
+    store = MemoryStateStore(ttl=3600, max_entries=2)
+    store.put("running", {"status": ScanStatus.RUNNING})
+    store.put("done", {"status": ScanStatus.COMPLETED})
+    store.put("new", {"status": ScanStatus.QUEUED})
+
+    assert "running" in store
+    assert "done" not in store
+    assert store.get("new")["status"] == "queued"
+
+
+def test_memory_store_expires_finished_scans(monkeypatch):
+    store = MemoryStateStore(ttl=10, max_entries=100)
+    store.put("done", {"status": ScanStatus.COMPLETED})
+    store.put("running", {"status": ScanStatus.RUNNING})
+
+    now = state_store.time.time()
+    monkeypatch.setattr(state_store.time, "time", lambda: now + 60)
+
+    assert store.get("done") is None
+    assert store.get("running")["status"] == "running"
+
+
+def test_sqlite_store_survives_restart_and_fails_interrupted_scans(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = SQLiteStateStore(ttl=3600, path=path)
+    store.put("a", {"status": ScanStatus.RUNNING, "target": "example.com"})
+    store.put("b", {"status": ScanStatus.COMPLETED})
+    store.update("b", message="ok")
+
+    restarted = SQLiteStateStore(ttl=3600, path=path)
+    restarted.recover_interrupted()
+
+    assert restarted.get("a")["status"] == "failed"
+    assert restarted.get("a")["target"] == "example.com"
+    assert restarted.get("b") == {"status": "completed", "message": "ok"}
+
+
+class DummyService(BaseToolService):
+    def __init__(self):
+        super().__init__(service_name="dummy")
+
+    async def scan(self, target, options):
+        return {}
+
+
+def test_unknown_scan_is_recovered_from_results_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULTS_DIR", str(tmp_path))
+    (tmp_path / "dummy").mkdir()
+    (tmp_path / "dummy" / "finished.json").write_text(json.dumps({"findings": []}))
+    (tmp_path / "dummy" / "broken.json").write_text(json.dumps({"error": "Scan failed: boom", "findings": []}))
+    # Same shared volume, written by another service
+    (tmp_path / "other").mkdir()
+    (tmp_path / "other" / "foreign.json").write_text(json.dumps({"findings": []}))
+    (tmp_path / "legacy.json").write_text(json.dumps({"findings": []}))
+    service = DummyService()
+
+    assert service._get_scan("finished")["status"] == ScanStatus.COMPLETED
+    assert service._get_scan("broken")["message"] == "Scan failed: boom"
+    assert service._get_scan("missing") is None
+    assert service._get_scan("foreign") is None
+    assert service._get_scan("legacy") is None
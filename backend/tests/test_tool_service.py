@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+import pytest
+
+from services.base.tool_service import BaseToolService, ToolTimeoutError
+
+
+class DummyService(BaseToolService):
+    def __init__(self):
+        super().__init__(service_name="dummy")
+
+    async def scan(self, target, options):
+        return {"findings": [], "raw_output": target, "metadata": {}}
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULTS_DIR", str(tmp_path / "results"))
+    return DummyService()
+
+
+def test_run_process_streams_lines(service):
+    lines = []
+    cmd = [sys.executable, "-c", "import sys; print('a'); print('b'); print('err', file=sys.stderr)"]
+
+    result = asyncio.run(service.run_process(cmd, timeout=10, on_stdout=lines.append))
+
+    assert result.returncode == 0
+    assert result.stdout == "a\nb\n"
+    assert result.stderr == "err\n"
+    assert lines == ["a", "b"]
+    assert not result.timed_out
+
+
+def test_run_process_kills_on_timeout_and_keeps_partial_output(service):
+    cmd = [sys.executable, "-u", "-c", "import time; print('partial'); time.sleep(30)"]
+
+    with pytest.raises(ToolTimeoutError) as raised:
+        asyncio.run(service.run_process(cmd, timeout=1))
+    result = asyncio.run(service.run_process(cmd, timeout=1, check_timeout=False))
+
+    for partial in (raised.value.result, result):
+        assert partial.timed_out
+        assert partial.stdout == "partial\n"
+        assert partial.returncode is not None
+
+
+def test_run_process_does_not_block_event_loop(service):
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.05)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await service.run_process([sys.executable, "-c", "import time; time.sleep(0.5)"])
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(main()) >= 5
+
+
+class BlockingService(BaseToolService):
+    def __init__(self):
+        super().__init__(service_name="blocking")
+        self.release = asyncio.Event()
+
+    async def scan(self, target, options):
+        self.add_partial_findings([{"severity": "info", "title": f"partial {target}", "description": ""}])
+        await self.release.wait()
+        return {"findings": [], "raw_output": target, "metadata": {}}
+
+
+def test_scan_queue_is_bounded_and_reports_position(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULTS_DIR", str(tmp_path / "results"))
+    monkeypatch.setenv("MAX_CONCURRENT_SCANS", "1")
+    monkeypatch.setenv("MAX_QUEUE_DEPTH", "1")
+    monkeypatch.setenv("QUEUE_RETRY_AFTER", "7")
+
+    async def main():
+        svc = BlockingService()
+        transport = httpx.ASGITransport(app=svc.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://svc") as client:
+            first = (await client.post("/scan", json={"target": "a"})).json()["scan_id"]
+            second = (await client.post("/scan", json={"target": "b"})).json()["scan_id"]
+            rejected = await client.post("/scan", json={"target": "c"})
+            await asyncio.sleep(0)
+
+            queued = (await client.get(f"/status/{second}")).json()
+            assert (await client.get(f"/status/{first}")).json()["status"] == "running"
+            partial = (await client.get(f"/results/{first}")).json()
+            assert partial["metadata"] == {"partial": True}
+            assert [f["title"] for f in partial["findings"]] == ["partial a"]
+
+            svc.release.set()
+            for _ in range(50):
+                await asyncio.sleep(0.01)
+                if (await client.get(f"/status/{second}")).json()["status"] == "completed":
+                    break
+            done = (await client.get(f"/status/{second}")).json()
+        return rejected, queued, done
+
+    rejected, queued, done = asyncio.run(main())
+
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "7"
+    assert queued["status"] == "queued"
+    assert queued["message"] == "Queued: position 1 of 1"
+    assert done["status"] == "completed"
+
+
+class WorkspaceService(BaseToolService):
+    def __init__(self):
+        super().__init__(service_name="workspace")
+        self.seen = []
+
+    async def scan(self, target, options):
+        with open(self.workspace_path("out.txt"), "w") as f:
+            f.write(target)
+        result = await self.run_process([sys.executable, "-c", "import os; print(os.getcwd())"])
+        self.seen.append((self.workspace, result.stdout.strip()))
+        self.report_progress(50, f"halfway {target}")
+        await asyncio.sleep(0.05)
+        with open(self.workspace_path("out.txt")) as f:
+            return {"findings": [], "raw_output": f.read(), "metadata": {}}
+
+
+def test_each_scan_gets_its_own_workspace(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULTS_DIR", str(tmp_path / "results"))
+    monkeypatch.setenv("SCAN_WORKSPACE_ROOT", str(tmp_path))
+    svc = WorkspaceService()
+
+    async def main():
+        for scan_id, target in (("s1", "one"), ("s2", "two")):
+            svc.scans.put(scan_id, {"status": "queued"})
+        await asyncio.gather(svc._execute_scan("s1", "one", {}), svc._execute_scan("s2", "two", {}))
+
+    asyncio.run(main())
+
+    (ws1, cwd1), (ws2, cwd2) = svc.seen
+    assert ws1 != ws2
+    assert (ws1, ws2) == (cwd1, cwd2)
+    assert not os.path.exists(ws1) and not os.path.exists(ws2)
+    for scan_id, target in (("s1", "one"), ("s2", "two")):
+        with open(tmp_path / "results" / "workspace" / f"{scan_id}.json") as f:
+            assert json.load(f)["raw_output"] == target
+        state = svc.scans.get(scan_id)
+        assert (state["progress"], state["message"]) == (50, f"halfway {target}")
+
+
+class SlowToolService(BaseToolService):
+    def __init__(self):
+        super().__init__(service_name="slow")
+
+    async def scan(self, target, options):
+        result = await self.run_process([sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.2)
+        return {"findings": [], "raw_output": result.stdout, "metadata": {}}
+
+
+def test_tool_timeout_fails_the_scan(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULTS_DIR", str(tmp_path / "results"))
+    svc = SlowToolService()
+    svc.scans.put("s1", {"status": "queued"})
+
+    asyncio.run(svc._execute_scan("s1", "example.com", {}))
+
+    state = svc.scans.get("s1")
+    assert state["status"] == "failed"
+    assert "timed out after 0.2s" in state["message"]
@@ -0,0 +1,243 @@
+import asyncio
+import time
+
+import pytest
+from rq.exceptions import DequeueTimeout
+
+import engine
+import worker
+
+TARGET_INFO = {"original": "example.com", "ip": "192.0.2.1", "ips": ["192.0.2.1"],
+               "fqdn": "example.com", "url": "http://example.com", "type": "fqdn"}
+
+
+class FakePipeline:
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def lrem(self, key, count, value):
+        self.log.append(("lrem", key, value))
+
+    def execute(self):
+        self.log.append(("execute",))
+
+
+class FakeConn:
+    def __init__(self):
+        self.log = []
+
+    def pipeline(self):
+        return FakePipeline(self.log)
+
+
+class FakeQueue:
+    """RQ queue over a plain list; dequeue_any pops from the shared `jobs`"""
+
+    jobs = []
+    requeued = []
+
+    def __init__(self, name, connection=None):
+        self.name = name
+        self.intermediate_queue_key = f"rq:queue:{name}:intermediate"
+
+    @classmethod
+    def dequeue_any(cls, queues, timeout, connection=None):
+        if not cls.jobs:
+            time.sleep(timeout)
+            raise DequeueTimeout(timeout, [q.name for q in queues])
+        return cls.jobs.pop(0), queues[0]
+
+    def enqueue_job(self, job, pipeline=None, at_front=False):
+        self.requeued.append((job.id, at_front))
+        job.status = "queued"
+
+
+class FakeRegistry:
+    started = {}
+
+    def __init__(self, name, connection=None):
+        self.name = name
+
+    def add(self, job, ttl, pipeline=None):
+        self.started[job.id] = ttl
+
+    def remove(self, job, pipeline=None):
+        self.started.pop(job.id, None)
+
+
+class FakeJob:
+    func_name = "engine.run_scan"
+    kwargs = {}
+
+    def __init__(self, job_id, timeout=None):
+        self.id = job_id
+        self.args = (job_id,)
+        self.timeout = timeout
+        self.status = "queued"
+        self.exc_info = None
+
+    def prepare_for_execution(self, worker_name, pipeline):
+        self.status = "started"
+
+    def set_status(self, status, pipeline=None):
+        self.status = status
+
+    def get_result_ttl(self, default_ttl):
+        return default_ttl
+
+    def _handle_success(self, result_ttl, pipeline):
+        self.status = "finished"
+
+    def _handle_failure(self, exc_string, pipeline):
+        self.exc_info = exc_string
+
+
+@pytest.fixture
+def rq(monkeypatch):
+    monkeypatch.setattr(worker, "conn", FakeConn())
+    monkeypatch.setattr(worker, "Queue", FakeQueue)
+    monkeypatch.setattr(worker, "StartedJobRegistry", FakeRegistry)
+    monkeypatch.setattr(worker, "DEQUEUE_TIMEOUT", 0.01)
+    monkeypatch.setattr(FakeQueue, "jobs", [])
+    monkeypatch.setattr(FakeQueue, "requeued", [])
+    monkeypatch.setattr(FakeRegistry, "started", {})
+    monkeypatch.setattr(worker, "ASYNC_JOBS", dict(worker.ASYNC_JOBS))
+    return FakeQueue
+
+
+def run_worker(jobs, scan, max_concurrent=2, stop_after=None):
+    """Run the worker until every job has ended (or `stop_after` seconds)"""
+    FakeQueue.jobs.extend(jobs)
+    worker.ASYNC_JOBS["engine.run_scan"] = scan
+
+    async def main():
+        scan_worker = worker.AsyncScanWorker(["default"], max_concurrent)
+        task = asyncio.create_task(scan_worker.work())
+        deadline = time.monotonic() + (stop_after or 5)
+        while time.monotonic() < deadline and (
+                FakeQueue.jobs or any(job.status in ("queued", "started") for job in jobs)):
+            await asyncio.sleep(0.01)
+        scan_worker.request_stop()
+        await task
+    asyncio.run(main())
+
+
+def test_jobs_run_concurrently_up_to_the_cap(rq):
+    active = peak = 0
+
+    async def scan(uid):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.03)
+        active -= 1
+        return uid
+
+    jobs = [FakeJob(f"job-{i}") for i in range(5)]
+    run_worker(jobs, scan, max_concurrent=2)
+
+    assert peak == 2
+    assert [job.status for job in jobs] == ["finished"] * 5
+    assert [job._result for job in jobs] == [job.id for job in jobs]
+    assert FakeRegistry.started == {}
+    assert worker.conn.log.count(("lrem", "rq:queue:default:intermediate", "job-0")) == 1
+
+
+def test_failed_job_is_recorded_with_its_traceback(rq):
+    async def scan(uid):
+        raise RuntimeError(f"Scan failed: {uid} unreachable")
+
+    job = FakeJob("job-1")
+    run_worker([job], scan)
+
+    assert job.status == "failed"
+    assert "RuntimeError: Scan failed: job-1 unreachable" in job.exc_info
+    assert FakeRegistry.started == {}
+
+
+def test_job_past_its_timeout_is_cancelled_and_failed(rq):
+    cancelled = []
+
+    async def scan(uid):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(uid)
+            raise
+
+    job = FakeJob("job-1", timeout=0.05)
+    run_worker([job], scan)
+
+    assert cancelled == ["job-1"]
+    assert job.status == "failed" and "TimeoutError" in job.exc_info
+    assert FakeRegistry.started == {}
+
+
+def test_shutdown_fails_running_jobs_after_the_grace_period(rq, monkeypatch):
+    monkeypatch.setattr(worker, "SHUTDOWN_GRACE", 0.05)
+    cancelled = []
+
+    async def scan(uid):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(uid)
+            raise
+
+    running, waiting = FakeJob("job-1"), FakeJob("job-2")
+    run_worker([running, waiting], scan, max_concurrent=1, stop_after=0.1)
+
+    assert cancelled == ["job-1"]
+    assert running.status == "failed" and "shut down" in running.exc_info
+    assert FakeRegistry.started == {}
+    # The job that never got a slot is still queued for the next worker
+    assert FakeQueue.jobs == [waiting] and waiting.status == "queued"
+
+
+def test_job_popped_during_shutdown_goes_back_to_the_queue(rq, monkeypatch):
+    popped = FakeJob("job-1")
+
+    def slow_dequeue(queues, timeout, connection=None):
+        time.sleep(0.05)  # the stop comes in meanwhile
+        return popped, queues[0]
+
+    monkeypatch.setattr(FakeQueue, "dequeue_any", staticmethod(slow_dequeue))
+
+    async def main():
+        scan_worker = worker.AsyncScanWorker(["default"], 2)
+        task = asyncio.create_task(scan_worker.work())
+        await asyncio.sleep(0.01)
+        scan_worker.request_stop()
+        await task
+    asyncio.run(main())
+
+    assert FakeQueue.requeued == [("job-1", True)]
+    assert popped.status == "queued" and FakeRegistry.started == {}
+
+
+def test_cancelled_scan_is_not_left_running(fake_redis, fake_async_redis, monkeypatch):
+    async def resolve(target, cache=None):
+        return TARGET_INFO
+
+    async def never_ends(graph, target_info, uid, category):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(engine, "redis_client", fake_redis)
+    monkeypatch.setattr(engine, "_get_async_redis", lambda: fake_async_redis)
+    monkeypatch.setattr(engine, "resolve_target_async", resolve)
+    monkeypatch.setattr(engine, "run_all_services", never_ends)
+    monkeypatch.setattr(engine, "log_scan", lambda uid, message: None)
+    updates = []
+    monkeypatch.setattr(engine, "publish_update", lambda uid, kind, **data: updates.append(data))
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(engine._run_scan_pipeline("example.com", "white", "scan-1", None), 0.05))
+
+    assert fake_redis.hashes["scan:scan-1:meta"]["status"] == "failed"
+    assert updates[-1] == {"status": "failed", "error": "Scan cancelled"}
@@ -1,7 +1,14 @@
 import os
+import asyncio
+import signal
+import socket
+import traceback
 import redis
 from rq import Worker, Queue, Connection
-from engine import run_scan
+from rq.exceptions import DequeueTimeout
+from rq.job import JobStatus
+from rq.registry import StartedJobRegistry
+from engine import run_scan, run_scan_async
 
 listen = ['default']
 redis_host = os.getenv("REDIS_HOST", "redis")
@@ -10,6 +17,19 @@ redis_url = os.getenv('REDIS_URL', f'redis://{redis_host}:6379')
 conn = redis.from_url(redis_url)
 q = Queue(connection=conn)
 
+# WORKER_MODE=async runs many scans concurrently on one event loop instead
+# of RQ's one-job-per-fork model (scans spend nearly all their time waiting
+# on HTTP, so a single process can drive many of them).
+WORKER_MODE = os.getenv("WORKER_MODE", "rq")
+MAX_CONCURRENT_SCANS = int(os.getenv("WORKER_MAX_CONCURRENT_SCANS", "10"))
+DEQUEUE_TIMEOUT = 5  # seconds per blocking pop, so shutdown stays responsive
+# Seconds running jobs get to finish after SIGTERM; keep it under the
+# container's stop timeout (docker's default is 10s)
+SHUTDOWN_GRACE = int(os.getenv("WORKER_SHUTDOWN_GRACE", "5"))
+
+# Jobs with a native coroutine; anything else is performed in a thread
+ASYNC_JOBS = {"engine.run_scan": run_scan_async}
+
 def queue_scan(target: str, category: str, uid: str) -> str:
     """Enqueue a scan job"""
     job = q.enqueue(
@@ -20,8 +40,129 @@ def queue_scan(target: str, category: str, uid: str) -> str:
     )
     return job.id
 
+
+class AsyncScanWorker:
+    """Pulls jobs from the RQ queues and runs them on a single event loop.
+
+    SIGTERM/SIGINT stop the pulling; running jobs get SHUTDOWN_GRACE seconds
+    to finish, then they are cancelled and recorded as failed.
+    """
+
+    def __init__(self, queue_names, max_concurrent: int):
+        self.queues = [Queue(name, connection=conn) for name in queue_names]
+        self.max_concurrent = max_concurrent
+        self.name = f"async-{socket.gethostname()}-{os.getpid()}"
+        self._tasks = set()
+        self._stopping = asyncio.Event()
+
+    def request_stop(self):
+        if not self._stopping.is_set():
+            print(f"Stopping: no new jobs, {len(self._tasks)} still running")
+            self._stopping.set()
+
+    async def work(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.request_stop)
+        try:
+            await self._pull()
+        finally:
+            await self._drain()
+
+    async def _pull(self):
+        while not self._stopping.is_set():
+            if len(self._tasks) >= self.max_concurrent:
+                # Every slot is busy: wait for a job to end (or for a stop)
+                stop = asyncio.ensure_future(self._stopping.wait())
+                await asyncio.wait({*self._tasks, stop}, return_when=asyncio.FIRST_COMPLETED)
+                stop.cancel()
+                continue
+            try:
+                result = await asyncio.to_thread(
+                    Queue.dequeue_any, self.queues, DEQUEUE_TIMEOUT, connection=conn
+                )
+            except DequeueTimeout:
+                result = None
+            except Exception as e:
+                print(f"Dequeue failed: {e}")
+                result = None
+                await asyncio.sleep(DEQUEUE_TIMEOUT)
+            if not result:
+                continue
+
+            job, queue = result
+            if self._stopping.is_set():
+                # Popped while the stop came in: leave it to the next worker
+                await asyncio.to_thread(self._requeue, job, queue)
+                return
+            task = asyncio.create_task(self._perform(job, queue))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self):
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=SHUTDOWN_GRACE)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _perform(self, job, queue):
+        registry = StartedJobRegistry(queue.name, connection=conn)
+        await asyncio.to_thread(self._mark_started, job, queue, registry)
+        print(f"Job {job.id} started ({len(self._tasks)}/{self.max_concurrent} running)")
+        try:
+            coro_fn = ASYNC_JOBS.get(job.func_name)
+            if coro_fn is not None:
+                coro = coro_fn(*job.args, **job.kwargs)
+            else:
+                coro = asyncio.to_thread(job.perform)
+            job._result = await asyncio.wait_for(coro, job.timeout or None)
+        except asyncio.CancelledError:
+            print(f"Job {job.id} cancelled by worker shutdown")
+            await asyncio.to_thread(self._mark_failed, job, registry, "Worker shut down during the job")
+            raise
+        except Exception:
+            exc_string = traceback.format_exc()
+            print(f"Job {job.id} failed:\n{exc_string}")
+            await asyncio.to_thread(self._mark_failed, job, registry, exc_string)
+        else:
+            await asyncio.to_thread(self._mark_finished, job, registry)
+
+    # RQ bookkeeping, mirroring what rq.Worker does around job.perform()
+    def _mark_started(self, job, queue, registry):
+        with conn.pipeline() as pipeline:
+            job.prepare_for_execution(self.name, pipeline)
+            registry.add(job, (job.timeout or 3600) + 60, pipeline=pipeline)
+            pipeline.lrem(queue.intermediate_queue_key, 1, job.id)
+            pipeline.execute()
+
+    def _mark_finished(self, job, registry):
+        with conn.pipeline() as pipeline:
+            registry.remove(job, pipeline=pipeline)
+            job._handle_success(job.get_result_ttl(86400), pipeline=pipeline)
+            pipeline.execute()
+
+    def _mark_failed(self, job, registry, exc_string):
+        with conn.pipeline() as pipeline:
+            job.set_status(JobStatus.FAILED, pipeline=pipeline)
+            registry.remove(job, pipeline=pipeline)
+            job._handle_failure(exc_string, pipeline=pipeline)
+            pipeline.execute()
+
+    def _requeue(self, job, queue):
+        with conn.pipeline() as pipeline:
+            queue.enqueue_job(job, pipeline=pipeline, at_front=True)
+            pipeline.lrem(queue.intermediate_queue_key, 1, job.id)
+            pipeline.execute()
+
+
 if __name__ == '__main__':
-    with Connection(conn):
-        worker = Worker(list(map(Queue, listen)))
-        print("Worker starting... listening on 'default' queue.")
-        worker.work()
+    if WORKER_MODE == "async":
+        print(f"Async worker starting... listening on {listen} (max {MAX_CONCURRENT_SCANS} scans).")
+        asyncio.run(AsyncScanWorker(listen, MAX_CONCURRENT_SCANS).work())
+    else:
+        with Connection(conn):
+            worker = Worker(list(map(Queue, listen)))
+            print("Worker starting... listening on 'default' queue.")
+            worker.work()
@@ -3,15 +3,24 @@ import React, { useState, useEffect } from 'react';
 function History() {
     const [scans, setScans] = useState([]);
     const [loading, setLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => { fetchScans(); }, []);
 
+    // /api/scans is paginated: pass next_cursor back as cursor for older scans
+    const fetchPage = async (cursor) => {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const res = await fetch(`/api/scans${query}`);
+        if (!res.ok) throw new Error("API call failed");
+        const data = await res.json();
+        setNextCursor(data.next_cursor || null);
+        return data.scans || [];
+    };
+
     const fetchScans = async () => {
         try {
-            const res = await fetch('/api/scans');
-            if (!res.ok) throw new Error("API call failed");
-            const data = await res.json();
-            setScans(data.scans || []);
+            setScans(await fetchPage(null));
         } catch (err) {
             console.error("Failed to fetch scans", err);
         } finally {
@@ -19,6 +28,19 @@ function History() {
         }
     };
 
+    const fetchMore = async () => {
+        if (!nextCursor || loadingMore) return;
+        setLoadingMore(true);
+        try {
+            const page = await fetchPage(nextCursor);
+            setScans(prev => [...prev, ...page]);
+        } catch (err) {
+            console.error("Failed to fetch scans", err);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const downloadReport = async (scanId, target) => {
         try {
             const res = await fetch(`/api/scan/${scanId}/results`);
@@ -117,6 +139,13 @@ function History() {
                         </tbody>
                     </table>
                 </div>
+                {nextCursor && (
+                    <div style={{ textAlign: 'center', padding: '1rem' }}>
+                        <button className="hbtn" onClick={fetchMore} disabled={loadingMore}>
+                            {loadingMore ? 'Yükleniyor...' : '↓ Daha fazla göster'}
+                        </button>
+                    </div>
+                )}
             </div>
         </>
     );